@@ -0,0 +1,237 @@
+"""
+Offline pipeline benchmark: synthetic audio, stand-in models and the local vector store, checked against a baseline
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+import numpy as np
+from config.config import Config
+from benchmarks.stand_ins import StandInModelManager
+from benchmarks.synthetic import write_corpus
+
+# Tier name -> (seconds per file, files)
+WARMUP_TIER = (5, 1)
+TIERS = {
+    "short": (10, 4),
+    "medium": (60, 2),
+    "long": (240, 1),
+}
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.25         # Allowed slowdown against the baseline before a stage counts as a regression
+MIN_COMPARED_SECONDS = 0.05      # Baseline timings below this are too noisy to compare
+
+# Repeatable runs: every stage computed, nothing in background threads (plots are
+# rendered inside the plotting stage rather than competing with the stages timed
+# after it), in-process sequential processing
+BENCHMARK_CONFIG = {
+    "STAGE_CACHE_ENABLED": False,
+    "PREWARM_MODELS": False,
+    "PLOT_MODE": "sync",
+    "METRICS_ENABLED": True,
+    "MILVUS_WRITE_MODE": "overwrite",
+}
+
+@contextmanager
+def config_overrides(values):
+    """Set Config attributes for the duration of the block"""
+    previous = {name: getattr(Config, name) for name in values}
+    for name, value in values.items():
+        setattr(Config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(Config, name, value)
+
+def calibrate(repeats=5):
+    """Best time of a fixed FFT and matrix workload, used to scale timings between machines"""
+    rng = np.random.default_rng(0)
+    signals = rng.standard_normal((256, 4096)).astype(np.float32)
+    matrix = rng.standard_normal((512, 512)).astype(np.float32)
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        np.fft.rfft(signals, axis=1)
+        matrix @ matrix
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def run_tier(name, duration, num_files, work_dir, seed=0):
+    """Process one tier's synthetic corpus end to end with the stand-in models
+    
+    Returns wall seconds for the whole run and per stage (from the run's
+    metrics), the audio seconds, failures and the rows in the vector store.
+    "other" is the run time outside the per-file stages: discovery, model
+    setup and the vector store and feature store flushes.
+    """
+    from core.audio_processor import AudioProcessor
+    from database.search_service import SpeakerSearchService
+    # Libraries load here rather than in the first tier's timings
+    import core.pipeline
+    import matplotlib.figure
+    
+    input_folder = os.path.join(work_dir, name, "input")
+    output_folder = os.path.join(work_dir, name, "output")
+    write_corpus(input_folder, name, duration, num_files, seed=seed)
+    
+    with config_overrides(BENCHMARK_CONFIG):
+        processor = AudioProcessor(input_folder, output_folder, auth_token="offline", vector_store_backend="local")
+        processor.model_manager = StandInModelManager()
+        processor.search_service = SpeakerSearchService(
+            processor.vector_store, processor.model_manager.get_embedding_inference
+        )
+        
+        started = time.perf_counter()
+        processor.process_all_audios(workers=1, embedding_batch_size=0, use_async=False)
+        wall_seconds = time.perf_counter() - started
+        
+        embedding_rows, logmel_rows = processor.vector_store.get_collection_stats()
+        processor.vector_store.close()
+    
+    metrics = processor.metrics
+    stages = {stage: totals["wall_seconds"] for stage, totals in metrics.stage_totals().items()}
+    stages["other"] = max(0.0, wall_seconds - sum(stages.values()))
+    return {
+        "files": num_files,
+        "audio_seconds": metrics.audio_seconds,
+        "failed": metrics.files["failed"],
+        "rows": {"embeddings": embedding_rows, "logmel": logmel_rows},
+        "wall_seconds": wall_seconds,
+        "stages": stages,
+    }
+
+def _fastest(runs):
+    """Per-timing minimum over repeated runs of a tier (counts come from the first run)"""
+    result = dict(runs[0])
+    result["wall_seconds"] = min(run["wall_seconds"] for run in runs)
+    result["stages"] = {
+        stage: min(run["stages"].get(stage, float("inf")) for run in runs) for stage in runs[0]["stages"]
+    }
+    return result
+
+def run_benchmarks(tiers=None, repeats=3, work_dir=None, verbose=False):
+    """Run the given tiers (default all of TIERS); returns a results dict for compare_to_baseline"""
+    tiers = tiers or list(TIERS)
+    own_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="audio-benchmark-")
+    
+    results = {
+        "calibration_seconds": calibrate(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "tiers": {},
+    }
+    def run(name, duration, num_files, tier_dir):
+        if verbose:
+            return run_tier(name, duration, num_files, tier_dir)
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            return run_tier(name, duration, num_files, tier_dir)
+    
+    try:
+        # One untimed file first, so FFT plans, model buffers and the plot renderer are set up
+        run("warmup", *WARMUP_TIER, os.path.join(work_dir, "warmup"))
+        
+        for name in tiers:
+            duration, num_files = TIERS[name]
+            runs = [
+                run(name, duration, num_files, os.path.join(work_dir, f"run{repeat}"))
+                for repeat in range(max(1, repeats))
+            ]
+            results["tiers"][name] = _fastest(runs)
+            print(f"⏱️ {name}: {num_files} x {duration}s in {results['tiers'][name]['wall_seconds']:.2f}s")
+    finally:
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare results with a baseline; returns (rows, regressions)
+    
+    Baseline timings are scaled by the ratio of the two calibration times, so
+    a baseline recorded on another machine stays usable. A timing regresses
+    when it exceeds the scaled baseline by more than `tolerance`. Failures and
+    vector store row counts must match exactly: the stand-in models are
+    deterministic, so a change there means the pipeline's behaviour changed.
+    Each row is (tier, timing, seconds, scaled baseline seconds or None).
+    """
+    scale = results["calibration_seconds"] / baseline["calibration_seconds"]
+    rows = []
+    regressions = []
+    for tier, result in results["tiers"].items():
+        base = baseline["tiers"].get(tier)
+        if base is None:
+            rows.append((tier, "total", result["wall_seconds"], None))
+            continue
+        
+        for field in ("failed", "rows"):
+            if result[field] != base[field]:
+                regressions.append(f"{tier}: {field} {result[field]} differs from baseline {base[field]}")
+        
+        timings = [("total", result["wall_seconds"], base["wall_seconds"])]
+        timings += [(stage, seconds, base["stages"].get(stage)) for stage, seconds in result["stages"].items()]
+        for timing, seconds, base_seconds in timings:
+            expected = base_seconds * scale if base_seconds is not None else None
+            rows.append((tier, timing, seconds, expected))
+            if expected is not None and expected >= MIN_COMPARED_SECONDS and seconds > expected * (1 + tolerance):
+                regressions.append(f"{tier}/{timing}: {seconds:.3f}s vs {expected:.3f}s baseline "
+                                   f"(+{seconds / expected - 1:.0%})")
+    return rows, regressions
+
+def print_comparison(rows, regressions):
+    """Print compare_to_baseline output"""
+    print(f"\n📊 Benchmark against baseline:")
+    print(f"   {'tier':<8}{'timing':<14}{'seconds':>10}{'baseline':>10}{'change':>9}")
+    for tier, timing, seconds, expected in rows:
+        change = f"{seconds / expected - 1:+.0%}" if expected else "-"
+        print(f"   {tier:<8}{timing:<14}{seconds:>10.3f}{'-' if expected is None else f'{expected:.3f}':>10}{change:>9}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regressions:")
+        for regression in regressions:
+            print(f"   {regression}")
+    else:
+        print(f"\n✅ No regressions")
+
+def main():
+    """Run the benchmark tiers and compare them with (or store them as) the baseline"""
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark with stand-in models")
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=list(TIERS))
+    parser.add_argument("--repeats", type=int, default=3, help="runs per tier; the fastest timings are kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--output", help="also write the results as JSON")
+    parser.add_argument("--work-dir", help="keep the synthetic corpus and outputs here")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = parser.parse_args()
+    
+    results = run_benchmarks(args.tiers, args.repeats, args.work_dir, args.verbose)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Baseline saved to: {args.baseline}")
+        return
+    
+    if not os.path.exists(args.baseline):
+        print(f"⚠️ Warning: No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows, regressions = compare_to_baseline(results, baseline, args.tolerance)
+    print_comparison(rows, regressions)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -14,18 +14,115 @@ class Config:
     FRAME_DURATION = 0.02
     AUDIO_PADDING = 0.1
     
+    # Batched VAD (0 = one forward pass over the whole signal)
+    VAD_BATCH_SIZE = 0
+    VAD_BATCH_MAX_SAMPLES = 16000 * 1200  # Padded samples per forward pass (memory budget)
+    VAD_CHUNK_DURATION = 60.0             # Long signals are split into chunks of this length (s)
+    # Chunking and padding change the model's context, so these are hashed like VAD_THRESHOLD
+    VAD_BATCH_PARAMS = ["VAD_BATCH_SIZE", "VAD_BATCH_MAX_SAMPLES", "VAD_CHUNK_DURATION"]
+    
+    # Pre-VAD gate (processing.vad.PreVadGate): frame energy and zero-crossing rate on the decoded
+    # audio, before denoising; long non-speech stretches are cut and files without speech-like
+    # activity skip denoising, VAD, diarization and embedding. Long-form files are gated block by
+    # block. It is not a music detector: music passes on to the VAD model like speech
+    PRE_VAD_ENABLED = True
+    PRE_VAD_FRAME_DURATION = 0.03           # Seconds per analysis frame
+    PRE_VAD_NOISE_PERCENTILE = 10           # Frame energy percentile taken as the noise floor
+    PRE_VAD_ENERGY_THRESHOLD_DB = 6.0       # Frames this far above the noise floor are active
+    PRE_VAD_ABSOLUTE_FLOOR_DB = -60.0       # Frames quieter than this (dBFS) are never active
+    PRE_VAD_UNVOICED_MARGIN_DB = 3.0        # Frames up to this far below the threshold are active
+    PRE_VAD_UNVOICED_ZCR = 0.25             # ... if their zero-crossing rate is this high (fricatives)
+    PRE_VAD_STATIONARY_WINDOW = 2.0         # Seconds over which frame energy must vary to count as speech
+    PRE_VAD_MIN_MODULATION_DB = 2.0         # Windows varying less (hum, tones, steady noise) are inactive
+    PRE_VAD_MIN_SILENCE = 1.0               # Seconds; only inactive stretches at least this long are cut
+    PRE_VAD_PADDING = 0.25                  # Seconds kept on both sides of active audio
+    PRE_VAD_MIN_ACTIVE_DURATION = 0.5       # Seconds; files with less active audio are rejected
+    PRE_VAD_PARAMS = [
+        "PRE_VAD_ENABLED", "PRE_VAD_FRAME_DURATION", "PRE_VAD_NOISE_PERCENTILE", "PRE_VAD_ENERGY_THRESHOLD_DB",
+        "PRE_VAD_ABSOLUTE_FLOOR_DB", "PRE_VAD_UNVOICED_MARGIN_DB", "PRE_VAD_UNVOICED_ZCR",
+        "PRE_VAD_STATIONARY_WINDOW", "PRE_VAD_MIN_MODULATION_DB", "PRE_VAD_MIN_SILENCE", "PRE_VAD_PADDING",
+        "PRE_VAD_MIN_ACTIVE_DURATION",
+    ]
+    
+    # Long-Form Processing (chunked, bounded-memory path for long recordings)
+    LONG_FORM_MIN_DURATION = 1800           # Seconds; longer files are processed in blocks (None = never)
+    LONG_FORM_BLOCK_DURATION = 300.0        # Seconds of audio denoised and VAD-processed at a time
+    LONG_FORM_CONTEXT_DURATION = 5.0        # Seconds of neighbouring audio on each side of a block
+    LONG_FORM_FEATURE_WINDOW = 60.0         # Seconds of speaker audio per embedding/log-mel window
+    
+    # Streaming Ingestion (core.streaming.StreamingSession)
+    STREAM_CHUNK_DURATION = 0.1             # Seconds per chunk read by iter_socket_chunks
+    STREAM_LOOKAHEAD = 0.2                  # Seconds of right context before a VAD frame is final
+    STREAM_VAD_CONTEXT = 1.0                # Seconds of left context re-fed to the VAD model
+    STREAM_MAX_SEGMENT_DURATION = 10.0      # Longer speech is cut so rows keep flowing
+    STREAM_EMBEDDING_WINDOW = 5.0           # Seconds of recent speech per speaker embedding
+    STREAM_LATENCY_BUDGET = 0.05            # Target processing time per chunk (s)
+    
+    # Parallel Processing
+    NUM_WORKERS = 1  # Worker processes for process_all_audios (1 = sequential)
+    
+    # Batched Speaker Embeddings (two-phase mode, 0 = one inference call per speaker)
+    EMBEDDING_BATCH_SIZE = 0
+    EMBEDDING_BATCH_FILES = 64              # Files segmented before each embedding phase
+    EMBEDDING_BATCH_MAX_SAMPLES = 16000 * 600  # Padded samples per batch (memory cap)
+    
+    # Audio Decoding (utils.audio_reader): soundfile block reads for WAV/FLAC/OGG/AIFF,
+    # one ffmpeg pipe to 16 kHz mono float32 for compressed formats
+    AUDIO_RESAMPLER = "balanced"            # "fast", "balanced" (librosa's default quality) or "high_quality"
+    AUDIO_READ_BLOCK_SIZE = 65536           # Frames per soundfile block read
+    FFMPEG_BINARY = "ffmpeg"                # Without it, compressed formats fall back to soundfile/audioread
+    AUDIO_DECODE_HISTORY = 10000            # Files whose decode times are kept for the report
+    
+    # Noise Reduction: "noisereduce" (library default), "spectral_gate" (vectorized float32
+    # re-implementation of the same gate) or "block_parallel" (spectral_gate over blocks on all cores)
+    DENOISE_BACKEND = "noisereduce"
+    DENOISE_BLOCK_DURATION = 30.0           # Seconds per block in block_parallel mode
+    DENOISE_BLOCK_OVERLAP = 0.5             # Seconds crossfaded between neighbouring blocks
+    DENOISE_BLOCK_CONTEXT = 4.0             # Seconds of neighbouring audio gated with each block, then dropped
+    DENOISE_BLOCK_WORKERS = 0               # Threads per process (0 = the process's share of the cores)
+    
+    # Asyncio stage pipeline (decode -> denoise -> inference -> store, bounded queues between stages)
+    ASYNC_PIPELINE = False
+    ASYNC_QUEUE_DEPTH = 2                   # Files waiting between two stages
+    ASYNC_IO_THREADS = 4                    # Threads for decoding, validation and file writes
+    ASYNC_DECODE_WORKERS = 2                # Files decoded concurrently
+    ASYNC_DENOISE_WORKERS = 2               # Denoising processes (0 = threads in the I/O pool)
+    ASYNC_STORE_WORKERS = 2                 # Files stored concurrently
+    
     # Plot Settings
     PLOT_DURATION_LIMIT = 30
     PLOT_DPI = 300
     PLOT_FIGSIZE = (14, 4)
+    PLOT_ENVELOPE_POINTS = 2000  # Min/max columns per plot (about one per horizontal pixel)
+    
+    # "background" renders plots in PLOT_WORKERS threads, "sync" renders inline,
+    # "lazy" only stores envelopes for utils.plotting.render_pending_plots, "off" skips plots
+    PLOT_MODE = "background"
+    PLOT_WORKERS = 1
     
     # Audio File Extensions
     AUDIO_EXTENSIONS = ['*.wav', '*.mp3', '*.flac', '*.m4a', '*.aac']
     
+    # Corpus Discovery (header-only probes, results kept in a manifest in the output folder)
+    DISCOVERY_WORKERS = 16                  # Threads probing file headers
+    AUDIO_MANIFEST_FILENAME = "audio_manifest.jsonl"
+    MIN_AUDIO_DURATION = 0.0                # Seconds; shorter files are not processed
+    MAX_AUDIO_DURATION = None               # Seconds; None = no limit
+    PROCESS_LONGEST_FIRST = False           # Order files by duration instead of path
+    
     # Model Settings
     VAD_MODEL_NAME = "nvidia/frame_vad_multilingual_marblenet_v2.0"
     DIARIZATION_MODEL_NAME = "pyannote/speaker-diarization@2.1"
     EMBEDDING_MODEL_NAME = "pyannote/embedding"
+    PREWARM_MODELS = True  # Models load on first use; process_all_audios starts loading them during discovery
+    
+    # Model server (python -m core.server); AudioProcessor forwards to it when MODEL_SERVER_URL is set
+    MODEL_SERVER_HOST = "127.0.0.1"
+    MODEL_SERVER_PORT = 8765
+    MODEL_SERVER_URL = None                 # e.g. "http://127.0.0.1:8765"
+    MODEL_SERVER_CONCURRENCY = 1            # Model requests running at once
+    MODEL_SERVER_MAX_QUEUE = 64             # Requests waiting beyond that; more get HTTP 503
+    MODEL_SERVER_TIMEOUT = 3600             # Client timeout in seconds (processing a file can take minutes)
     
     # Feature Extraction Parameters
     N_FFT = 512
@@ -36,14 +133,63 @@ class Config:
     F_MAX = 8000.0
     POWER = 2.0
     
+    # Parameters hashed into record ids; changing any of them re-ingests files
+    PIPELINE_FINGERPRINT_PARAMS = [
+        "SAMPLE_RATE", "AUDIO_RESAMPLER", "DENOISE_BACKEND", "DENOISE_BLOCK_DURATION", "DENOISE_BLOCK_OVERLAP",
+        "DENOISE_BLOCK_CONTEXT", "VAD_THRESHOLD", "MIN_SPEECH_DURATION", "FRAME_DURATION", "AUDIO_PADDING",
+        "VAD_MODEL_NAME", "DIARIZATION_MODEL_NAME", "EMBEDDING_MODEL_NAME",
+        "N_FFT", "WIN_LENGTH_RATIO", "HOP_LENGTH_RATIO", "N_MELS", "F_MIN", "F_MAX", "POWER",
+    ] + VAD_BATCH_PARAMS + PRE_VAD_PARAMS
+    
+    # Stage Cache Settings (resumable runs: unchanged stages are loaded instead of recomputed)
+    STAGE_CACHE_ENABLED = False
+    STAGE_CACHE_DIRNAME = ".stage_cache"            # Created inside the output folder
+    STAGE_CACHE_MAX_BYTES = 20 * 1024 ** 3          # Least recently used entries are evicted above this
+    
+    # Parameters hashed into each stage's cache key; a change invalidates that stage and later ones
+    STAGE_CACHE_PARAMS = {
+        "denoise": ["SAMPLE_RATE", "AUDIO_RESAMPLER", "DENOISE_BACKEND", "DENOISE_BLOCK_DURATION",
+                    "DENOISE_BLOCK_OVERLAP", "DENOISE_BLOCK_CONTEXT"] + PRE_VAD_PARAMS,
+        "vad": ["VAD_THRESHOLD", "MIN_SPEECH_DURATION", "FRAME_DURATION", "AUDIO_PADDING",
+                "VAD_MODEL_NAME"] + VAD_BATCH_PARAMS,
+        "diarization": ["DIARIZATION_MODEL_NAME"],
+        "embedding": ["EMBEDDING_MODEL_NAME"],
+        "logmel": ["SAMPLE_RATE", "N_FFT", "WIN_LENGTH_RATIO", "HOP_LENGTH_RATIO", "N_MELS", "F_MIN", "F_MAX", "POWER"],
+    }
+    
     # Embedding Dimensions
     EMBEDDING_DIM = 512  # Pyannote embedding dimension
     LOGMEL_DIM = 192     # Log-mel feature dimension (64*3)
     
+    # Vector Store Backend: "milvus" (Milvus server) or "local" (embedded index in the output folder)
+    VECTOR_STORE_BACKEND = "milvus"
+    
+    # Local Vector Store Settings
+    LOCAL_STORE_DIRNAME = "vector_store"
+    LOCAL_STORE_SHARD_ROWS = 65536           # Queued rows written as one memory-mapped shard
+    LOCAL_SEARCH_BLOCK_ROWS = 16384          # Rows scored per matrix multiply in exact search
+    LOCAL_INDEX_TYPE = "exact"               # "exact" or "ivf" (uses INDEX_PARAMS nlist / SEARCH_PARAMS nprobe)
+    LOCAL_IVF_MIN_ROWS = 10000               # Build the IVF index once a collection has this many rows
+    LOCAL_IVF_REBUILD_FRACTION = 0.2         # Rebuild when this fraction of rows is newer than the index
+    LOCAL_IVF_TRAIN_SIZE = 50000             # Rows sampled to train the IVF centroids
+    LOCAL_IVF_ITERATIONS = 10                # k-means iterations
+    
     # Milvus Settings
     DEFAULT_MILVUS_HOST = "localhost"
     DEFAULT_MILVUS_PORT = "19530"
     
+    # "overwrite" drops and recreates the collections on startup; "append" keeps
+    # them, upserts rows and skips files already stored under the current config
+    MILVUS_WRITE_MODE = "overwrite"
+    NO_SPEECH_SOURCES_FILENAME = "no_speech_sources.jsonl"  # Files that gave no speakers, skipped by "append" runs
+    
+    # Bulk Writer Settings for Milvus
+    MILVUS_FLUSH_ROWS = 1000                 # Insert once a collection buffers this many rows
+    MILVUS_FLUSH_BYTES = 16 * 1024 * 1024    # ... or this many bytes
+    MILVUS_FLUSH_INTERVAL = 5.0              # ... or rows have waited this many seconds
+    MILVUS_MAX_RETRIES = 5
+    MILVUS_RETRY_BACKOFF = 0.5               # Seconds, doubled after each failed attempt
+    
     # Index Parameters for Milvus
     INDEX_PARAMS = {
         "metric_type": "COSINE",
@@ -56,6 +202,9 @@ class Config:
         "metric_type": "COSINE", 
         "params": {"nprobe": 10}
     }
+    SEARCH_BATCH_SIZE = 1024                 # Query vectors per Milvus search call
+    SEARCH_EMBEDDING_BATCH_SIZE = 16         # Query audio files per embedding forward pass
+    SEARCH_EMBEDDING_CACHE_SIZE = 10000      # Query embeddings kept (LRU, keyed by audio content hash)
     
     # Collection Names
     EMBEDDING_COLLECTION_NAME = "speaker_embeddings"
@@ -67,7 +216,20 @@ class Config:
     VAD_AUDIO_FILENAME = "vad_audio.wav"
     DIARIZATION_RTTM_FILENAME = "diarization.rttm"
     FEATURES_JSON_FILENAME = "features.json"
-    ALL_FEATURES_JSON_FILENAME = "all_audio_features.json"
+    
+    # Feature Store Settings (all features of a run, in <output>/features)
+    FEATURE_STORE_DIRNAME = "features"
+    FEATURE_STORE_CHUNK_ROWS = 4096          # Rows per table buffered before a chunk is written
+    FEATURE_STORE_COMPRESS = False           # Compressed chunks are smaller but are read whole, not memory-mapped
+    
+    # Instrumentation (per-file stage timings of each process_all_audios run, in the output folder)
+    METRICS_ENABLED = True
+    METRICS_JSONL_FILENAME = "metrics.jsonl"      # One JSON line per file, appended across runs
+    METRICS_PROMETHEUS_FILENAME = "metrics.prom"  # Run totals in the Prometheus text format, rewritten per file
+    
+    # Write intermediate WAVs (original/denoised/VAD/speaker audio) as side outputs;
+    # stages always hand audio to each other in memory
+    SAVE_INTERMEDIATE_AUDIO = True
     
     # Plot Filenames
     ORIGINAL_PLOT_FILENAME = "01_original_waveform.png"
@@ -0,0 +1,237 @@
+"""
+Asyncio stage pipeline with bounded queues between decoding, denoising, inference and storage
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from tqdm import tqdm
+
+from config.config import Config
+from core.pipeline import segment_denoised_audio, extract_speaker_features, run_long_form_pipeline
+from processing.denoise import set_denoise_threads
+from processing.preprocessing import reduce_noise, save_preprocessing_outputs
+from processing.vad import trim_non_speech
+from processing.long_form import is_long_form
+from utils.audio import AudioBuffer
+from utils.audio_reader import read_audio
+from utils.metrics import FileMetrics, call_tracked
+from utils.utils import create_output_structure, get_audio_name, validate_audio_file
+
+# Marks the end of a stage's input
+_DONE = object()
+
+class FileJob:
+    """One audio file moving through the stages"""
+    
+    def __init__(self, audio_path):
+        self.audio_path = audio_path
+        self.audio_name = get_audio_name(audio_path)
+        self.audio_output_folder = None
+        self.long_form = False
+        self.samples = None
+        self.denoised_audio = None
+        self.cache_key = None
+        self.pending_writes = []
+        self.speaker_features = None
+        self.metrics = FileMetrics(audio_path)  # stages run in the executors, merged as they finish
+
+class AsyncAudioPipeline:
+    """Runs files through decode -> denoise -> inference -> store stages concurrently
+    
+    Stages are connected by asyncio queues holding at most
+    Config.ASYNC_QUEUE_DEPTH files, so a slow stage holds back the ones before
+    it and memory stays flat. Decoding and file writes run in a thread pool,
+    denoising in a process pool, model inference (VAD, diarization, embeddings)
+    in one dedicated thread, and storage (Milvus buffering plus the per-file
+    JSON) in the thread pool with several files in flight. The next files are
+    decoded and denoised while the current one is in inference.
+    """
+    
+    def __init__(self, model_manager, input_folder, output_folder, store_features, stage_cache=None):
+        self.model_manager = model_manager
+        self.input_folder = input_folder
+        self.output_folder = output_folder
+        self.store_features = store_features
+        self.stage_cache = stage_cache
+        
+        self.successful = 0
+        self.failed = 0
+        self._progress = None
+    
+    def run(self, audio_files):
+        """Process the files; returns (successful, failed)"""
+        return asyncio.run(self.run_async(audio_files))
+    
+    async def run_async(self, audio_files):
+        """Coroutine version of run()"""
+        self.successful = 0
+        self.failed = 0
+        
+        self._io_executor = ThreadPoolExecutor(Config.ASYNC_IO_THREADS, thread_name_prefix="pipeline-io")
+        self._inference_executor = ThreadPoolExecutor(1, thread_name_prefix="pipeline-inference")
+        self._denoise_executor = self._io_executor
+        if Config.ASYNC_DENOISE_WORKERS > 0:
+            # Denoise processes share the cores between them (block_parallel backend)
+            self._denoise_executor = ProcessPoolExecutor(
+                max_workers=Config.ASYNC_DENOISE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=set_denoise_threads,
+                initargs=(max(1, (os.cpu_count() or 1) // Config.ASYNC_DENOISE_WORKERS),)
+            )
+        
+        depth = Config.ASYNC_QUEUE_DEPTH
+        decode_queue = asyncio.Queue(depth)
+        denoise_queue = asyncio.Queue(depth)
+        inference_queue = asyncio.Queue(depth)
+        store_queue = asyncio.Queue(depth)
+        
+        self._progress = tqdm(total=len(audio_files), desc="Processing audio files")
+        try:
+            await asyncio.gather(
+                self._feed(audio_files, decode_queue),
+                self._run_stage(decode_queue, denoise_queue, self._decode, Config.ASYNC_DECODE_WORKERS),
+                self._run_stage(denoise_queue, inference_queue, self._denoise, max(1, Config.ASYNC_DENOISE_WORKERS)),
+                self._run_stage(inference_queue, store_queue, self._infer, 1),
+                self._run_stage(store_queue, None, self._store, Config.ASYNC_STORE_WORKERS),
+            )
+        finally:
+            self._progress.close()
+            for executor in {self._io_executor, self._inference_executor, self._denoise_executor}:
+                executor.shutdown()
+        
+        return self.successful, self.failed
+    
+    async def _feed(self, audio_files, queue):
+        """Put every file on the first queue, waiting whenever it is full"""
+        for audio_path in audio_files:
+            await queue.put(FileJob(audio_path))
+        await queue.put(_DONE)
+    
+    async def _run_stage(self, inbox, outbox, handler, workers):
+        """Run `workers` copies of a stage until its input is exhausted"""
+        async def worker():
+            while True:
+                job = await inbox.get()
+                if job is _DONE:
+                    await inbox.put(_DONE)  # let the sibling workers see it too
+                    return
+                try:
+                    job = await handler(job)
+                except Exception as e:
+                    self._report(False, f"❌ Error processing {job.audio_name}: {str(e)}")
+                    continue
+                if job is not None and outbox is not None:
+                    await outbox.put(job)
+        
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+        if outbox is not None:
+            await outbox.put(_DONE)
+    
+    def _report(self, success, message):
+        """Count and print the outcome of one file"""
+        tqdm.write(message)
+        if success:
+            self.successful += 1
+        else:
+            self.failed += 1
+        self._progress.update(1)
+    
+    async def _in_executor(self, executor, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    
+    async def _tracked(self, job, executor, stage_name, func, *args):
+        """func(*args) in `executor` as the job's `stage_name` stage (see utils.metrics.call_tracked)"""
+        result, record = await self._in_executor(executor, call_tracked, job.audio_path, stage_name, func, *args)
+        job.metrics.merge(record)
+        return result
+    
+    async def _decode(self, job):
+        """Stage 1: validate, create the output folder and decode (or load from the stage cache)"""
+        is_valid, message = await self._in_executor(self._io_executor, validate_audio_file, job.audio_path)
+        if not is_valid:
+            self._report(False, f"❌ {message}")
+            return None
+        
+        job.audio_output_folder = create_output_structure(job.audio_path, self.input_folder, self.output_folder)
+        job.long_form = await self._in_executor(self._io_executor, is_long_form, job.audio_path)
+        if job.long_form:
+            return job  # streamed from disk by the inference stage
+        
+        if self.stage_cache is not None:
+            file_key = await self._in_executor(self._io_executor, self.stage_cache.file_key, job.audio_path)
+            job.cache_key = self.stage_cache.stage_key(file_key, "denoise")
+            cached = await self._in_executor(self._io_executor, self.stage_cache.get, job.cache_key)
+            if cached is not None:
+                job.denoised_audio = AudioBuffer(
+                    cached["samples"], int(cached["sample_rate"]), path=job.audio_path, cache_key=job.cache_key
+                )
+                job.metrics.audio_seconds = job.denoised_audio.duration
+                return job
+        
+        job.samples = await self._tracked(job, self._io_executor, "decode", read_audio, job.audio_path)
+        job.metrics.audio_seconds = len(job.samples) / Config.SAMPLE_RATE
+        return job
+    
+    async def _denoise(self, job):
+        """Stage 2: noise reduction in the process pool; plots and WAVs are written in the background"""
+        if job.long_form or job.denoised_audio is not None:
+            return job
+        
+        sr = Config.SAMPLE_RATE
+        y, job.samples = job.samples, None
+        # Gated here rather than in the denoise pool, so the seconds saved are counted in this process
+        y_gated = await self._tracked(job, self._io_executor, "pre_vad", trim_non_speech, y, sr)
+        if len(y_gated) == 0:
+            job.denoised_audio = AudioBuffer(y_gated, sr, path=job.audio_path, cache_key=job.cache_key)
+            return job
+        y_denoised = await self._tracked(job, self._denoise_executor, "denoise", reduce_noise, y_gated, sr)
+        
+        # Side outputs do not hold up inference; the store stage waits for them
+        loop = asyncio.get_running_loop()
+        job.pending_writes.append(loop.run_in_executor(
+            self._io_executor, call_tracked, job.audio_path, "plotting",
+            save_preprocessing_outputs, y, y_denoised, sr, job.audio_output_folder
+        ))
+        if job.cache_key is not None:
+            job.pending_writes.append(loop.run_in_executor(
+                self._io_executor, call_tracked, job.audio_path, None,
+                self.stage_cache.put, job.cache_key, {"samples": y_denoised, "sample_rate": sr}
+            ))
+        
+        denoised_path = job.audio_path
+        if Config.SAVE_INTERMEDIATE_AUDIO:
+            denoised_path = os.path.join(job.audio_output_folder, Config.DENOISED_AUDIO_FILENAME)
+        job.denoised_audio = AudioBuffer(y_denoised, sr, path=denoised_path, cache_key=job.cache_key)
+        return job
+    
+    async def _infer(self, job):
+        """Stage 3: VAD, diarization and feature extraction on the inference thread"""
+        job.speaker_features = await self._tracked(job, self._inference_executor, None, self._run_models, job)
+        job.denoised_audio = None
+        return job
+    
+    def _run_models(self, job):
+        if job.long_form:
+            _, speaker_features = run_long_form_pipeline(
+                job.audio_path, self.input_folder, self.output_folder, self.model_manager
+            )
+            return speaker_features
+        
+        speaker_audio = segment_denoised_audio(
+            job.denoised_audio, job.audio_output_folder, self.model_manager, stage_cache=self.stage_cache
+        )
+        return extract_speaker_features(speaker_audio, job.audio_name, self.model_manager, self.stage_cache)
+    
+    async def _store(self, job):
+        """Stage 4: wait for side outputs, then insert rows and write the JSON in the thread pool"""
+        for _, record in await asyncio.gather(*job.pending_writes):
+            job.metrics.merge(record)
+        success, message = await self._in_executor(
+            self._io_executor, self.store_features,
+            job.audio_path, job.audio_output_folder, job.speaker_features, job.metrics.to_record()
+        )
+        self._report(success, message)
+        return None
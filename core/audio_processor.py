@@ -4,26 +4,38 @@ Main Audio Processor class that orchestrates the entire pipeline
 
 import os
 import json
-from datetime import datetime
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
 from tqdm import tqdm
 
 from config.config import Config
 from models.models import ModelManager
-from database.milvus_handler import MilvusHandler
-from processing.preprocessing import preprocess_audio
-from processing.vad import apply_vad
-from processing.diarization import perform_diarization
-from processing.feature_extraction import extract_speaker_embedding, extract_logmel_features
+from database.search_service import SpeakerSearchService
+from database.vector_store import create_vector_store
+from utils.audio_reader import get_audio_reader
+from utils.feature_store import FeatureWriter
+from utils.metrics import FileMetrics, RunMetrics, stage, track_file
+from utils.plotting import wait_for_plots
+from utils.stage_cache import StageCache
 from utils.utils import (
-    find_audio_files, create_output_structure, validate_audio_file, 
-    get_audio_name, print_processing_summary, print_collection_stats
+    find_audio_files, validate_audio_file, 
+    get_audio_name, get_source_hash, get_source_path, print_collection_stats
 )
 
+# The pipeline modules (core.pipeline, core.workers, core.streaming, processing.*)
+# pull in torch, librosa and noisereduce; they are imported by the methods that
+# run them, so search- and stats-only use of AudioProcessor starts quickly.
+
 class AudioProcessor:
     """Main Arabic-Audio-Preprocessing-and-Feature-Extraction orchestrator"""
     
+    # Memoized source hashes; a long-lived server turns this off
+    keep_run_state = True
+    
     def __init__(self, input_folder, output_folder, auth_token=None, 
-                 milvus_host=None, milvus_port=None):
+                 milvus_host=None, milvus_port=None, server_url=None, vector_store_backend=None):
         self.input_folder = input_folder
         self.output_folder = output_folder
         self.auth_token = auth_token or Config.get_huggingface_token()
@@ -31,22 +43,65 @@ class AudioProcessor:
         # Create output folder
         Config.create_output_dirs(output_folder)
         
-        # Initialize components
-        self.model_manager = ModelManager(self.auth_token)
-        self.milvus_handler = MilvusHandler(milvus_host, milvus_port)
+        # Initialize components; with a model server the models and vector store live there
+        self.client = None
+        self.model_manager = None
+        self.vector_store = None
+        self.search_service = None
+        server_url = server_url or Config.MODEL_SERVER_URL
+        if server_url:
+            from core.client import ModelServerClient
+            
+            self.client = ModelServerClient(server_url)
+            print(f"🔗 Forwarding to model server at {self.client.url}")
+        else:
+            self.model_manager = ModelManager(self.auth_token)
+            self.vector_store = create_vector_store(
+                vector_store_backend, output_folder, milvus_host, milvus_port
+            )
+            self.search_service = SpeakerSearchService(
+                self.vector_store, self.model_manager.get_embedding_inference
+            )
+        
+        # Columnar feature store of the current process_all_audios run
+        self.feature_writer = None
+        
+        # Stage metrics of the last process_all_audios run (None when Config.METRICS_ENABLED is off)
+        self.metrics = None
+        
+        # FileMetrics records of pool-processed files, waiting for their store stage
+        self._worker_records = {}
         
-        # Initialize lists for tracking processed data
-        self.all_embeddings = []
-        self.all_logmel_features = []
+        # Content hash per audio path, used for record ids and skipping
+        self._source_hashes = {}
+        self._no_speech_lock = threading.Lock()
+        
+        # Cached stage outputs make interrupted or re-tuned runs resume cheaply
+        self.stage_cache = None
+        if Config.STAGE_CACHE_ENABLED:
+            self.stage_cache = StageCache(os.path.join(output_folder, Config.STAGE_CACHE_DIRNAME))
     
-    def process_single_audio(self, audio_path):
-        """Process a single audio file through the complete pipeline"""
-        audio_name = get_audio_name(audio_path)
+    def process_single_audio(self, audio_path, input_folder=None, output_folder=None):
+        """Process a single audio file through the complete pipeline
         
-        # Create output folder maintaining input structure
-        audio_output_folder = create_output_structure(
-            audio_path, self.input_folder, self.output_folder
-        )
+        Outputs go under output_folder, mirroring the file's path relative to
+        input_folder (both default to the processor's folders).
+        """
+        input_folder = input_folder or self.input_folder
+        output_folder = output_folder or self.output_folder
+        
+        # Stages record their timings into this file's metrics during a process_all_audios run
+        with track_file(self.metrics, audio_path) as file_metrics:
+            success, message = self._run_single_audio(audio_path, input_folder, output_folder)
+            file_metrics.success = success
+        return success, message
+    
+    def _run_single_audio(self, audio_path, input_folder, output_folder):
+        """process_single_audio without the metrics tracking"""
+        if self.client is not None:
+            return self.client.process_single_audio(audio_path, input_folder, output_folder)
+        
+        audio_name = get_audio_name(audio_path)
         
         try:
             # Validate audio file
@@ -54,69 +109,161 @@ class AudioProcessor:
             if not is_valid:
                 return False, f"❌ {message}"
             
-            # Step 1: Preprocessing
-            denoised_path, _, _ = preprocess_audio(audio_path, audio_output_folder)
+            # Steps 1-4: Preprocessing, VAD, diarization and feature extraction
+            from core.pipeline import run_audio_pipeline
             
-            # Step 2: VAD
-            vad_path = apply_vad(
-                denoised_path, 
-                audio_output_folder, 
-                self.model_manager.get_vad_model(),
-                self.model_manager.get_device()
+            audio_output_folder, speaker_features = run_audio_pipeline(
+                audio_path, input_folder, output_folder, self.model_manager,
+                self.stage_cache
             )
             
-            # Step 3: Diarization
-            speaker_files, rttm_path = perform_diarization(
-                vad_path, 
-                audio_output_folder, 
-                self.model_manager.get_diarization_pipeline()
-            )
-            
-            # Step 4: Feature extraction and Milvus insertion for each speaker
-            audio_features = {"embeddings": [], "logmel": []}
-            
-            for speaker_id, speaker_file in speaker_files.items():
-                if os.path.exists(speaker_file) and os.path.getsize(speaker_file) > 0:
-                    # Extract speaker embeddings using native pyannote
-                    embedding_data = extract_speaker_embedding(
-                        speaker_file, 
-                        audio_name, 
-                        self.model_manager.get_embedding_inference(),
-                        speaker_id
-                    )
-                    
-                    # Extract log-mel features
-                    logmel_data = extract_logmel_features(
-                        speaker_file, audio_name, speaker_id
-                    )
-                    
-                    # Insert to Milvus
-                    if self.milvus_handler.insert_data(embedding_data, logmel_data):
-                        if embedding_data:
-                            audio_features["embeddings"].append(embedding_data)
-                            self.all_embeddings.append(embedding_data)
-                        if logmel_data:
-                            audio_features["logmel"].append(logmel_data)
-                            self.all_logmel_features.append(logmel_data)
-                else:
-                    print(f"⚠️ Warning: Speaker file {speaker_id} is empty or missing for {audio_name}")
-            
-            # Save individual audio features to JSON
-            if audio_features["embeddings"] or audio_features["logmel"]:
-                json_filename = f"{audio_name}_{Config.FEATURES_JSON_FILENAME}"
-                json_path = os.path.join(audio_output_folder, json_filename)
-                with open(json_path, 'w') as f:
-                    json.dump(audio_features, f, indent=2)
-            
-            return True, f"✅ Successfully processed: {audio_name}"
+            # Step 5: vector store insertion and JSON output
+            with stage("store"):
+                return self._store_audio_features(audio_path, audio_output_folder, speaker_features)
             
         except Exception as e:
             return False, f"❌ Error processing {audio_name}: {str(e)}"
     
-    def process_all_audios(self):
-        """Process all audio files in the input folder"""
+    def _store_audio_features(self, audio_path, audio_output_folder, speaker_features):
+        """Insert per-speaker features into the vector store and save the per-file JSON
+        
+        Rows get primary keys derived from the audio content, the speaker id and
+        the pipeline config, so re-ingesting a file replaces its rows. In append
+        mode, rows of the same file (its path relative to the input folder)
+        stored under an earlier content or config are deleted first. Files without speakers (rejected by the
+        pre-VAD gate) store no rows, so they are listed in
+        Config.NO_SPEECH_SOURCES_FILENAME instead.
+        """
+        from processing.feature_extraction import assign_record_id
+        
+        audio_name = get_audio_name(audio_path)
+        source_hash = self._get_source_hash(audio_path)
+        source_path = get_source_path(audio_path, self.input_folder)
+        audio_features = {"embeddings": [], "logmel": []}
+        
+        if self.vector_store.write_mode == "append":
+            if not self.vector_store.delete_stale_rows(source_path, source_hash):
+                return False, f"❌ Could not replace earlier features of: {audio_name}"
+        
+        for embedding_data, logmel_data in speaker_features:
+            for record in (embedding_data, logmel_data):
+                if record:
+                    assign_record_id(record, source_hash, source_path)
+            
+            # Insert into the vector store
+            if not self.vector_store.insert_data(embedding_data, logmel_data):
+                return False, f"❌ Could not store features for: {audio_name}"
+            if embedding_data:
+                audio_features["embeddings"].append(embedding_data)
+            if logmel_data:
+                audio_features["logmel"].append(logmel_data)
+            if self.feature_writer is not None:
+                self.feature_writer.add(embedding_data, logmel_data)
+        
+        if not speaker_features:
+            self._record_no_speech_source(audio_name, source_hash)
+        
+        # Save individual audio features to JSON
+        if audio_features["embeddings"] or audio_features["logmel"]:
+            json_filename = f"{audio_name}_{Config.FEATURES_JSON_FILENAME}"
+            json_path = os.path.join(audio_output_folder, json_filename)
+            with open(json_path, 'w') as f:
+                json.dump(audio_features, f, indent=2)
+        
+        return True, f"✅ Successfully processed: {audio_name}"
+    
+    def _store_tracked(self, audio_path, audio_output_folder, speaker_features, file_record=None):
+        """_store_audio_features recorded as the file's "store" stage
+        
+        Used where the other stages run in pool workers, executor threads or
+        two-phase groups; `file_record` is the FileMetrics record of those
+        stages, merged into the file's metrics.
+        """
+        with track_file(self.metrics, audio_path) as file_metrics:
+            if file_record is not None:
+                file_metrics.merge(file_record)
+            with stage("store"):
+                success, message = self._store_audio_features(audio_path, audio_output_folder, speaker_features)
+            file_metrics.success = success
+        return success, message
+    
+    def _get_source_hash(self, audio_path):
+        """Content + pipeline config hash of an audio file, computed once per run"""
+        if not self.keep_run_state:
+            return get_source_hash(audio_path)
+        if audio_path not in self._source_hashes:
+            self._source_hashes[audio_path] = get_source_hash(audio_path)
+        return self._source_hashes[audio_path]
+    
+    def _record_no_speech_source(self, audio_name, source_hash):
+        """Remember a file that gave no speakers, so append runs do not decode it again"""
+        path = os.path.join(self.output_folder, Config.NO_SPEECH_SOURCES_FILENAME)
+        with self._no_speech_lock:
+            with open(path, 'a') as f:
+                f.write(json.dumps({"audio_name": audio_name, "source_hash": source_hash}) + "\n")
+    
+    def _load_no_speech_sources(self):
+        """Source hashes recorded by _record_no_speech_source in earlier runs"""
+        path = os.path.join(self.output_folder, Config.NO_SPEECH_SOURCES_FILENAME)
+        if not os.path.exists(path):
+            return set()
+        source_hashes = set()
+        with open(path) as f:
+            for line in f:
+                try:
+                    source_hashes.add(json.loads(line)["source_hash"])
+                except (ValueError, KeyError):
+                    continue  # a line cut short by an interrupted run
+        return source_hashes
+    
+    def _skip_processed_files(self, audio_files):
+        """Drop files whose rows are already stored under the current config, or that had no speech"""
+        for audio_path in tqdm(audio_files, desc="Hashing audio files"):
+            self._get_source_hash(audio_path)
+        
+        processed = self.vector_store.get_processed_source_hashes(
+            [self._source_hashes[audio_path] for audio_path in audio_files]
+        )
+        processed |= self._load_no_speech_sources()
+        remaining = [
+            audio_path for audio_path in audio_files
+            if self._source_hashes[audio_path] not in processed
+        ]
+        
+        skipped = len(audio_files) - len(remaining)
+        if skipped:
+            print(f"⏭️ Skipping {skipped} files already in the vector store or without speech")
+        return remaining
+    
+    def process_all_audios(self, workers=None, embedding_batch_size=None, use_async=None):
+        """Process all audio files in the input folder
+        
+        With workers > 1 the per-file pipeline runs in a process pool; each worker
+        loads its own models once and the parent collects results, Milvus rows and
+        success/failure counts. With embedding_batch_size set, files are processed
+        in two phases: segmentation per file, then batched speaker embeddings
+        across files. With use_async (default Config.ASYNC_PIPELINE), files flow
+        through an asyncio stage pipeline that overlaps decoding, denoising,
+        model inference and storage of different files.
+        """
+        if workers is None:
+            workers = Config.NUM_WORKERS
+        if embedding_batch_size is None:
+            embedding_batch_size = Config.EMBEDDING_BATCH_SIZE
+        if use_async is None:
+            use_async = Config.ASYNC_PIPELINE
+        
+        # Load the models this process will use while files are discovered and hashed
+        if Config.PREWARM_MODELS and self.client is None:
+            models = self._models_used_here(workers, embedding_batch_size, use_async)
+            if models:
+                self.model_manager.prewarm(models)
+        
         # Find all audio files
-        audio_files = find_audio_files(self.input_folder)
+        audio_files = find_audio_files(
+            self.input_folder,
+            manifest_path=os.path.join(self.output_folder, Config.AUDIO_MANIFEST_FILENAME)
+        )
         
         if not audio_files:
             print("❌ No audio files found in the input folder!")
@@ -124,7 +271,77 @@ class AudioProcessor:
         
         print(f"🎵 Found {len(audio_files)} audio files to process")
         
+        # Per-file stage metrics (metrics.jsonl) and a Prometheus snapshot in the output folder
+        self.metrics = RunMetrics.for_output_folder(self.output_folder)
+        
+        # A model server processes the files one request at a time
+        if self.client is not None:
+            successful, failed = self._process_sequentially(audio_files)
+            self.client.flush()
+            self._print_summary(successful, failed, self.client.health()["vector_store"])
+            return
+        
+        # Incremental loads only process new or changed audio
+        if self.vector_store.write_mode == "append":
+            audio_files = self._skip_processed_files(audio_files)
+            if not audio_files:
+                print("✅ All audio files are already in the vector store")
+                return
+        
+        # Features are appended to the columnar store as files finish
+        self.feature_writer = FeatureWriter(
+            os.path.join(self.output_folder, Config.FEATURE_STORE_DIRNAME), self.vector_store.write_mode
+        )
+        
         # Process each audio file
+        try:
+            if use_async:
+                successful, failed = self._process_async(audio_files)
+            elif embedding_batch_size:
+                successful, failed = self._process_two_phase(audio_files, workers, embedding_batch_size)
+            elif workers > 1:
+                successful, failed = self._process_in_pool(audio_files, workers)
+            else:
+                successful, failed = self._process_sequentially(audio_files)
+        finally:
+            # Write the last feature chunks
+            self._close_feature_store()
+        
+        # Flush data to the vector store; rows lost in any flush of the run fail the run below
+        stored = self.vector_store.flush_collections()
+        
+        # Finish waveform plots still rendering in the background
+        wait_for_plots()
+        
+        # Decode times of the run, including those pool workers reported with their results
+        get_audio_reader().print_decode_report()
+        self._print_pre_vad_report()
+        
+        # Print summary and stage breakdown
+        self._print_summary(successful, failed, self.vector_store.describe())
+        
+        if not stored:
+            raise RuntimeError("Some features could not be written to the vector store; see the errors above")
+    
+    def _print_pre_vad_report(self):
+        """Audio the pre-VAD gate cut in this run, including what pool workers sent back"""
+        from processing.vad import get_pre_vad_gate
+        
+        get_pre_vad_gate().print_report()
+    
+    def _print_summary(self, successful, failed, store_description):
+        (self.metrics or RunMetrics()).print_summary(successful, failed, self.output_folder, store_description)
+    
+    def _models_used_here(self, workers, embedding_batch_size, use_async):
+        """Models this process runs itself (pool workers load their own)"""
+        if use_async or workers <= 1:
+            return ["vad", "diarization", "embedding"]
+        if embedding_batch_size:
+            return ["embedding"]
+        return []
+    
+    def _process_sequentially(self, audio_files):
+        """Process audio files one at a time in the current process"""
         successful = 0
         failed = 0
         
@@ -140,70 +357,276 @@ class AudioProcessor:
             else:
                 failed += 1
         
-        # Flush data to Milvus
-        self.milvus_handler.flush_collections()
+        return successful, failed
+    
+    def _process_async(self, audio_files):
+        """Process audio files through the asyncio stage pipeline"""
+        from core.async_pipeline import AsyncAudioPipeline
         
-        # Save combined features to JSON
-        self._save_combined_features()
+        print(f"🚀 Processing with the async stage pipeline "
+              f"({Config.ASYNC_DENOISE_WORKERS} denoise workers, queue depth {Config.ASYNC_QUEUE_DEPTH})")
         
-        # Print summary
-        print_processing_summary(
-            successful, failed, self.output_folder, 
-            self.milvus_handler.host, self.milvus_handler.port
+        pipeline = AsyncAudioPipeline(
+            self.model_manager, self.input_folder, self.output_folder,
+            self._store_tracked, stage_cache=self.stage_cache
         )
+        return pipeline.run(audio_files)
     
-    def _save_combined_features(self):
-        """Save all combined features to a single JSON file"""
-        if self.all_embeddings or self.all_logmel_features:
-            print("\n💾 Saving combined features...")
+    def _process_in_pool(self, audio_files, workers):
+        """Process audio files in a pool of worker processes"""
+        from core.workers import process_audio_in_worker
+        
+        successful = 0
+        failed = 0
+        
+        print(f"🚀 Processing with {workers} worker processes")
+        
+        with self._create_pool(workers) as executor:
+            futures = [
+                executor.submit(process_audio_in_worker, audio_path, self.input_folder, self.output_folder)
+                for audio_path in audio_files
+            ]
             
-            combined_data = {
-                "embeddings": self.all_embeddings,
-                "logmel_features": self.all_logmel_features,
-                "metadata": {
-                    "total_files": len(self.all_embeddings),
-                    "embedding_dimension": len(self.all_embeddings[0]["embedding_vector"]) if self.all_embeddings else 0,
-                    "logmel_dimension": len(self.all_logmel_features[0]["logmel_vector"]) if self.all_logmel_features else 0,
-                    "timestamp": datetime.now().isoformat()
-                }
-            }
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing audio files"):
+                audio_path, success, message, audio_output_folder, speaker_features = (
+                    self._merge_worker_result(future.result())
+                )
+                audio_name = get_audio_name(audio_path)
+                
+                if success:
+                    try:
+                        success, message = self._store_tracked(
+                            audio_path, audio_output_folder, speaker_features,
+                            self._worker_records.pop(audio_path, None)
+                        )
+                    except Exception as e:
+                        success, message = False, f"❌ Error processing {audio_name}: {str(e)}"
+                
+                tqdm.write(message)
+                
+                if success:
+                    successful += 1
+                else:
+                    failed += 1
+        
+        return successful, failed
+    
+    def _merge_worker_result(self, result):
+        """Add a pool worker's stats (see core.workers.collect_worker_stats) to this run's; returns the rest
+        
+        The worker's stage timings wait for _store_tracked, or are recorded
+        right away when the file failed in the worker.
+        """
+        from processing.vad import get_pre_vad_gate
+        
+        *result, worker_stats = result
+        audio_path, success = result[0], result[1]
+        get_audio_reader().merge_stats(worker_stats["decode"])
+        get_pre_vad_gate().merge_stats(worker_stats["pre_vad"])
+        if success:
+            self._worker_records[audio_path] = worker_stats["metrics"]
+        else:
+            self._record_failed_file(audio_path, worker_stats["metrics"])
+        return result
+    
+    @staticmethod
+    def _group_record(group_metrics, audio_path):
+        """FileMetrics record of one file of a two-phase group, None when metrics are off"""
+        return None if group_metrics is None else group_metrics[audio_path].to_record()
+    
+    def _record_failed_file(self, audio_path, file_record=None):
+        """Add a file that failed outside track_file to the run metrics, with its stage timings"""
+        with track_file(self.metrics, audio_path) as file_metrics:
+            if file_record is not None:
+                file_metrics.merge(file_record)
+            file_metrics.success = False
+    
+    def _create_pool(self, workers):
+        """Create a process pool whose workers each load the models once"""
+        from core.workers import init_worker, get_torch_threads
+        
+        # Spawn keeps CUDA and the model libraries safe in the child processes
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(
+                self.auth_token,
+                get_torch_threads(workers),
+                self.stage_cache.cache_dir if self.stage_cache is not None else None
+            )
+        )
+    
+    def _process_two_phase(self, audio_files, workers, embedding_batch_size):
+        """Segment groups of files, then embed all their speakers in batches
+        
+        Files are taken Config.EMBEDDING_BATCH_FILES at a time so only one group
+        of speaker waveforms is held in memory. Segmentation runs in a process
+        pool when workers > 1, otherwise here with VAD batched across the group;
+        embedding inference runs in this process. Long recordings are not
+        batched; they go through the block-wise long-form pipeline first. Each
+        file's stages, including its part of the shared batches, are collected
+        in a FileMetrics and recorded when it is stored.
+        """
+        from core.pipeline import segment_audio_group, extract_features_batched
+        from core.workers import segment_audio_in_worker
+        from processing.long_form import is_long_form
+        
+        successful = 0
+        failed = 0
+        group_size = max(1, Config.EMBEDDING_BATCH_FILES)
+        
+        long_files = {audio_path for audio_path in audio_files if is_long_form(audio_path)}
+        if long_files:
+            audio_files = [audio_path for audio_path in audio_files if audio_path not in long_files]
+            successful, failed = self._process_sequentially(sorted(long_files))
+            if not audio_files:
+                return successful, failed
+        
+        print(f"🚀 Two-phase processing with embedding batches of {embedding_batch_size}")
+        executor = self._create_pool(workers) if workers > 1 else None
+        
+        try:
+            progress = tqdm(total=len(audio_files), desc="Processing audio files")
             
-            combined_json_path = os.path.join(self.output_folder, Config.ALL_FEATURES_JSON_FILENAME)
-            with open(combined_json_path, 'w') as f:
-                json.dump(combined_data, f, indent=2)
+            for group_start in range(0, len(audio_files), group_size):
+                group = audio_files[group_start:group_start + group_size]
+                group_metrics = None
+                if self.metrics is not None:
+                    group_metrics = {audio_path: FileMetrics(audio_path) for audio_path in group}
+                
+                # Phase one: preprocessing, VAD and diarization
+                if executor is not None:
+                    results = map(self._merge_worker_result, executor.map(
+                        segment_audio_in_worker, group,
+                        repeat(self.input_folder), repeat(self.output_folder)
+                    ))
+                else:
+                    results = segment_audio_group(
+                        group, self.input_folder, self.output_folder, self.model_manager,
+                        self.stage_cache, group_metrics
+                    )
+                
+                segmented_files = []
+                for audio_path, success, message, audio_output_folder, speaker_audio in results:
+                    worker_record = self._worker_records.pop(audio_path, None)
+                    if success:
+                        if group_metrics is not None and worker_record is not None:
+                            group_metrics[audio_path].merge(worker_record)
+                        segmented_files.append((audio_path, audio_output_folder, speaker_audio))
+                    else:
+                        if executor is None:  # pool failures are recorded by _merge_worker_result
+                            self._record_failed_file(audio_path, self._group_record(group_metrics, audio_path))
+                        tqdm.write(message)
+                        failed += 1
+                        progress.update(1)
+                
+                # Phase two: batched embeddings, log-mel features and storage
+                try:
+                    extracted_files = extract_features_batched(
+                        segmented_files,
+                        self.model_manager.get_embedding_inference(),
+                        embedding_batch_size,
+                        self.stage_cache,
+                        group_metrics
+                    )
+                except Exception as e:
+                    for audio_path, _, _ in segmented_files:
+                        self._record_failed_file(audio_path, self._group_record(group_metrics, audio_path))
+                        tqdm.write(f"❌ Error processing {get_audio_name(audio_path)}: {str(e)}")
+                    failed += len(segmented_files)
+                    progress.update(len(segmented_files))
+                    continue
+                
+                for audio_path, audio_output_folder, speaker_features in extracted_files:
+                    audio_name = get_audio_name(audio_path)
+                    try:
+                        success, message = self._store_tracked(
+                            audio_path, audio_output_folder, speaker_features,
+                            self._group_record(group_metrics, audio_path)
+                        )
+                    except Exception as e:
+                        success, message = False, f"❌ Error processing {audio_name}: {str(e)}"
+                    
+                    tqdm.write(message)
+                    
+                    if success:
+                        successful += 1
+                    else:
+                        failed += 1
+                    progress.update(1)
             
-            print(f"✅ Combined features saved to: {combined_json_path}")
-            print(f"✅ Milvus collections: {Config.EMBEDDING_COLLECTION_NAME}, {Config.LOGMEL_COLLECTION_NAME}")
+            progress.close()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        return successful, failed
+    
+    def _close_feature_store(self):
+        """Flush the run's feature store and report its size"""
+        feature_writer, self.feature_writer = self.feature_writer, None
+        rows = feature_writer.close()
+        if any(rows.values()):
+            print(f"\n💾 Features saved to: {feature_writer.store_dir} "
+                  f"({rows['embeddings']} embeddings, {rows['logmel']} log-mel rows)")
+            print(f"✅ Vector store collections: {Config.EMBEDDING_COLLECTION_NAME}, {Config.LOGMEL_COLLECTION_NAME}")
+    
+    def open_stream(self, stream_name, sample_rate=None):
+        """Start a streaming session for live audio that reuses this processor's models and vector store"""
+        from core.streaming import StreamingSession
+        
+        if self.client is not None:
+            raise RuntimeError("Streaming runs on local models and is not forwarded to the model server")
+        return StreamingSession(self.model_manager, self.vector_store, stream_name, sample_rate)
+    
+    def extract_query_embedding(self, audio_path):
+        """Speaker embedding row for a query audio file"""
+        if self.client is not None:
+            return self.client.extract_embedding(audio_path)
+        
+        from processing.feature_extraction import extract_speaker_embedding
+        
+        return extract_speaker_embedding(
+            audio_path, get_audio_name(audio_path), self.model_manager.get_embedding_inference()
+        )
+    
+    def search_similar(self, query, top_k=5, audio_name=None, speaker_id=None, offset=0):
+        """Stored speakers closest to an audio file path or an embedding vector
+        
+        Returns a list of dicts with audio_name, speaker_id, audio_path and distance.
+        """
+        return self.search_similar_batch([query], top_k, audio_name, speaker_id, offset)[0]
+    
+    def search_similar_batch(self, queries, top_k=5, audio_name=None, speaker_id=None, offset=0):
+        """search_similar for many queries in one multi-vector search; one hit list per query
+        
+        Hits can be restricted to audio names / speaker ids (a value or a list)
+        and paged with offset. Audio queries are embedded once and cached.
+        """
+        if self.client is not None:
+            return self.client.search_batch(queries, top_k, audio_name, speaker_id, offset)
+        return self.search_service.search(queries, top_k, audio_name, speaker_id, offset)
     
     def demo_similarity_search(self, query_audio_path, top_k=5):
         """Demo function to search for similar speakers"""
         print(f"\n🔍 Searching for speakers similar to: {query_audio_path}")
         
-        # Extract embedding from query audio
-        audio_name = get_audio_name(query_audio_path)
-        embedding_data = extract_speaker_embedding(
-            query_audio_path, 
-            audio_name, 
-            self.model_manager.get_embedding_inference()
-        )
-        
-        if embedding_data:
-            # Search for similar speakers
-            results = self.milvus_handler.search_similar_speakers(
-                embedding_data["embedding_vector"], top_k
-            )
-            
-            if results:
-                print(f"🎯 Found {len(results[0])} similar speakers:")
-                for i, result in enumerate(results[0]):
-                    print(f"  {i+1}. Audio: {result.entity.get('audio_name')}")
-                    print(f"     Speaker: {result.entity.get('speaker_id')}")
-                    print(f"     Distance: {result.distance:.4f}")
-                    print(f"     Path: {result.entity.get('audio_path')}")
-                    print()
+        results = self.search_similar(query_audio_path, top_k)
+        if results:
+            print(f"🎯 Found {len(results)} similar speakers:")
+            for i, result in enumerate(results):
+                print(f"  {i+1}. Audio: {result['audio_name']}")
+                print(f"     Speaker: {result['speaker_id']}")
+                print(f"     Distance: {result['distance']:.4f}")
+                print(f"     Path: {result['audio_path']}")
+                print()
     
     def get_collection_stats(self):
-        """Get statistics about Milvus collections"""
-        embedding_count, logmel_count = self.milvus_handler.get_collection_stats()
+        """Get statistics about the vector store collections"""
+        if self.client is not None:
+            embedding_count, logmel_count = self.client.collection_stats()
+        else:
+            embedding_count, logmel_count = self.vector_store.get_collection_stats()
         print_collection_stats(embedding_count, logmel_count)
         return embedding_count, logmel_count
\ No newline at end of file
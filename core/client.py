@@ -0,0 +1,70 @@
+"""
+Thin HTTP client for the model server
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+from config.config import Config
+
+class ModelServerClient:
+    """Calls a running ModelServer; methods mirror its endpoints"""
+    
+    def __init__(self, url=None, timeout=None):
+        self.url = (url or Config.MODEL_SERVER_URL).rstrip("/")
+        self.timeout = timeout or Config.MODEL_SERVER_TIMEOUT
+    
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            self.url + path, data=data, method=method, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except (json.JSONDecodeError, AttributeError):
+                message = e.reason
+            raise RuntimeError(f"Model server error ({e.code}): {message}") from e
+    
+    def health(self):
+        """Server status, loaded models and uptime"""
+        return self._request("GET", "/health")
+    
+    def metrics(self):
+        """Request counts, errors, latencies and queue state"""
+        return self._request("GET", "/metrics")
+    
+    def collection_stats(self):
+        """(embedding_count, logmel_count) of the server's vector store collections"""
+        stats = self._request("GET", "/stats")
+        return stats["embedding_count"], stats["logmel_count"]
+    
+    def process_single_audio(self, audio_path, input_folder=None, output_folder=None):
+        """Run the full pipeline for one file on the server; returns (success, message)"""
+        result = self._request("POST", "/process", {
+            "audio_path": audio_path, "input_folder": input_folder, "output_folder": output_folder
+        })
+        return result["success"], result["message"]
+    
+    def extract_embedding(self, audio_path):
+        """Speaker embedding row for a file the server can read"""
+        return self._request("POST", "/embedding", {"audio_path": audio_path})
+    
+    def search(self, query, top_k=5, audio_name=None, speaker_id=None, offset=0):
+        """Most similar stored speakers for an audio path or an embedding vector"""
+        return self.search_batch([query], top_k, audio_name, speaker_id, offset)[0]
+    
+    def search_batch(self, queries, top_k=5, audio_name=None, speaker_id=None, offset=0):
+        """One hit list per query (audio paths and/or embedding vectors), searched together"""
+        return self._request("POST", "/search", {
+            "queries": [query if isinstance(query, str) else [float(value) for value in query] for query in queries],
+            "top_k": top_k, "audio_name": audio_name, "speaker_id": speaker_id, "offset": offset,
+        })["results"]
+    
+    def flush(self):
+        """Persist the server's buffered rows in its vector store"""
+        return self._request("POST", "/flush", {})["success"]
@@ -0,0 +1,490 @@
+"""
+Per-file processing pipeline shared by the sequential and parallel execution modes
+"""
+
+import traceback
+from contextlib import nullcontext
+import numpy as np
+import soundfile as sf
+from processing.preprocessing import preprocess_audio
+from processing.vad import apply_vad, compute_speech_probs_batched, extract_speech_audio
+from processing.diarization import diarize, save_rttm, build_speaker_audio
+from processing.feature_extraction import (
+    load_waveform, compute_embedding_vector, compute_logmel_vector,
+    build_embedding_record, build_logmel_record
+)
+from processing.batched_embedding import extract_embeddings_batched
+from processing.long_form import (
+    is_long_form, denoise_and_detect_speech, diarize_long_form, extract_long_form_features
+)
+from utils.audio import AudioBuffer, load_audio_buffer
+from utils.metrics import measure_file, record_audio_duration, shared_stage, stage
+from utils.utils import create_output_structure, get_audio_name, validate_audio_file
+from config.config import Config
+
+def _run_cached_stage(stage_cache, parent_key, stage, compute, encode, decode):
+    """Load a stage's outputs from the stage cache, or compute and store them
+    
+    Returns (value, cache_key). Without a cache or a parent key the stage is
+    just computed and the key is None. `encode` returns None for results that
+    should not be cached, such as partially failed extractions.
+    """
+    if stage_cache is None or parent_key is None:
+        return compute(), None
+    
+    cache_key = stage_cache.stage_key(parent_key, stage)
+    cached = stage_cache.get(cache_key)
+    if cached is not None:
+        return decode(cached), cache_key
+    
+    value = compute()
+    outputs = encode(value)
+    if outputs is not None:
+        stage_cache.put(cache_key, outputs)
+    return value, cache_key
+
+def _encode_diarization(result):
+    """Flatten speaker ranges and RTTM text into cacheable arrays"""
+    speaker_ranges, rttm_text = result
+    speakers = list(speaker_ranges)
+    empty = [np.zeros(0, dtype=np.int64)]
+    return {
+        "rttm": rttm_text,
+        "speakers": np.array(speakers, dtype=str),
+        "counts": np.array([len(speaker_ranges[speaker][0]) for speaker in speakers], dtype=np.int64),
+        "starts": np.concatenate([speaker_ranges[speaker][0] for speaker in speakers] + empty),
+        "ends": np.concatenate([speaker_ranges[speaker][1] for speaker in speakers] + empty),
+    }
+
+def _decode_diarization(cached):
+    """Inverse of _encode_diarization"""
+    boundaries = np.cumsum(cached["counts"])[:-1]
+    speaker_ranges = {
+        str(speaker): (starts, ends)
+        for speaker, starts, ends in zip(
+            cached["speakers"].tolist(),
+            np.split(cached["starts"], boundaries),
+            np.split(cached["ends"], boundaries)
+        )
+    }
+    return speaker_ranges, str(cached["rttm"])
+
+def _encode_vectors(speaker_ids, vectors):
+    """Stack per-speaker vectors for the cache; None if any speaker failed"""
+    if not speaker_ids or any(vectors.get(speaker_id) is None for speaker_id in speaker_ids):
+        return None
+    return {
+        "speakers": np.array(speaker_ids, dtype=str),
+        "vectors": np.stack([np.asarray(vectors[speaker_id]).flatten() for speaker_id in speaker_ids]),
+    }
+
+def _decode_vectors(cached):
+    """Inverse of _encode_vectors"""
+    return dict(zip(cached["speakers"].tolist(), cached["vectors"]))
+
+def denoise_audio(audio_path, input_folder, output_folder, stage_cache=None):
+    """Step 1 for one file: create its output folder and return the denoised audio"""
+    # Create output folder maintaining input structure
+    audio_output_folder = create_output_structure(audio_path, input_folder, output_folder)
+    file_key = stage_cache.file_key(audio_path) if stage_cache is not None else None
+    
+    def compute():
+        denoised_path, y_denoised, sr = preprocess_audio(audio_path, audio_output_folder)
+        return AudioBuffer(y_denoised, sr, path=denoised_path or audio_path)
+    
+    def load(cached):
+        # The decoded duration is not cached; the gated duration stands in for it
+        denoised_audio = AudioBuffer(cached["samples"], int(cached["sample_rate"]), path=audio_path)
+        record_audio_duration(denoised_audio.duration)
+        return denoised_audio
+    
+    denoised_audio, cache_key = _run_cached_stage(
+        stage_cache, file_key, "denoise", compute,
+        encode=lambda audio: {"samples": audio.samples, "sample_rate": audio.sample_rate},
+        decode=load
+    )
+    denoised_audio.cache_key = cache_key
+    
+    return audio_output_folder, denoised_audio
+
+def segment_denoised_audio(denoised_audio, audio_output_folder, model_manager, speech_probs=None,
+                           stage_cache=None):
+    """Steps 2-3 for one file: VAD and diarization of the denoised audio
+    
+    With a stage cache, cached VAD segments and diarization turns are applied
+    to the denoised samples instead of running the models; the RTTM file is
+    always rewritten. Audio the pre-VAD gate rejected has no speakers.
+    """
+    if len(denoised_audio) == 0:
+        return {}
+    
+    # Step 2: VAD
+    def run_vad():
+        _, vad_audio, segments = apply_vad(
+            denoised_audio,
+            audio_output_folder,
+            model_manager.get_vad_model(),
+            model_manager.get_device(),
+            speech_probs=speech_probs
+        )
+        return vad_audio, segments
+    
+    with stage("vad"):
+        (vad_audio, _), vad_key = _run_cached_stage(
+            stage_cache, denoised_audio.cache_key, "vad", run_vad,
+            encode=lambda result: {"segments": result[1]},
+            decode=lambda cached: (extract_speech_audio(denoised_audio, cached["segments"]), cached["segments"])
+        )
+    
+    # Step 3: Diarization
+    with stage("diarization"):
+        (speaker_ranges, rttm_text), diarization_key = _run_cached_stage(
+            stage_cache, vad_key, "diarization",
+            lambda: diarize(vad_audio, model_manager.get_diarization_pipeline()),
+            encode=_encode_diarization,
+            decode=_decode_diarization
+        )
+        
+        save_rttm(rttm_text, audio_output_folder)
+        speaker_audio = build_speaker_audio(vad_audio, speaker_ranges, audio_output_folder)
+    for speaker_buffer in speaker_audio.values():
+        speaker_buffer.cache_key = diarization_key
+    
+    return speaker_audio
+
+def segment_audio(audio_path, input_folder, output_folder, model_manager, stage_cache=None):
+    """Phase one: preprocessing, VAD and diarization for one audio file
+    
+    Returns the per-file output folder and a dictionary of speaker label ->
+    AudioBuffer ready for feature extraction.
+    """
+    audio_output_folder, denoised_audio = denoise_audio(
+        audio_path, input_folder, output_folder, stage_cache
+    )
+    speaker_audio = segment_denoised_audio(
+        denoised_audio, audio_output_folder, model_manager, stage_cache=stage_cache
+    )
+    return audio_output_folder, speaker_audio
+
+def _is_cached(stage_cache, parent_key, stage):
+    """Whether the stage cache already holds `stage` for `parent_key`"""
+    if stage_cache is None or parent_key is None:
+        return False
+    return stage_cache.contains(stage_cache.stage_key(parent_key, stage))
+
+def _measured(file_metrics, audio_path):
+    """measure_file for the file's entry in `file_metrics` (audio path -> FileMetrics), if tracked"""
+    if file_metrics is None:
+        return nullcontext()
+    return measure_file(file_metrics[audio_path])
+
+def _shares(file_metrics, weights):
+    """(FileMetrics, weight) pairs for shared_stage from {audio_path: weight}"""
+    if file_metrics is None:
+        return []
+    return [(file_metrics[audio_path], weight) for audio_path, weight in weights.items()]
+
+def segment_audio_group(audio_paths, input_folder, output_folder, model_manager, stage_cache=None,
+                        file_metrics=None):
+    """Phase one for a group of files with VAD batched across the group
+    
+    Each file is validated and denoised, the VAD model then runs once per
+    length-bucketed batch over all of them (Config.VAD_BATCH_SIZE), and each
+    file is diarized. Files whose VAD output is already in the stage cache are
+    left out of the VAD batches. Returns one (audio_path, success, message,
+    audio_output_folder, speaker_audio) tuple per file, in input order.
+    `file_metrics` maps each audio path to the FileMetrics its stages are
+    recorded in; a VAD batch is split between its files by samples.
+    """
+    results = {}
+    denoised_files = []
+    
+    for audio_path in audio_paths:
+        try:
+            with _measured(file_metrics, audio_path):
+                is_valid, message = validate_audio_file(audio_path)
+                if not is_valid:
+                    results[audio_path] = (audio_path, False, f"❌ {message}", None, None)
+                    continue
+                audio_output_folder, denoised_audio = denoise_audio(
+                    audio_path, input_folder, output_folder, stage_cache
+                )
+            denoised_files.append((audio_path, audio_output_folder, denoised_audio))
+        except Exception as e:
+            results[audio_path] = (
+                audio_path, False, f"❌ Error processing {get_audio_name(audio_path)}: {str(e)}", None, None
+            )
+    
+    # Batched VAD inference across the group
+    speech_probs = [None] * len(denoised_files)
+    pending = [
+        index for index, (_, _, denoised_audio) in enumerate(denoised_files)
+        if len(denoised_audio) > 0 and not _is_cached(stage_cache, denoised_audio.cache_key, "vad")
+    ]
+    if Config.VAD_BATCH_SIZE and pending:
+        samples = {denoised_files[index][0]: len(denoised_files[index][2]) for index in pending}
+        with shared_stage("vad", _shares(file_metrics, samples)):
+            batch_probs = compute_speech_probs_batched(
+                [denoised_files[index][2].samples for index in pending],
+                model_manager.get_vad_model(),
+                model_manager.get_device()
+            )
+        for index, probs in zip(pending, batch_probs):
+            speech_probs[index] = probs
+    
+    for (audio_path, audio_output_folder, denoised_audio), probs in zip(denoised_files, speech_probs):
+        try:
+            with _measured(file_metrics, audio_path):
+                speaker_audio = segment_denoised_audio(
+                    denoised_audio, audio_output_folder, model_manager,
+                    speech_probs=probs, stage_cache=stage_cache
+                )
+            results[audio_path] = (audio_path, True, None, audio_output_folder, speaker_audio)
+        except Exception as e:
+            results[audio_path] = (
+                audio_path, False, f"❌ Error processing {get_audio_name(audio_path)}: {str(e)}", None, None
+            )
+    
+    return [results[audio_path] for audio_path in audio_paths]
+
+def _load_speaker_audio(speaker_audio, audio_name):
+    """speaker_audio with file paths decoded to AudioBuffers, once for all feature stages
+    
+    Speakers whose file cannot be decoded are left out.
+    """
+    loaded = {}
+    for speaker_id, audio in speaker_audio.items():
+        try:
+            loaded[speaker_id] = load_audio_buffer(audio)
+        except Exception as e:
+            print(f"❌ Error loading speaker audio {speaker_id} of {audio_name}: {str(e)}")
+    return loaded
+
+def _speaker_ids(speaker_audio, audio_name):
+    """Speakers with audio to extract features from, warning about empty ones"""
+    speaker_ids = []
+    for speaker_id, speaker_buffer in speaker_audio.items():
+        if len(speaker_buffer) > 0:
+            speaker_ids.append(speaker_id)
+        else:
+            print(f"⚠️ Warning: Speaker audio {speaker_id} is empty for {audio_name}")
+    return speaker_ids
+
+def _parent_key(speaker_audio):
+    """Diarization cache key shared by the speaker buffers of one file"""
+    return next((speaker_buffer.cache_key for speaker_buffer in speaker_audio.values()), None)
+
+def _speaker_embeddings(speaker_audio, speaker_ids, audio_name, embedding_inference):
+    """Pyannote embedding per speaker, None where extraction fails"""
+    embeddings = {}
+    for speaker_id in speaker_ids:
+        try:
+            waveform, _ = load_waveform(speaker_audio[speaker_id])
+            embeddings[speaker_id] = compute_embedding_vector(waveform, embedding_inference)
+        except Exception as e:
+            print(f"❌ Error extracting pyannote embeddings for {audio_name}: {str(e)}")
+            traceback.print_exc()
+            embeddings[speaker_id] = None
+    return embeddings
+
+def _speaker_logmel_vectors(speaker_audio, speaker_ids, audio_name):
+    """Log-mel feature vector per speaker, None where extraction fails"""
+    logmel_vectors = {}
+    for speaker_id in speaker_ids:
+        try:
+            waveform, _ = load_waveform(speaker_audio[speaker_id])
+            logmel_vectors[speaker_id] = compute_logmel_vector(waveform)
+        except Exception as e:
+            print(f"❌ Error extracting log-mel features for {audio_name}: {str(e)}")
+            logmel_vectors[speaker_id] = None
+    return logmel_vectors
+
+def _cached_logmel_vectors(speaker_audio, speaker_ids, audio_name, stage_cache=None):
+    """Log-mel vectors of one file's speakers, loaded from the stage cache when possible"""
+    logmel_vectors, _ = _run_cached_stage(
+        stage_cache, _parent_key(speaker_audio), "logmel",
+        lambda: _speaker_logmel_vectors(speaker_audio, speaker_ids, audio_name),
+        encode=lambda vectors: _encode_vectors(speaker_ids, vectors),
+        decode=_decode_vectors
+    )
+    return logmel_vectors
+
+def _build_speaker_features(speaker_audio, speaker_ids, audio_name, embeddings, logmel_vectors):
+    """(embedding_data, logmel_data) rows per speaker from the computed vectors"""
+    speaker_features = []
+    for speaker_id in speaker_ids:
+        audio_path = speaker_audio[speaker_id].path or ""
+        
+        embedding_data = None
+        if embeddings.get(speaker_id) is not None:
+            embedding_data = build_embedding_record(
+                embeddings[speaker_id], audio_path, audio_name, speaker_id
+            )
+        logmel_data = None
+        if logmel_vectors.get(speaker_id) is not None:
+            logmel_data = build_logmel_record(
+                logmel_vectors[speaker_id], audio_path, audio_name, speaker_id
+            )
+        
+        speaker_features.append((embedding_data, logmel_data))
+    return speaker_features
+
+def extract_speaker_features(speaker_audio, audio_name, model_manager, stage_cache=None):
+    """Step 4 for one file: embedding and log-mel rows for each non-empty speaker
+    
+    Speakers given as file paths are decoded once for both extractors.
+    Returns a list of (embedding_data, logmel_data) tuples.
+    """
+    speaker_audio = _load_speaker_audio(speaker_audio, audio_name)
+    speaker_ids = _speaker_ids(speaker_audio, audio_name)
+    
+    with stage("embedding"):
+        embeddings, _ = _run_cached_stage(
+            stage_cache, _parent_key(speaker_audio), "embedding",
+            lambda: _speaker_embeddings(
+                speaker_audio, speaker_ids, audio_name, model_manager.get_embedding_inference()
+            ),
+            encode=lambda vectors: _encode_vectors(speaker_ids, vectors),
+            decode=_decode_vectors
+        )
+    with stage("logmel"):
+        logmel_vectors = _cached_logmel_vectors(speaker_audio, speaker_ids, audio_name, stage_cache)
+    
+    return _build_speaker_features(speaker_audio, speaker_ids, audio_name, embeddings, logmel_vectors)
+
+def run_audio_pipeline(audio_path, input_folder, output_folder, model_manager, stage_cache=None):
+    """Run preprocessing, VAD, diarization and feature extraction for one audio file
+    
+    Returns the per-file output folder and a list of (embedding_data, logmel_data)
+    tuples, one per speaker. Stages hand the waveform to each other in memory as
+    an AudioBuffer; WAV files are only side outputs. Nothing is written to Milvus
+    here so the function can run inside a worker process. With a stage cache,
+    every stage whose inputs and parameters are unchanged is loaded instead of
+    recomputed. Recordings longer than Config.LONG_FORM_MIN_DURATION go through
+    run_long_form_pipeline instead.
+    """
+    if is_long_form(audio_path):
+        return run_long_form_pipeline(audio_path, input_folder, output_folder, model_manager)
+    
+    audio_name = get_audio_name(audio_path)
+    
+    # Steps 1-3: Preprocessing, VAD and diarization
+    audio_output_folder, speaker_audio = segment_audio(
+        audio_path, input_folder, output_folder, model_manager, stage_cache
+    )
+    
+    # Step 4: Feature extraction for each speaker
+    speaker_features = extract_speaker_features(speaker_audio, audio_name, model_manager, stage_cache)
+    return audio_output_folder, speaker_features
+
+def run_long_form_pipeline(audio_path, input_folder, output_folder, model_manager):
+    """Run the pipeline for a long recording with memory bounded by the block size
+    
+    Audio is denoised and VAD-processed in overlapping blocks, and every stage
+    hands its output to the next through WAV files read incrementally rather
+    than in-memory buffers. Returns the same values as run_audio_pipeline; the
+    stage cache is not used for these files.
+    """
+    audio_name = get_audio_name(audio_path)
+    print(f"📼 Long-form processing in {Config.LONG_FORM_BLOCK_DURATION:.0f}s blocks: {audio_name}")
+    
+    # Create output folder maintaining input structure
+    audio_output_folder = create_output_structure(audio_path, input_folder, output_folder)
+    
+    record_audio_duration(sf.info(audio_path).duration)
+    
+    # Steps 1-2: Block-wise denoising and VAD (one stage, the blocks interleave them)
+    with stage("denoise_vad"):
+        vad_path, _ = denoise_and_detect_speech(
+            audio_path, audio_output_folder, model_manager.get_vad_model(), model_manager.get_device()
+        )
+    if vad_path is None:
+        return audio_output_folder, []  # rejected by the pre-VAD gate
+    
+    # Step 3: Diarization
+    with stage("diarization"):
+        speaker_paths, _ = diarize_long_form(
+            vad_path, audio_output_folder, model_manager.get_diarization_pipeline()
+        )
+    
+    # Step 4: Windowed feature extraction for each speaker
+    speaker_features = []
+    for speaker_id, speaker_path in speaker_paths.items():
+        with stage("features"):
+            embedding_data, logmel_data = extract_long_form_features(
+                speaker_path, audio_name, model_manager.get_embedding_inference(), speaker_id
+            )
+        if embedding_data is None:
+            print(f"⚠️ Warning: Speaker audio {speaker_id} is empty for {audio_name}")
+            continue
+        speaker_features.append((embedding_data, logmel_data))
+    
+    return audio_output_folder, speaker_features
+
+def extract_features_batched(segmented_files, embedding_inference, batch_size=None, stage_cache=None,
+                             file_metrics=None):
+    """Phase two: batched embeddings plus log-mel features for many segmented files
+    
+    `segmented_files` is a list of (audio_path, audio_output_folder, speaker_audio)
+    from segment_audio. Speaker waveforms from all files are embedded together
+    in length-bucketed batches and mapped back by (audio_path, speaker_id);
+    files whose embeddings are in the stage cache are left out of the batches.
+    Returns a list of (audio_path, audio_output_folder, speaker_features).
+    `file_metrics` is as for segment_audio_group; an embedding batch is split
+    between its files by speaker samples.
+    """
+    file_speakers = {}
+    loaded_files = []
+    cached_embeddings = {}
+    cache_keys = {}
+    items = []
+    batch_samples = {}
+    
+    for audio_path, audio_output_folder, speaker_audio in segmented_files:
+        with _measured(file_metrics, audio_path), stage("embedding"):
+            speaker_audio = _load_speaker_audio(speaker_audio, get_audio_name(audio_path))
+            loaded_files.append((audio_path, audio_output_folder, speaker_audio))
+            speaker_ids = _speaker_ids(speaker_audio, get_audio_name(audio_path))
+            file_speakers[audio_path] = speaker_ids
+            
+            parent_key = _parent_key(speaker_audio)
+            if stage_cache is not None and parent_key is not None and speaker_ids:
+                cache_keys[audio_path] = stage_cache.stage_key(parent_key, "embedding")
+                cached = stage_cache.get(cache_keys[audio_path])
+                if cached is not None:
+                    cached_embeddings[audio_path] = _decode_vectors(cached)
+                    continue
+        
+        items.extend(((audio_path, speaker_id), speaker_audio[speaker_id]) for speaker_id in speaker_ids)
+        batch_samples[audio_path] = sum(len(speaker_audio[speaker_id]) for speaker_id in speaker_ids)
+    
+    embeddings = {}
+    if items:
+        with shared_stage("embedding", _shares(file_metrics, batch_samples)):
+            embeddings = extract_embeddings_batched(items, embedding_inference, batch_size)
+    
+    results = []
+    for audio_path, audio_output_folder, speaker_audio in loaded_files:
+        audio_name = get_audio_name(audio_path)
+        speaker_ids = file_speakers[audio_path]
+        
+        with _measured(file_metrics, audio_path):
+            if audio_path in cached_embeddings:
+                speaker_embeddings = cached_embeddings[audio_path]
+            else:
+                speaker_embeddings = {
+                    speaker_id: embeddings.get((audio_path, speaker_id)) for speaker_id in speaker_ids
+                }
+                outputs = _encode_vectors(speaker_ids, speaker_embeddings)
+                if audio_path in cache_keys and outputs is not None:
+                    with stage("embedding"):
+                        stage_cache.put(cache_keys[audio_path], outputs)
+            
+            with stage("logmel"):
+                logmel_vectors = _cached_logmel_vectors(speaker_audio, speaker_ids, audio_name, stage_cache)
+            speaker_features = _build_speaker_features(
+                speaker_audio, speaker_ids, audio_name, speaker_embeddings, logmel_vectors
+            )
+        results.append((audio_path, audio_output_folder, speaker_features))
+    
+    return results
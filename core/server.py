@@ -0,0 +1,266 @@
+"""
+Long-lived model server: keeps the models warm and serves processing, embeddings and search over localhost HTTP
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config.config import Config
+from models.models import MODEL_NAMES
+
+class ServerBusy(Exception):
+    """Raised when the request queue is full"""
+
+class ModelServer:
+    """Serves one AudioProcessor's models to many short-lived clients
+    
+    Endpoints (JSON bodies and responses):
+      GET  /health   status, loaded models, uptime, vector store location
+      GET  /metrics  request counts, errors, latencies, active and queued requests
+      GET  /stats    vector store collection counts
+      POST /process  {"audio_path", "input_folder"?, "output_folder"?} -> {"success", "message"}
+      POST /embedding {"audio_path"} -> embedding row
+      POST /search   {"audio_path" | "embedding_vector" | "queries", "top_k"?, "audio_name"?,
+                      "speaker_id"?, "offset"?} -> {"results": hits, or one hit list per query}
+      POST /flush    persist buffered rows in the vector store
+    
+    Model work (/process, /embedding, /search) runs at most
+    `max_concurrency` requests at a time (default Config.MODEL_SERVER_CONCURRENCY,
+    1 because the models are not shared between threads); up to `max_queue`
+    more wait their turn and further requests get HTTP 503.
+    """
+    
+    def __init__(self, processor, host=None, port=None, max_concurrency=None, max_queue=None):
+        self.processor = processor
+        self.host = host or Config.MODEL_SERVER_HOST
+        self.port = Config.MODEL_SERVER_PORT if port is None else port
+        self.max_queue = Config.MODEL_SERVER_MAX_QUEUE if max_queue is None else max_queue
+        
+        # No memoized hashes: files may change between requests
+        self.processor.keep_run_state = False
+        
+        self._slots = threading.BoundedSemaphore(max_concurrency or Config.MODEL_SERVER_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._requests = {}
+        self._errors = {}
+        self._latency = {}
+        self._rejected = 0
+        self._started = time.time()
+        self._httpd = None
+        self._thread = None
+        
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/metrics"): self.metrics,
+            ("GET", "/stats"): self.stats,
+            ("POST", "/process"): self.process,
+            ("POST", "/embedding"): self.embedding,
+            ("POST", "/search"): self.search,
+            ("POST", "/flush"): self.flush,
+        }
+    
+    @property
+    def url(self):
+        """Base URL clients connect to"""
+        host, port = self._httpd.server_address[:2] if self._httpd else (self.host, self.port)
+        return f"http://{host}:{port}"
+    
+    def start(self, background=False, prewarm=True):
+        """Bind the socket and serve requests (in a daemon thread if `background`)"""
+        if prewarm:
+            self.processor.model_manager.prewarm()
+        
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        print(f"🚀 Model server listening on {self.url}")
+        
+        if background:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name="model-server", daemon=True)
+            self._thread.start()
+        else:
+            try:
+                self._httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self.stop()
+        return self
+    
+    def stop(self):
+        """Stop serving and persist buffered rows in the vector store"""
+        if self._httpd is None:
+            return
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        self._httpd = None
+        self.processor.vector_store.flush_collections()
+    
+    def handle(self, method, path, body):
+        """Dispatch one request; returns (HTTP status, JSON-serializable payload)"""
+        route = self.routes.get((method, path))
+        if route is None:
+            return 404, {"error": f"Unknown endpoint: {method} {path}"}
+        
+        started = time.perf_counter()
+        status = 200
+        try:
+            payload = route(body)
+        except ServerBusy as e:
+            status, payload = 503, {"error": str(e)}
+        except (KeyError, ValueError) as e:
+            status, payload = 400, {"error": f"Bad request: {str(e)}"}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+        
+        with self._lock:
+            self._requests[path] = self._requests.get(path, 0) + 1
+            self._latency[path] = self._latency.get(path, 0.0) + time.perf_counter() - started
+            if status != 200:
+                self._errors[path] = self._errors.get(path, 0) + 1
+        return status, payload
+    
+    def _run_model_task(self, func, *args):
+        """Run model work within the concurrency limit, queueing up to max_queue requests"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._queued >= self.max_queue:
+                    self._rejected += 1
+                    raise ServerBusy(f"Request queue is full ({self.max_queue} waiting)")
+                self._queued += 1
+            self._slots.acquire()
+            with self._lock:
+                self._queued -= 1
+        
+        with self._lock:
+            self._active += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+    
+    def health(self, body=None):
+        model_manager = self.processor.model_manager
+        return {
+            "status": "ok",
+            "models_loaded": {
+                name: getattr(model_manager, attribute) is not None
+                for name, attribute in zip(MODEL_NAMES, ("vad_model", "diarization_pipeline", "embedding_inference"))
+            },
+            "uptime": time.time() - self._started,
+            "vector_store": self.processor.vector_store.describe(),
+        }
+    
+    def metrics(self, body=None):
+        with self._lock:
+            return {
+                "requests": dict(self._requests),
+                "errors": dict(self._errors),
+                "latency_seconds": dict(self._latency),
+                "active": self._active,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "uptime": time.time() - self._started,
+            }
+    
+    def stats(self, body=None):
+        embedding_count, logmel_count = self.processor.vector_store.get_collection_stats()
+        return {"embedding_count": embedding_count, "logmel_count": logmel_count}
+    
+    def process(self, body):
+        success, message = self._run_model_task(
+            self.processor.process_single_audio,
+            body["audio_path"], body.get("input_folder"), body.get("output_folder")
+        )
+        # Make the rows visible before replying instead of waiting for the writer's thresholds
+        self.processor.vector_store.flush_pending()
+        return {"success": success, "message": message}
+    
+    def embedding(self, body):
+        embedding_data = self._run_model_task(self.processor.extract_query_embedding, body["audio_path"])
+        if embedding_data is None:
+            raise RuntimeError(f"Could not extract an embedding from {body['audio_path']}")
+        return embedding_data
+    
+    def search(self, body):
+        if "queries" in body:
+            queries = body["queries"]
+        elif "embedding_vector" in body:
+            queries = [body["embedding_vector"]]
+        else:
+            queries = [body["audio_path"]]
+        
+        args = (
+            queries, int(body.get("top_k", 5)), body.get("audio_name"), body.get("speaker_id"),
+            int(body.get("offset", 0))
+        )
+        if any(isinstance(query, str) for query in queries):
+            results = self._run_model_task(self.processor.search_similar_batch, *args)
+        else:
+            results = self.processor.search_similar_batch(*args)  # vectors only, no model needed
+        return {"results": results if "queries" in body else results[0]}
+    
+    def flush(self, body=None):
+        return {"success": self.processor.vector_store.flush_collections()}
+
+def _make_handler(server):
+    """BaseHTTPRequestHandler subclass bound to a ModelServer"""
+    class ModelRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self._respond(*server.handle("GET", self.path, {}))
+        
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as e:
+                self._respond(400, {"error": f"Invalid JSON: {str(e)}"})
+                return
+            self._respond(*server.handle("POST", self.path, body))
+        
+        def _respond(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def log_message(self, format, *args):
+            pass  # requests are counted in /metrics instead
+    
+    return ModelRequestHandler
+
+def main():
+    """Run the model server until interrupted"""
+    from core.audio_processor import AudioProcessor
+    
+    parser = argparse.ArgumentParser(description="Keep the audio models warm and serve them over localhost HTTP")
+    parser.add_argument("--input-folder", required=True)
+    parser.add_argument("--output-folder", required=True)
+    parser.add_argument("--host", default=os.getenv("MODEL_SERVER_HOST", Config.MODEL_SERVER_HOST))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MODEL_SERVER_PORT", Config.MODEL_SERVER_PORT)))
+    parser.add_argument("--concurrency", type=int, default=Config.MODEL_SERVER_CONCURRENCY)
+    parser.add_argument("--max-queue", type=int, default=Config.MODEL_SERVER_MAX_QUEUE)
+    args = parser.parse_args()
+    
+    processor = AudioProcessor(
+        args.input_folder, args.output_folder,
+        os.getenv('HUGGINGFACE_TOKEN', Config.get_huggingface_token()),
+        os.getenv('MILVUS_HOST', Config.DEFAULT_MILVUS_HOST),
+        os.getenv('MILVUS_PORT', Config.DEFAULT_MILVUS_PORT)
+    )
+    ModelServer(processor, args.host, args.port, args.concurrency, args.max_queue).start()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Streaming ingestion of live audio: incremental VAD, rolling speaker embeddings and low-latency vector store inserts
+"""
+
+import hashlib
+import time
+from datetime import datetime
+import numpy as np
+import soxr
+import torch
+
+from config.config import Config
+from processing.vad import compute_speech_probs_batched, detect_speech_segments
+from processing.feature_extraction import (
+    compute_embedding_vector, compute_logmel_vector,
+    build_embedding_record, build_logmel_record, assign_record_id
+)
+
+def pcm_to_float(chunk):
+    """Convert a PCM chunk (int16 bytes, int16 or float array, mono or (n, channels)) to mono float32"""
+    if isinstance(chunk, (bytes, bytearray, memoryview)):
+        chunk = np.frombuffer(chunk, dtype=np.int16)
+    
+    samples = np.asarray(chunk)
+    if np.issubdtype(samples.dtype, np.integer):
+        samples = samples.astype(np.float32) / np.iinfo(samples.dtype).max
+    else:
+        samples = samples.astype(np.float32, copy=False)
+    
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    return samples
+
+def iter_socket_chunks(sock, chunk_bytes=None):
+    """Yield raw PCM chunks from a connected socket until the peer closes it"""
+    if chunk_bytes is None:
+        chunk_bytes = 2 * int(Config.STREAM_CHUNK_DURATION * Config.SAMPLE_RATE)
+    
+    while True:
+        data = sock.recv(chunk_bytes)
+        if not data:
+            return
+        yield data
+
+class StreamingSession:
+    """Incrementally processes one live audio stream
+    
+    PCM chunks are resampled to Config.SAMPLE_RATE and run through the VAD
+    model with Config.STREAM_VAD_CONTEXT seconds of left context. Frames in the
+    last Config.STREAM_LOOKAHEAD seconds are held back until more audio
+    arrives, so every frame is classified with some right context. Speech
+    segments use the same thresholds, padding and merging as offline VAD and
+    are emitted as soon as no later speech can merge into them, or when they
+    reach Config.STREAM_MAX_SEGMENT_DURATION. Each emitted segment gets a
+    speaker embedding over the last Config.STREAM_EMBEDDING_WINDOW seconds of
+    speech and a log-mel vector of its own audio, and both rows are sent to
+    the vector store right away. Models come from the given ModelManager.
+    """
+    
+    def __init__(self, model_manager, vector_store, stream_name, sample_rate=None):
+        self.model_manager = model_manager
+        self.vector_store = vector_store
+        self.stream_name = stream_name
+        self.input_sample_rate = sample_rate or Config.SAMPLE_RATE
+        
+        self.sample_rate = Config.SAMPLE_RATE
+        self.frame_samples = int(round(Config.FRAME_DURATION * self.sample_rate))
+        self.lookahead_frames = int(round(Config.STREAM_LOOKAHEAD / Config.FRAME_DURATION))
+        self.context_frames = int(round(Config.STREAM_VAD_CONTEXT / Config.FRAME_DURATION))
+        
+        self._resampler = None
+        if self.input_sample_rate != self.sample_rate:
+            self._resampler = soxr.ResampleStream(self.input_sample_rate, self.sample_rate, 1, dtype='float32')
+        
+        # Audio since _buffer_start (absolute sample index) and finalized frame probabilities
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0
+        self._num_samples = 0
+        self._probs = np.zeros(0, dtype=np.float32)
+        self._probs_start = 0  # absolute frame index of _probs[0], where the next segment may begin
+        self._final_frames = 0
+        self._speech_history = np.zeros(0, dtype=np.float32)
+        self._num_segments = 0
+        self._closed = False
+        
+        # Rows of one session share a source hash, so each segment has its own id
+        session = f"{stream_name}:{datetime.now().isoformat()}"
+        self.source_hash = hashlib.sha256(session.encode('utf-8')).hexdigest()
+        
+        # Per-chunk processing latency in seconds
+        self.chunk_latencies = []
+    
+    def push(self, chunk):
+        """Process one PCM chunk; returns the speech segments it closed"""
+        if self._closed:
+            raise RuntimeError(f"Stream {self.stream_name} is closed")
+        
+        started = time.perf_counter()
+        samples = pcm_to_float(chunk)
+        if self._resampler is not None:
+            samples = self._resampler.resample_chunk(samples)
+        
+        self._buffer = np.concatenate([self._buffer, samples])
+        self._num_samples += len(samples)
+        
+        segments = self._advance(final=False)
+        
+        latency = time.perf_counter() - started
+        self.chunk_latencies.append(latency)
+        if latency > Config.STREAM_LATENCY_BUDGET:
+            print(f"⚠️ Warning: Chunk took {latency * 1000:.0f} ms, over the "
+                  f"{Config.STREAM_LATENCY_BUDGET * 1000:.0f} ms budget ({self.stream_name})")
+        return segments
+    
+    def close(self):
+        """Classify the remaining audio, emit the last segments and persist all rows in the vector store"""
+        if self._closed:
+            return []
+        
+        if self._resampler is not None:
+            tail = self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            self._buffer = np.concatenate([self._buffer, tail])
+            self._num_samples += len(tail)
+        
+        segments = self._advance(final=True)
+        self._closed = True
+        self.vector_store.flush_collections()
+        return segments
+    
+    def ingest(self, chunks):
+        """Push every chunk from an iterable (generator, socket reader, ...) and close the stream"""
+        segments = []
+        for chunk in chunks:
+            segments.extend(self.push(chunk))
+        segments.extend(self.close())
+        return segments
+    
+    def _advance(self, final):
+        """Run VAD over newly available frames and emit segments that can no longer change"""
+        if final:
+            available_frames = -(-self._num_samples // self.frame_samples)
+            ready_frames = available_frames
+        else:
+            available_frames = self._num_samples // self.frame_samples
+            ready_frames = available_frames - self.lookahead_frames
+        
+        if ready_frames > self._final_frames:
+            # Left context plus everything received, so held-back frames see their lookahead
+            window_start = max(0, self._final_frames - self.context_frames)
+            window = self._samples(window_start * self.frame_samples, available_frames * self.frame_samples)
+            
+            probs = compute_speech_probs_batched(
+                [window], self.model_manager.get_vad_model(), self.model_manager.get_device(), batch_size=1
+            )[0]
+            new_probs = probs[self._final_frames - window_start:ready_frames - window_start]
+            self._probs = np.concatenate([self._probs, new_probs])
+            self._final_frames += len(new_probs)
+        
+        segments = self._close_segments(final)
+        self._trim_buffer()
+        return segments
+    
+    def _close_segments(self, final):
+        """Emit segments that later audio can neither extend nor merge with"""
+        frame_duration = Config.FRAME_DURATION
+        padding = Config.AUDIO_PADDING
+        offset = self._probs_start * frame_duration
+        final_time = self._final_frames * frame_duration
+        
+        segments = detect_speech_segments(
+            self._probs, max_duration=(self._num_samples / self.sample_rate - offset) if final else None
+        )
+        segments["start"] += offset
+        segments["end"] += offset
+        
+        emitted = []
+        next_start = None
+        for start, end in zip(segments["start"], segments["end"]):
+            if final or end < final_time - padding:
+                emitted.append(self._emit_segment(start, end))
+                next_start = int(round((end - padding) / frame_duration))
+            elif final_time - start >= Config.STREAM_MAX_SEGMENT_DURATION:
+                # Cut very long speech so rows keep flowing
+                emitted.append(self._emit_segment(start, final_time))
+                next_start = self._final_frames
+                break
+            else:
+                break
+        
+        if final:
+            next_start = self._final_frames
+        elif len(emitted) == len(segments):
+            # Nothing open: keep only a trailing run of speech frames that may still grow,
+            # plus enough silence before it for the start padding
+            is_speech = self._probs > Config.VAD_THRESHOLD
+            silent = np.flatnonzero(~is_speech)
+            trailing = len(is_speech) - (silent[-1] + 1) if len(silent) else len(is_speech)
+            padding_frames = int(np.ceil(padding / frame_duration))
+            next_start = max(next_start or 0, self._final_frames - trailing - padding_frames)
+        
+        if next_start is not None and next_start > self._probs_start:
+            self._probs = self._probs[next_start - self._probs_start:]
+            self._probs_start = next_start
+        return emitted
+    
+    def _emit_segment(self, start, end):
+        """Extract features for one closed segment and send them to the vector store"""
+        samples = self._samples(int(start * self.sample_rate), int(end * self.sample_rate))
+        
+        # Rolling speech window for a stable speaker embedding on short segments
+        window_samples = int(Config.STREAM_EMBEDDING_WINDOW * self.sample_rate)
+        self._speech_history = np.concatenate([self._speech_history, samples])[-window_samples:]
+        
+        segment_id = f"segment_{self._num_segments:06d}"
+        self._num_segments += 1
+        
+        waveform = torch.from_numpy(np.ascontiguousarray(samples)).unsqueeze(0)
+        history = torch.from_numpy(np.ascontiguousarray(self._speech_history)).unsqueeze(0)
+        
+        embedding_data = build_embedding_record(
+            compute_embedding_vector(history, self.model_manager.get_embedding_inference()),
+            self.stream_name, self.stream_name, segment_id
+        )
+        logmel_data = build_logmel_record(
+            compute_logmel_vector(waveform), self.stream_name, self.stream_name, segment_id
+        )
+        for record in (embedding_data, logmel_data):
+            assign_record_id(record, self.source_hash, self.stream_name)
+        
+        # Send rows immediately rather than waiting for the bulk writer's thresholds
+        self.vector_store.insert_data(embedding_data, logmel_data)
+        self.vector_store.flush_pending()
+        
+        return {
+            "segment_id": segment_id,
+            "start": float(start),
+            "end": float(end),
+            "embedding_data": embedding_data,
+            "logmel_data": logmel_data,
+        }
+    
+    def _samples(self, start, end):
+        """Buffered samples between two absolute sample indices"""
+        return self._buffer[max(0, start - self._buffer_start):max(0, end - self._buffer_start)]
+    
+    def _trim_buffer(self):
+        """Drop audio that neither VAD context nor an open segment can still need"""
+        keep_frame = min(self._probs_start, self._final_frames - self.context_frames)
+        keep_sample = max(0, keep_frame * self.frame_samples - int(Config.AUDIO_PADDING * self.sample_rate))
+        if keep_sample > self._buffer_start:
+            self._buffer = self._buffer[keep_sample - self._buffer_start:]
+            self._buffer_start = keep_sample
+    
+    def latency_report(self):
+        """Summary of per-chunk processing latency against Config.STREAM_LATENCY_BUDGET"""
+        latencies = np.asarray(self.chunk_latencies)
+        if len(latencies) == 0:
+            return {"chunks": 0}
+        
+        stream_seconds = self._num_samples / self.sample_rate
+        return {
+            "chunks": len(latencies),
+            "mean_ms": float(latencies.mean() * 1000),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "max_ms": float(latencies.max() * 1000),
+            "budget_ms": Config.STREAM_LATENCY_BUDGET * 1000,
+            "over_budget": int((latencies > Config.STREAM_LATENCY_BUDGET).sum()),
+            "real_time_factor": float(latencies.sum() / stream_seconds) if stream_seconds else 0.0,
+        }
+    
+    def print_latency_report(self):
+        """Print the per-chunk latency summary"""
+        report = self.latency_report()
+        if not report["chunks"]:
+            print(f"⏱️ No chunks processed for {self.stream_name}")
+            return report
+        
+        print(f"\n⏱️ Streaming Latency ({self.stream_name}):")
+        print(f"  Chunks: {report['chunks']} ({report['over_budget']} over the {report['budget_ms']:.0f} ms budget)")
+        print(f"  Mean / p50 / p95 / max: {report['mean_ms']:.1f} / {report['p50_ms']:.1f} / "
+              f"{report['p95_ms']:.1f} / {report['max_ms']:.1f} ms")
+        print(f"  Real-time factor: {report['real_time_factor']:.3f}")
+        return report
@@ -0,0 +1,113 @@
+"""
+Process-pool workers for parallel execution of the audio pipeline
+"""
+
+import os
+from contextlib import contextmanager
+import torch
+
+from models.models import ModelManager
+from processing.denoise import set_denoise_threads
+from processing.vad import get_pre_vad_gate
+from core.pipeline import run_audio_pipeline, segment_audio
+from utils.audio_reader import get_audio_reader
+from utils.metrics import FileMetrics, measure_file, stage
+from utils.plotting import wait_for_plots
+from utils.stage_cache import StageCache
+from utils.utils import validate_audio_file, get_audio_name
+
+# Per-process model manager, built once by init_worker and kept for the worker's lifetime
+_model_manager = None
+
+# Per-process handle on the shared stage cache directory, if caching is enabled
+_stage_cache = None
+
+def get_torch_threads(workers):
+    """Split the available cores between workers to avoid thread oversubscription"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def init_worker(auth_token, torch_threads=1, stage_cache_dir=None):
+    """Process-pool initializer: one model manager per worker, its models loaded on first use"""
+    global _model_manager, _stage_cache
+    
+    torch.set_num_threads(torch_threads)
+    set_denoise_threads(torch_threads)
+    _model_manager = ModelManager(auth_token)
+    if stage_cache_dir:
+        _stage_cache = StageCache(stage_cache_dir)
+
+@contextmanager
+def collect_worker_stats(audio_path):
+    """Yield a dict that receives what this process recorded for the file, for the parent's reports
+    
+    Workers handle one file at a time, so the counters popped at the end are
+    that file's: "decode" holds AudioReader.pop_stats output, "pre_vad"
+    PreVadGate.pop_stats output and "metrics" the file's FileMetrics record
+    (the stages run in the worker).
+    """
+    worker_stats = {}
+    with measure_file(FileMetrics(audio_path)) as file_metrics:
+        try:
+            yield worker_stats
+        finally:
+            # Pool workers exit without running atexit handlers, so finish this file's plots here
+            with stage("plotting"):
+                wait_for_plots()
+    worker_stats["decode"] = get_audio_reader().pop_stats()
+    worker_stats["pre_vad"] = get_pre_vad_gate().pop_stats()
+    worker_stats["metrics"] = file_metrics.to_record()
+
+def process_audio_in_worker(audio_path, input_folder, output_folder):
+    """Run the pipeline for one file inside a worker process
+    
+    Returns (audio_path, success, message, audio_output_folder, speaker_features,
+    worker_stats); see collect_worker_stats. Milvus insertion and JSON output
+    are left to the parent process.
+    """
+    with collect_worker_stats(audio_path) as worker_stats:
+        result = _process_audio(audio_path, input_folder, output_folder)
+    return result + (worker_stats,)
+
+def _process_audio(audio_path, input_folder, output_folder):
+    audio_name = get_audio_name(audio_path)
+    
+    try:
+        # Validate audio file
+        is_valid, message = validate_audio_file(audio_path)
+        if not is_valid:
+            return audio_path, False, f"❌ {message}", None, None
+        
+        audio_output_folder, speaker_features = run_audio_pipeline(
+            audio_path, input_folder, output_folder, _model_manager, _stage_cache
+        )
+        return audio_path, True, None, audio_output_folder, speaker_features
+    
+    except Exception as e:
+        return audio_path, False, f"❌ Error processing {audio_name}: {str(e)}", None, None
+
+def segment_audio_in_worker(audio_path, input_folder, output_folder):
+    """Run preprocessing, VAD and diarization for one file inside a worker process
+    
+    Returns (audio_path, success, message, audio_output_folder, speaker_audio,
+    worker_stats); feature extraction is batched across files by the parent.
+    """
+    with collect_worker_stats(audio_path) as worker_stats:
+        result = _segment_audio(audio_path, input_folder, output_folder)
+    return result + (worker_stats,)
+
+def _segment_audio(audio_path, input_folder, output_folder):
+    audio_name = get_audio_name(audio_path)
+    
+    try:
+        # Validate audio file
+        is_valid, message = validate_audio_file(audio_path)
+        if not is_valid:
+            return audio_path, False, f"❌ {message}", None, None
+        
+        audio_output_folder, speaker_audio = segment_audio(
+            audio_path, input_folder, output_folder, _model_manager, _stage_cache
+        )
+        return audio_path, True, None, audio_output_folder, speaker_audio
+    
+    except Exception as e:
+        return audio_path, False, f"❌ Error processing {audio_name}: {str(e)}", None, None
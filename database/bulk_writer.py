@@ -0,0 +1,202 @@
+"""
+Buffered, column-oriented bulk writer for the Milvus collections
+"""
+
+import atexit
+import threading
+import time
+import weakref
+import numpy as np
+from config.config import Config
+
+# Writers not closed yet in this process; one atexit hook flushes them all
+_open_writers = weakref.WeakSet()
+_open_writers_lock = threading.Lock()
+
+def _close_open_writers():
+    """Flush the rows of every writer still open at interpreter shutdown"""
+    with _open_writers_lock:
+        writers = list(_open_writers)
+    for writer in writers:
+        writer.close()
+
+atexit.register(_close_open_writers)
+
+class ColumnBuffer:
+    """Rows for one collection held as columns plus a float32 vector matrix"""
+    
+    def __init__(self, collection, field_names, vector_field, dim):
+        self.collection = collection
+        self.field_names = list(field_names)
+        self.vector_field = vector_field
+        self.dim = dim
+        self._reset()
+    
+    def _reset(self):
+        """Start a fresh, empty set of columns"""
+        self.columns = {name: [] for name in self.field_names if name != self.vector_field}
+        self.vector_blocks = []
+        self.num_rows = 0
+        self.num_bytes = 0
+    
+    def add(self, row):
+        """Append one row dictionary to the columns"""
+        vector = np.asarray(row[self.vector_field], dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"{self.vector_field} has dimension {vector.shape[0]}, expected {self.dim}")
+        
+        values = [row[name] for name in self.columns]
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+            self.num_bytes += len(value) if isinstance(value, str) else 8
+        self.vector_blocks.append(vector)
+        self.num_rows += 1
+        self.num_bytes += vector.nbytes
+    
+    def take(self):
+        """Return the buffered columns in schema order and empty the buffer"""
+        if self.num_rows == 0:
+            return None
+        
+        vectors = np.vstack(self.vector_blocks)
+        data = [
+            vectors if name == self.vector_field else self.columns[name]
+            for name in self.field_names
+        ]
+        num_rows = self.num_rows
+        self._reset()
+        return data, num_rows
+
+class MilvusBulkWriter:
+    """Collects rows for the embedding and log-mel collections and inserts them in bulk
+    
+    Each collection gets one columnar insert per flush instead of one RPC per
+    row. A flush happens when either buffer reaches `flush_rows` rows or
+    `flush_bytes` bytes, when `flush_interval` seconds pass with rows pending,
+    on flush()/close() and at interpreter shutdown. Failed inserts are retried
+    with exponential backoff; rows still failing are counted in rows_failed
+    and their audio names kept in failed_audio_names, so the caller can fail
+    the run. write_method="upsert" replaces rows whose primary key already
+    exists.
+    """
+    
+    def __init__(self, embedding_collection, embedding_fields, logmel_collection, logmel_fields,
+                 flush_rows=None, flush_bytes=None, flush_interval=None,
+                 max_retries=None, retry_backoff=None, write_method="insert"):
+        self.write_method = write_method
+        self.flush_rows = flush_rows or Config.MILVUS_FLUSH_ROWS
+        self.flush_bytes = flush_bytes or Config.MILVUS_FLUSH_BYTES
+        self.flush_interval = Config.MILVUS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_retries = Config.MILVUS_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = Config.MILVUS_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        
+        self.buffers = {
+            "embedding": ColumnBuffer(
+                embedding_collection, embedding_fields, "embedding_vector", Config.EMBEDDING_DIM
+            ),
+            "logmel": ColumnBuffer(
+                logmel_collection, logmel_fields, "logmel_vector", Config.LOGMEL_DIM
+            ),
+        }
+        
+        # Statistics
+        self.insert_calls = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.failed_audio_names = set()
+        
+        self._buffer_lock = threading.Lock()
+        self._insert_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self._timer = None
+        
+        if self.flush_interval and self.flush_interval > 0:
+            self._timer = threading.Thread(target=self._run_timer, name="milvus-flush", daemon=True)
+            self._timer.start()
+        
+        with _open_writers_lock:
+            _open_writers.add(self)
+    
+    def add(self, embedding_data=None, logmel_data=None):
+        """Buffer one embedding row and/or one log-mel row
+        
+        Returns True once the rows are buffered. A flush this triggers inserts
+        rows of earlier files too, so its failure is not the caller's: the
+        batch is counted in rows_failed and failed_audio_names instead.
+        """
+        with self._buffer_lock:
+            if embedding_data:
+                self.buffers["embedding"].add(embedding_data)
+            if logmel_data:
+                self.buffers["logmel"].add(logmel_data)
+            should_flush = any(
+                buffer.num_rows >= self.flush_rows or buffer.num_bytes >= self.flush_bytes
+                for buffer in self.buffers.values()
+            )
+        
+        if should_flush:
+            self.flush()
+        return True
+    
+    def pending_rows(self):
+        """Number of rows buffered per collection"""
+        with self._buffer_lock:
+            return {name: buffer.num_rows for name, buffer in self.buffers.items()}
+    
+    def flush(self):
+        """Insert everything buffered so far; returns False if any rows were dropped"""
+        with self._insert_lock:
+            with self._buffer_lock:
+                batches = [
+                    (name, buffer, buffer.take())
+                    for name, buffer in self.buffers.items()
+                ]
+                self._last_flush = time.monotonic()
+            
+            success = True
+            for name, buffer, batch in batches:
+                if batch is None:
+                    continue
+                data, num_rows = batch
+                if not self._insert_with_retry(name, buffer.collection, data, num_rows):
+                    success = False
+                    if "audio_name" in buffer.field_names:
+                        self.failed_audio_names.update(data[buffer.field_names.index("audio_name")])
+            return success
+    
+    def _insert_with_retry(self, name, collection, data, num_rows):
+        """Insert one columnar batch, retrying transient errors with backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                getattr(collection, self.write_method)(data)
+                self.insert_calls += 1
+                self.rows_written += num_rows
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"❌ Error inserting {num_rows} {name} rows to Milvus: {str(e)}")
+                    self.rows_failed += num_rows
+                    return False
+                delay = self.retry_backoff * (2 ** attempt)
+                print(f"⚠️ Warning: Milvus insert failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+    
+    def _run_timer(self):
+        """Background loop flushing rows that have waited flush_interval seconds"""
+        while not self._closed.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush < self.flush_interval:
+                continue
+            if any(self.pending_rows().values()):
+                self.flush()
+    
+    def close(self):
+        """Stop the timer and flush the remaining rows"""
+        if self._closed.is_set():
+            return True
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        with _open_writers_lock:
+            _open_writers.discard(self)
+        return self.flush()
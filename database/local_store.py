@@ -0,0 +1,518 @@
+"""
+Embedded vector store: memory-mapped float32 shards with exact and IVF cosine search
+"""
+
+import glob
+import json
+import os
+import shutil
+import threading
+import numpy as np
+from config.config import Config
+from database.vector_store import VectorStore
+
+METADATA_FIELDS = ("id", "audio_name", "speaker_id", "audio_path", "timestamp", "source_hash", "source_path")
+
+def normalize_rows(vectors):
+    """float32 copy of the vectors scaled to unit length (cosine similarity becomes a dot product)"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def merge_top_k(scores, rows, new_scores, new_rows, k):
+    """Keep the k highest-scoring (score, row) pairs per query from two candidate sets"""
+    scores = np.concatenate([scores, new_scores], axis=1)
+    rows = np.concatenate([rows, new_rows], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        rows = np.take_along_axis(rows, top, axis=1)
+    return scores, rows
+
+def spherical_kmeans(vectors, num_clusters, iterations=None, seed=0):
+    """Centroids of unit vectors by Lloyd iterations on cosine similarity"""
+    if iterations is None:
+        iterations = Config.LOCAL_IVF_ITERATIONS
+    
+    rng = np.random.default_rng(seed)
+    num_clusters = min(num_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = np.bincount(assignment, minlength=num_clusters) > 0
+        centroids[filled] = normalize_rows(sums[filled])  # empty clusters keep their centroid
+    return centroids
+
+class LocalCollection:
+    """One collection of rows: vector shards, a metadata table and an optional IVF index
+    
+    Files in `path`:
+      shard_00000.npy, ...  unit-normalized float32 vectors, opened memory-mapped
+      metadata.jsonl        one line per stored row, in row order
+      deleted.jsonl         row numbers removed by delete(), one per line
+      ivf.npz               IVF centroids and the row numbers of each list
+    
+    Rows added since the last flush() are held in memory and searched too.
+    Storing a row whose id already exists replaces the earlier row.
+    """
+    
+    def __init__(self, path, vector_field, dim):
+        self.path = path
+        self.vector_field = vector_field
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        
+        self._shards = []
+        self._shard_starts = []
+        self._num_stored = 0
+        self._metadata = {field: [] for field in METADATA_FIELDS}
+        self._metadata_arrays = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows_by_id = {}
+        self._pending = []
+        self._deleted = []
+        self._ivf = None
+        
+        self._load()
+    
+    @property
+    def metadata_path(self):
+        return os.path.join(self.path, "metadata.jsonl")
+    
+    @property
+    def deleted_path(self):
+        return os.path.join(self.path, "deleted.jsonl")
+    
+    @property
+    def index_path(self):
+        return os.path.join(self.path, "ivf.npz")
+    
+    def __len__(self):
+        """Number of live rows"""
+        return int(self._alive.sum())
+    
+    def _load(self):
+        """Open the shards memory-mapped and read the metadata table
+        
+        flush() writes a shard before its metadata lines, so an interrupted
+        flush can leave shard rows without metadata (and a partial last line).
+        Both files are cut back to the rows they have in common, so row numbers
+        assigned later still match their vectors.
+        """
+        metadata = []
+        partial = False
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path) as f:
+                for line in f:
+                    try:
+                        metadata.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        partial = True  # line from an interrupted flush
+                        break
+        
+        shard_paths = sorted(glob.glob(os.path.join(self.path, "shard_*.npy")))
+        for shard_path in shard_paths:
+            shard = np.load(shard_path, mmap_mode='r')
+            self._shards.append(shard)
+            self._shard_starts.append(self._num_stored)
+            self._num_stored += len(shard)
+        
+        if self._num_stored > len(metadata):
+            self._truncate_shards(shard_paths, len(metadata))
+        if partial or len(metadata) > self._num_stored:
+            metadata = metadata[:self._num_stored]
+            self._rewrite_metadata(metadata)
+        
+        self._alive = np.zeros(self._num_stored, dtype=bool)
+        for entry in metadata:
+            self._append_metadata(entry)
+        
+        if os.path.exists(self.deleted_path):
+            with open(self.deleted_path) as f:
+                deleted = [int(line) for line in f if line.strip().isdigit()]
+            self._alive[[row for row in deleted if row < self._num_stored]] = False
+        
+        if os.path.exists(self.index_path):
+            with np.load(self.index_path) as index:
+                self._ivf = {key: index[key] for key in index.files}
+    
+    def _truncate_shards(self, shard_paths, num_rows):
+        """Drop stored rows from `num_rows` on, rewriting or removing the last shards"""
+        for index in range(len(self._shards) - 1, -1, -1):
+            start, shard = self._shard_starts[index], self._shards[index]
+            if start + len(shard) <= num_rows:
+                break
+            if start >= num_rows:
+                self._shards.pop()
+                self._shard_starts.pop()
+                os.remove(shard_paths[index])
+            else:
+                rows = np.array(shard[:num_rows - start])
+                shard = self._shards[index] = None  # release the memory map before replacing the file
+                tmp_path = f"{shard_paths[index]}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, rows)
+                os.replace(tmp_path, shard_paths[index])
+                self._shards[index] = np.load(shard_paths[index], mmap_mode='r')
+        self._num_stored = num_rows
+    
+    def _rewrite_metadata(self, metadata):
+        tmp_path = f"{self.metadata_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in metadata)
+        os.replace(tmp_path, self.metadata_path)
+    
+    def _append_metadata(self, entry):
+        """Record metadata for the next row number and retire any older row with the same id"""
+        row = len(self._metadata["id"])
+        for field in METADATA_FIELDS:
+            self._metadata[field].append(entry.get(field))
+        self._metadata_arrays = {}
+        
+        if row >= len(self._alive):
+            self._alive = np.concatenate([self._alive, np.zeros(max(1024, row + 1 - len(self._alive)), dtype=bool)])
+        previous = self._rows_by_id.get(entry["id"])
+        if previous is not None:
+            self._alive[previous] = False
+        self._rows_by_id[entry["id"]] = row
+        self._alive[row] = True
+        return row
+    
+    def add(self, record):
+        """Queue one row; it is searchable immediately and stored on flush()"""
+        vector = normalize_rows(record[self.vector_field])[0]
+        if len(vector) != self.dim:
+            raise ValueError(f"Expected a {self.dim}D {self.vector_field}, got {len(vector)}D")
+        
+        self._append_metadata(record)
+        self._pending.append(vector)
+        if len(self._pending) >= Config.LOCAL_STORE_SHARD_ROWS:
+            self.flush()
+    
+    def delete(self, rows):
+        """Remove rows from search results; recorded in deleted.jsonl on the next flush()"""
+        self._alive[rows] = False
+        self._deleted.extend(int(row) for row in rows)
+    
+    def stale_rows(self, source_path, source_hash):
+        """Live rows of `source_path` whose source hash differs from `source_hash`"""
+        num_rows = self._num_rows()
+        stale = (
+            self._alive[:num_rows]
+            & (self.metadata_array("source_path") == source_path)
+            & (self.metadata_array("source_hash") != source_hash)
+        )
+        return np.flatnonzero(stale)
+    
+    def flush(self):
+        """Write deletions of stored rows, then queued rows as a new shard and their metadata lines
+        
+        Deletions go first so an interrupted flush cannot leave stale rows
+        alive next to their replacements. Deleted rows that were still queued
+        are recorded after the rows themselves, since until then their row
+        numbers may be reused.
+        """
+        stored = [row for row in self._deleted if row < self._num_stored]
+        self._write_deleted(stored)
+        self._deleted = [row for row in self._deleted if row >= self._num_stored]
+        self._flush_rows()
+        self._write_deleted(self._deleted)
+        self._deleted = []
+    
+    def _write_deleted(self, rows):
+        if rows:
+            with open(self.deleted_path, 'a') as f:
+                f.writelines(f"{row}\n" for row in rows)
+    
+    def _flush_rows(self):
+        if not self._pending:
+            return
+        
+        shard_path = os.path.join(self.path, f"shard_{len(self._shards):05d}.npy")
+        np.save(shard_path, np.stack(self._pending))
+        first_row = self._num_stored
+        with open(self.metadata_path, 'a') as f:
+            for row in range(first_row, first_row + len(self._pending)):
+                f.write(json.dumps({field: self._metadata[field][row] for field in METADATA_FIELDS}) + "\n")
+        
+        shard = np.load(shard_path, mmap_mode='r')
+        self._shards.append(shard)
+        self._shard_starts.append(first_row)
+        self._num_stored += len(shard)
+        self._pending = []
+    
+    def source_hashes(self):
+        """Source hashes of all live rows"""
+        hashes = self._metadata["source_hash"]
+        return {hashes[row] for row in np.flatnonzero(self._alive)}
+    
+    def metadata_array(self, field):
+        """Metadata column as an object array (cached until rows change)"""
+        if field not in self._metadata_arrays:
+            self._metadata_arrays[field] = np.asarray(self._metadata[field], dtype=object)
+        return self._metadata_arrays[field]
+    
+    def row_metadata(self, row):
+        return {field: self._metadata[field][row] for field in METADATA_FIELDS}
+    
+    def _num_rows(self):
+        return self._num_stored + len(self._pending)
+    
+    def _iter_blocks(self, start_row=0):
+        """Yield (first row, vectors) in blocks of at most Config.LOCAL_SEARCH_BLOCK_ROWS rows"""
+        block_rows = max(1, Config.LOCAL_SEARCH_BLOCK_ROWS)
+        for shard_start, shard in zip(self._shard_starts, self._shards):
+            for offset in range(max(0, start_row - shard_start), len(shard), block_rows):
+                yield shard_start + offset, shard[offset:offset + block_rows]
+        if self._pending:
+            pending = np.stack(self._pending)
+            for offset in range(max(0, start_row - self._num_stored), len(pending), block_rows):
+                yield self._num_stored + offset, pending[offset:offset + block_rows]
+    
+    def _vectors(self, rows):
+        """Vectors of the given (sorted) row numbers, gathered from shards and pending rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        stored = rows < self._num_stored
+        if stored.any():
+            shard_index = np.searchsorted(self._shard_starts, rows[stored], side='right') - 1
+            positions = np.flatnonzero(stored)
+            for index in np.unique(shard_index):
+                selected = shard_index == index
+                local_rows = rows[stored][selected] - self._shard_starts[index]
+                vectors[positions[selected]] = self._shards[index][local_rows]
+        if (~stored).any():
+            pending = np.stack(self._pending)
+            vectors[~stored] = pending[rows[~stored] - self._num_stored]
+        return vectors
+    
+    def search(self, queries, k, allowed=None):
+        """Top-k (scores, rows) per unit query vector, best first
+        
+        `allowed` is an optional boolean mask over rows. Uses the IVF index when
+        Config.LOCAL_INDEX_TYPE is "ivf" and one has been built, otherwise an
+        exact blocked matrix multiply over all rows.
+        """
+        valid = self._alive[:self._num_rows()]
+        if allowed is not None:
+            valid = valid & allowed
+        
+        if Config.LOCAL_INDEX_TYPE == "ivf" and self._ivf is not None:
+            scores, rows = self._search_ivf(queries, k, valid)
+        else:
+            scores, rows = self._search_exact(queries, k, valid)
+        
+        order = np.argsort(-scores, axis=1)
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+    
+    def _search_exact(self, queries, k, valid, start_row=0):
+        scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        rows = np.zeros((len(queries), 0), dtype=np.int64)
+        
+        for first_row, block in self._iter_blocks(start_row):
+            block_rows = np.arange(first_row, first_row + len(block))
+            keep = valid[block_rows]
+            if not keep.any():
+                continue
+            block_scores = queries @ np.asarray(block[keep]).T
+            scores, rows = merge_top_k(
+                scores, rows, block_scores, np.broadcast_to(block_rows[keep], block_scores.shape), k
+            )
+        return scores, rows
+    
+    def _search_ivf(self, queries, k, valid):
+        """Probe the nprobe closest lists per query; rows added after the build are scanned exactly"""
+        centroids = self._ivf["centroids"]
+        list_rows = self._ivf["list_rows"]
+        list_starts = self._ivf["list_starts"]
+        indexed_rows = int(self._ivf["indexed_rows"])
+        nprobe = min(len(centroids), Config.SEARCH_PARAMS["params"]["nprobe"])
+        
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        
+        for query_index, query_probes in enumerate(probes):
+            candidates = np.concatenate([
+                list_rows[list_starts[probe]:list_starts[probe + 1]] for probe in query_probes
+            ])
+            candidates = np.sort(candidates[valid[candidates]])
+            if len(candidates) == 0:
+                continue
+            candidate_scores = self._vectors(candidates) @ queries[query_index]
+            top_scores, top_rows = merge_top_k(
+                scores[query_index:query_index + 1], rows[query_index:query_index + 1],
+                candidate_scores[None, :], candidates[None, :], k
+            )
+            scores[query_index, :top_scores.shape[1]] = top_scores[0]
+            rows[query_index, :top_rows.shape[1]] = top_rows[0]
+        
+        if self._num_rows() > indexed_rows:
+            tail_scores, tail_rows = self._search_exact(queries, k, valid, start_row=indexed_rows)
+            scores, rows = merge_top_k(scores, rows, tail_scores, tail_rows, k)
+        return scores, rows
+    
+    def unindexed_rows(self):
+        """Rows stored or queued since the IVF index was built"""
+        indexed_rows = int(self._ivf["indexed_rows"]) if self._ivf is not None else 0
+        return self._num_rows() - indexed_rows
+    
+    def build_index(self, nlist=None):
+        """Train IVF centroids on a sample of live rows and assign every stored row to a list"""
+        self.flush()
+        live_rows = np.flatnonzero(self._alive[:self._num_stored])
+        if len(live_rows) == 0:
+            return False
+        if nlist is None:
+            nlist = Config.INDEX_PARAMS["params"]["nlist"]
+        
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live_rows, min(len(live_rows), Config.LOCAL_IVF_TRAIN_SIZE), replace=False))
+        centroids = spherical_kmeans(self._vectors(sample), nlist)
+        
+        assignments = np.empty(self._num_stored, dtype=np.int64)
+        for first_row, block in self._iter_blocks():
+            if first_row >= self._num_stored:
+                break
+            assignments[first_row:first_row + len(block)] = np.argmax(np.asarray(block) @ centroids.T, axis=1)
+        
+        list_rows = np.argsort(assignments, kind='stable')
+        list_starts = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))])
+        self._ivf = {
+            "centroids": centroids,
+            "list_rows": list_rows,
+            "list_starts": list_starts,
+            "indexed_rows": np.array(self._num_stored),
+        }
+        np.savez(self.index_path, **self._ivf)
+        return True
+
+class LocalVectorStore(VectorStore):
+    """VectorStore kept in a local directory, with no external service
+    
+    Each collection is a LocalCollection (memory-mapped float32 shards plus a
+    metadata table). Search is exact by default; with
+    Config.LOCAL_INDEX_TYPE = "ivf" an IVF index (Config.INDEX_PARAMS nlist,
+    Config.SEARCH_PARAMS nprobe) is built on flush once a collection has
+    Config.LOCAL_IVF_MIN_ROWS rows, and rebuilt when more than
+    Config.LOCAL_IVF_REBUILD_FRACTION of the rows are newer than the index.
+    """
+    
+    def __init__(self, store_dir, write_mode=None):
+        self.store_dir = store_dir
+        self.write_mode = write_mode or Config.MILVUS_WRITE_MODE
+        
+        if self.write_mode not in ("overwrite", "append"):
+            raise ValueError(f"Unknown write mode: {self.write_mode}")
+        
+        if self.write_mode == "overwrite" and os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+        
+        self.embedding_collection = LocalCollection(
+            os.path.join(store_dir, Config.EMBEDDING_COLLECTION_NAME), "embedding_vector", Config.EMBEDDING_DIM
+        )
+        self.logmel_collection = LocalCollection(
+            os.path.join(store_dir, Config.LOGMEL_COLLECTION_NAME), "logmel_vector", Config.LOGMEL_DIM
+        )
+        self._lock = threading.RLock()
+        
+        print(f"✅ Local vector store ready at {store_dir} ({self.write_mode} mode, "
+              f"{len(self.embedding_collection)} embeddings)")
+    
+    def describe(self):
+        return f"local index {self.store_dir}"
+    
+    def insert_data(self, embedding_data, logmel_data):
+        """Add rows to the in-memory tail of each collection; shards are written on flush"""
+        try:
+            with self._lock:
+                if embedding_data:
+                    self.embedding_collection.add(embedding_data)
+                if logmel_data:
+                    self.logmel_collection.add(logmel_data)
+            return True
+        except Exception as e:
+            print(f"❌ Error inserting to local vector store: {str(e)}")
+            return False
+    
+    def delete_stale_rows(self, source_path, source_hash):
+        """Delete rows of an earlier version of the file (other content or pipeline config)"""
+        try:
+            with self._lock:
+                for collection in (self.embedding_collection, self.logmel_collection):
+                    collection.delete(collection.stale_rows(source_path, source_hash))
+            return True
+        except Exception as e:
+            print(f"❌ Error deleting earlier rows of {source_path} from local vector store: {str(e)}")
+            return False
+    
+    def flush_pending(self):
+        """Queued rows are searchable already"""
+        return True
+    
+    def flush_collections(self):
+        """Write queued rows to shards and refresh the IVF index if it is due"""
+        try:
+            with self._lock:
+                for collection in (self.embedding_collection, self.logmel_collection):
+                    collection.flush()
+                    if self._index_due(collection):
+                        collection.build_index()
+            print("💾 Data flushed to local vector store successfully")
+            return True
+        except Exception as e:
+            print(f"❌ Error flushing local vector store: {str(e)}")
+            return False
+    
+    def _index_due(self, collection):
+        if Config.LOCAL_INDEX_TYPE != "ivf" or len(collection) < Config.LOCAL_IVF_MIN_ROWS:
+            return False
+        unindexed = collection.unindexed_rows()
+        return unindexed > Config.LOCAL_IVF_REBUILD_FRACTION * (collection._num_rows() - unindexed)
+    
+    def get_processed_source_hashes(self, source_hashes):
+        with self._lock:
+            return set(source_hashes) & self.embedding_collection.source_hashes()
+    
+    def search_embeddings(self, query_embeddings, top_k=5, filters=None, offset=0):
+        """Cosine search over the speaker embeddings (see VectorStore)"""
+        collection = self.embedding_collection
+        with self._lock:
+            allowed = None
+            for field, values in (filters or {}).items():
+                if values is None:
+                    continue
+                if isinstance(values, str):
+                    values = [values]
+                matches = np.isin(collection.metadata_array(field), list(values))
+                allowed = matches if allowed is None else allowed & matches
+            
+            scores, rows = collection.search(normalize_rows(query_embeddings), top_k + offset, allowed)
+            
+            results = []
+            for query_scores, query_rows in zip(scores, rows):
+                hits = []
+                for score, row in list(zip(query_scores, query_rows))[offset:]:
+                    if row < 0 or not np.isfinite(score):
+                        continue
+                    metadata = collection.row_metadata(row)
+                    hits.append({
+                        "audio_name": metadata["audio_name"],
+                        "speaker_id": metadata["speaker_id"],
+                        "audio_path": metadata["audio_path"],
+                        "distance": float(score),
+                    })
+                results.append(hits)
+            return results
+    
+    def get_collection_stats(self):
+        with self._lock:
+            return len(self.embedding_collection), len(self.logmel_collection)
+    
+    def build_index(self, nlist=None):
+        """Build (or rebuild) the IVF index of the speaker embeddings now"""
+        with self._lock:
+            return self.embedding_collection.build_index(nlist)
@@ -2,6 +2,7 @@
 Milvus database handler for the Arabic-Audio-Preprocessing-and-Feature-Extraction
 """
 
+import json
 from pymilvus import (
     connections,
     utility,
@@ -11,21 +12,61 @@ from pymilvus import (
     Collection,
 )
 from config.config import Config
+from database.bulk_writer import MilvusBulkWriter
+from database.vector_store import VectorStore
 
-class MilvusHandler:
+def build_filter_expr(filters=None):
+    """Milvus boolean expression for {"audio_name": ..., "speaker_id": ...} filters
+    
+    Each value may be a single value or a list of values; None means no filter.
+    """
+    clauses = []
+    for field, values in (filters or {}).items():
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        clauses.append(f"{field} in {json.dumps(list(values))}")
+    return " and ".join(clauses) or None
+
+def hit_to_dict(hit):
+    """Plain dict for one pymilvus search hit"""
+    return {
+        "audio_name": hit.entity.get('audio_name'),
+        "speaker_id": hit.entity.get('speaker_id'),
+        "audio_path": hit.entity.get('audio_path'),
+        "distance": float(hit.distance),
+    }
+
+class MilvusHandler(VectorStore):
     """Handles all Milvus database operations"""
     
-    def __init__(self, host=None, port=None):
+    def __init__(self, host=None, port=None, write_mode=None):
         self.host = host or Config.DEFAULT_MILVUS_HOST
         self.port = port or Config.DEFAULT_MILVUS_PORT
+        self.write_mode = write_mode or Config.MILVUS_WRITE_MODE
+        
+        if self.write_mode not in ("overwrite", "append"):
+            raise ValueError(f"Unknown Milvus write mode: {self.write_mode}")
         
         # Collection instances
         self.embedding_collection = None
         self.logmel_collection = None
+        self.writer = None
+        
+        # Names of collections already loaded into query nodes (loading is done once)
+        self._loaded = set()
         
         # Initialize connection and collections
         self.setup_connection()
         self.setup_collections()
+        
+        # Buffered bulk writer for both collections
+        self.writer = MilvusBulkWriter(
+            self.embedding_collection, [field.name for field in self.embedding_collection.schema.fields],
+            self.logmel_collection, [field.name for field in self.logmel_collection.schema.fields],
+            write_method="upsert" if self.write_mode == "append" else "insert"
+        )
     
     def setup_connection(self):
         """Initialize Milvus connection"""
@@ -49,19 +90,16 @@ class MilvusHandler:
             FieldSchema(name="speaker_id", dtype=DataType.VARCHAR, max_length=100),
             FieldSchema(name="audio_path", dtype=DataType.VARCHAR, max_length=1000),
             FieldSchema(name="embedding_vector", dtype=DataType.FLOAT_VECTOR, dim=Config.EMBEDDING_DIM),
-            FieldSchema(name="timestamp", dtype=DataType.VARCHAR, max_length=50)
+            FieldSchema(name="timestamp", dtype=DataType.VARCHAR, max_length=50),
+            FieldSchema(name="source_hash", dtype=DataType.VARCHAR, max_length=64),
+            FieldSchema(name="source_path", dtype=DataType.VARCHAR, max_length=1000)
         ]
         
         embedding_schema = CollectionSchema(embedding_fields, "Speaker embeddings collection")
         
-        # Drop existing collection if it exists
-        if utility.has_collection(Config.EMBEDDING_COLLECTION_NAME):
-            utility.drop_collection(Config.EMBEDDING_COLLECTION_NAME)
-        
-        self.embedding_collection = Collection(Config.EMBEDDING_COLLECTION_NAME, embedding_schema)
-        
-        # Create index for embeddings
-        self.embedding_collection.create_index("embedding_vector", Config.INDEX_PARAMS)
+        self.embedding_collection = self._open_collection(
+            Config.EMBEDDING_COLLECTION_NAME, embedding_schema, "embedding_vector"
+        )
         
         # Log-Mel Features Collection (192D)
         logmel_fields = [
@@ -70,76 +108,162 @@ class MilvusHandler:
             FieldSchema(name="speaker_id", dtype=DataType.VARCHAR, max_length=100),
             FieldSchema(name="audio_path", dtype=DataType.VARCHAR, max_length=1000),
             FieldSchema(name="logmel_vector", dtype=DataType.FLOAT_VECTOR, dim=Config.LOGMEL_DIM),
-            FieldSchema(name="timestamp", dtype=DataType.VARCHAR, max_length=50)
+            FieldSchema(name="timestamp", dtype=DataType.VARCHAR, max_length=50),
+            FieldSchema(name="source_hash", dtype=DataType.VARCHAR, max_length=64),
+            FieldSchema(name="source_path", dtype=DataType.VARCHAR, max_length=1000)
         ]
         
         logmel_schema = CollectionSchema(logmel_fields, "Log-mel features collection")
         
-        # Drop existing collection if it exists
-        if utility.has_collection(Config.LOGMEL_COLLECTION_NAME):
-            utility.drop_collection(Config.LOGMEL_COLLECTION_NAME)
+        self.logmel_collection = self._open_collection(
+            Config.LOGMEL_COLLECTION_NAME, logmel_schema, "logmel_vector"
+        )
         
-        self.logmel_collection = Collection(Config.LOGMEL_COLLECTION_NAME, logmel_schema)
+        print(f"✅ Milvus collections ready ({self.write_mode} mode)")
+        print(f"✅ Embedding dimension: {Config.EMBEDDING_DIM}D")
+    
+    def _open_collection(self, name, schema, vector_field):
+        """Create a collection, or reuse the existing one in append mode"""
+        if utility.has_collection(name):
+            if self.write_mode == "overwrite":
+                # Drop existing collection if it exists
+                utility.drop_collection(name)
+            else:
+                collection = Collection(name)
+                field_names = [field.name for field in collection.schema.fields]
+                missing = [field for field in ("source_hash", "source_path") if field not in field_names]
+                if missing:
+                    raise RuntimeError(
+                        f"Collection {name} has no {' or '.join(missing)} field; run once with "
+                        f"MILVUS_WRITE_MODE='overwrite' to recreate it"
+                    )
+                print(f"✅ Appending to existing collection {name} ({collection.num_entities} records)")
+                return collection
         
-        # Create index for log-mel features
-        self.logmel_collection.create_index("logmel_vector", Config.INDEX_PARAMS)
+        collection = Collection(name, schema)
         
-        print("✅ Milvus collections created successfully")
-        print(f"✅ Embedding dimension: {Config.EMBEDDING_DIM}D")
+        # Create index for the vector field
+        collection.create_index(vector_field, Config.INDEX_PARAMS)
+        return collection
     
     def insert_data(self, embedding_data, logmel_data):
-        """Insert embeddings and log-mel features to Milvus"""
+        """Queue embeddings and log-mel features for bulk insertion to Milvus
+        
+        Rows are buffered by the bulk writer and inserted column-wise once a
+        row-count, byte or time threshold is reached, or on flush_collections.
+        """
         try:
-            # Insert embedding data
-            if embedding_data:
-                self.embedding_collection.insert([embedding_data])
-            
-            # Insert log-mel data
-            if logmel_data:
-                self.logmel_collection.insert([logmel_data])
+            return self.writer.add(embedding_data, logmel_data)
+        except Exception as e:
+            print(f"❌ Error inserting to Milvus: {str(e)}")
+            return False
+    
+    def get_processed_source_hashes(self, source_hashes, batch_size=500):
+        """Return the subset of source hashes that already have rows in Milvus"""
+        processed = set()
+        source_hashes = list(dict.fromkeys(source_hashes))
+        if not source_hashes:
+            return processed
+        
+        try:
+            self.load_collection(self.embedding_collection)
             
+            for start in range(0, len(source_hashes), batch_size):
+                batch = source_hashes[start:start + batch_size]
+                rows = self.embedding_collection.query(
+                    expr=f"source_hash in {json.dumps(batch)}",
+                    output_fields=["source_hash"]
+                )
+                processed.update(row["source_hash"] for row in rows)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not check existing records in Milvus: {str(e)}")
+        
+        return processed
+    
+    def delete_stale_rows(self, source_path, source_hash):
+        """Delete rows of an earlier version of the file (other content or pipeline config)"""
+        expr = f"source_path == {json.dumps(source_path)} and source_hash != {json.dumps(source_hash)}"
+        try:
+            for collection in (self.embedding_collection, self.logmel_collection):
+                collection.delete(expr)
             return True
         except Exception as e:
-            print(f"❌ Error inserting to Milvus: {str(e)}")
+            print(f"❌ Error deleting earlier rows of {source_path} from Milvus: {str(e)}")
             return False
     
+    def load_collection(self, collection):
+        """Load a collection for search and queries, once per handler
+        
+        Rows inserted later are searchable without reloading.
+        """
+        if collection.name not in self._loaded:
+            collection.load()
+            self._loaded.add(collection.name)
+        return collection
+    
+    def describe(self):
+        return f"Milvus {self.host}:{self.port}"
+    
+    def flush_pending(self):
+        """Insert the bulk writer's buffered rows now"""
+        return self.writer.flush()
+    
     def search_similar_speakers(self, query_embedding, top_k=5):
         """Search for similar speakers in Milvus"""
         try:
-            # Load collection
-            self.embedding_collection.load()
-            
-            # Perform search
-            results = self.embedding_collection.search(
-                data=[query_embedding],
-                anns_field="embedding_vector",
-                param=Config.SEARCH_PARAMS,
-                limit=top_k,
-                output_fields=["audio_name", "speaker_id", "audio_path"]
-            )
-            
-            return results
+            return self._search([query_embedding], top_k)
         except Exception as e:
             print(f"❌ Error searching Milvus: {str(e)}")
             return None
     
+    def search_embeddings(self, query_embeddings, top_k=5, filters=None, offset=0):
+        """One multi-vector search over the speaker embeddings (see VectorStore)"""
+        results = self._search(query_embeddings, top_k, build_filter_expr(filters), offset)
+        return [[hit_to_dict(hit) for hit in hits] for hits in results]
+    
+    def _search(self, query_embeddings, top_k, expr=None, offset=0):
+        """pymilvus search with one hit list per query vector"""
+        self.load_collection(self.embedding_collection)
+        
+        param = dict(Config.SEARCH_PARAMS)
+        if offset:
+            param["offset"] = offset
+        
+        return self.embedding_collection.search(
+            data=[list(map(float, vector)) for vector in query_embeddings],
+            anns_field="embedding_vector",
+            param=param,
+            limit=top_k,
+            expr=expr,
+            output_fields=["audio_name", "speaker_id", "audio_path"]
+        )
+    
     def flush_collections(self):
-        """Flush data to Milvus"""
+        """Flush data to Milvus; False if any rows of the run could not be inserted"""
         try:
+            # Send any buffered rows first
+            self.writer.flush()
+            
             self.embedding_collection.flush()
             self.logmel_collection.flush()
-            print("💾 Data flushed to Milvus successfully")
-            return True
         except Exception as e:
-            print(f"⚠️ Warning: Error flushing to Milvus: {str(e)}")
+            print(f"❌ Error flushing to Milvus: {str(e)}")
+            return False
+        
+        # Includes flushes that failed earlier in the run (size- and time-triggered)
+        if self.writer.rows_failed:
+            print(f"❌ {self.writer.rows_failed} rows could not be inserted to Milvus, from: "
+                  f"{', '.join(sorted(self.writer.failed_audio_names))}")
             return False
+        print("💾 Data flushed to Milvus successfully")
+        return True
     
     def get_collection_stats(self):
         """Get statistics about Milvus collections"""
         try:
             # Load collections
-            self.embedding_collection.load()
-            self.logmel_collection.load()
+            self.load_collection(self.embedding_collection)
+            self.load_collection(self.logmel_collection)
             
             # Get counts
             embedding_count = self.embedding_collection.num_entities
@@ -148,4 +272,10 @@ class MilvusHandler:
             return embedding_count, logmel_count
         except Exception as e:
             print(f"❌ Error getting collection stats: {str(e)}")
-            return 0, 0
\ No newline at end of file
+            return 0, 0
+    
+    def close(self):
+        """Flush buffered rows and stop the background writer"""
+        if self.writer is not None:
+            return self.writer.close()
+        return True
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Batched speaker similarity search with cached query embeddings
+"""
+
+import threading
+from collections import OrderedDict
+from config.config import Config
+from utils.utils import get_source_hash
+
+class EmbeddingCache:
+    """Thread-safe LRU of query embeddings keyed by audio content hash"""
+    
+    def __init__(self, max_size=None):
+        self.max_size = Config.SEARCH_EMBEDDING_CACHE_SIZE if max_size is None else max_size
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self._vectors)
+    
+    def get(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+    
+    def put(self, key, vector):
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+
+class SpeakerSearchService:
+    """Similarity search for many queries at once
+    
+    Queries are embedding vectors or audio paths. Audio queries are embedded
+    once per content hash (get_source_hash, so a config change invalidates
+    them) and kept in an LRU of Config.SEARCH_EMBEDDING_CACHE_SIZE vectors;
+    cache misses are embedded together in padded batches. All query vectors
+    then go to the VectorStore as multi-vector searches of up to
+    Config.SEARCH_BATCH_SIZE queries, with optional audio_name / speaker_id
+    filters and an offset for pagination.
+    """
+    
+    def __init__(self, vector_store, get_embedding_inference, cache_size=None):
+        self.vector_store = vector_store
+        self.get_embedding_inference = get_embedding_inference
+        self.cache = EmbeddingCache(cache_size)
+    
+    def embed_queries(self, audio_paths):
+        """Embedding vector for each audio path (None where it could not be computed)"""
+        keys = []
+        for audio_path in audio_paths:
+            try:
+                keys.append(get_source_hash(audio_path))
+            except OSError as e:
+                print(f"❌ Error reading query audio {audio_path}: {str(e)}")
+                keys.append(None)
+        
+        vectors = {}
+        missing = {}
+        for key, audio_path in zip(keys, audio_paths):
+            if key is None or key in vectors or key in missing:
+                continue
+            vector = self.cache.get(key)
+            if vector is None:
+                missing[key] = audio_path
+            else:
+                vectors[key] = vector
+        
+        if missing:
+            for key, vector in self._compute_embeddings(missing).items():
+                if vector is not None:
+                    self.cache.put(key, vector)
+                    vectors[key] = vector
+        
+        return [vectors.get(key) for key in keys]
+    
+    def _compute_embeddings(self, audio_paths_by_key):
+        """Embed uncached queries in batches; a failing batch is retried file by file"""
+        from processing.batched_embedding import extract_embeddings_batched
+        
+        embedding_inference = self.get_embedding_inference()
+        items = list(audio_paths_by_key.items())
+        try:
+            return extract_embeddings_batched(items, embedding_inference, Config.SEARCH_EMBEDDING_BATCH_SIZE)
+        except Exception:
+            embeddings = {}
+            for key, audio_path in items:
+                try:
+                    embeddings.update(extract_embeddings_batched([(key, audio_path)], embedding_inference, 1))
+                except Exception as e:
+                    print(f"❌ Error embedding query audio {audio_path}: {str(e)}")
+            return embeddings
+    
+    def search(self, queries, top_k=5, audio_name=None, speaker_id=None, offset=0):
+        """Closest stored speakers for each query, as lists of hit dicts
+        
+        Returns one list per query, in query order; audio queries that could
+        not be embedded get an empty list.
+        """
+        queries = list(queries)
+        audio_paths = [query for query in queries if isinstance(query, str)]
+        embedded = dict(zip(audio_paths, self.embed_queries(audio_paths))) if audio_paths else {}
+        vectors = [embedded[query] if isinstance(query, str) else query for query in queries]
+        
+        filters = {"audio_name": audio_name, "speaker_id": speaker_id}
+        valid = [index for index, vector in enumerate(vectors) if vector is not None]
+        results = [[] for _ in queries]
+        
+        batch_size = max(1, Config.SEARCH_BATCH_SIZE)
+        for start in range(0, len(valid), batch_size):
+            batch = valid[start:start + batch_size]
+            hits = self.vector_store.search_embeddings(
+                [vectors[index] for index in batch], top_k, filters=filters, offset=offset
+            )
+            for index, hit_list in zip(batch, hits):
+                results[index] = hit_list
+        
+        return results
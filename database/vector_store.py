@@ -0,0 +1,79 @@
+"""
+Vector store interface and backend selection
+"""
+
+import os
+from config.config import Config
+
+VECTOR_STORE_BACKENDS = ("milvus", "local")
+
+class VectorStore:
+    """Storage and similarity search for speaker embedding and log-mel rows
+    
+    Rows are the dicts built by processing.feature_extraction (id, audio_name,
+    speaker_id, audio_path, timestamp, source_hash, source_path and the vector
+    field). `write_mode` is "overwrite" (start from empty collections) or
+    "append" (keep existing rows and replace rows with the same id).
+    """
+    
+    write_mode = "overwrite"
+    
+    def describe(self):
+        """Short human-readable location of the store"""
+        raise NotImplementedError
+    
+    def insert_data(self, embedding_data, logmel_data):
+        """Queue an embedding row and a log-mel row (either may be None); returns success"""
+        raise NotImplementedError
+    
+    def flush_pending(self):
+        """Make queued rows searchable without a full flush; returns success"""
+        raise NotImplementedError
+    
+    def flush_collections(self):
+        """Persist all queued rows; returns success"""
+        raise NotImplementedError
+    
+    def get_processed_source_hashes(self, source_hashes):
+        """Subset of `source_hashes` that already have stored rows"""
+        raise NotImplementedError
+    
+    def delete_stale_rows(self, source_path, source_hash):
+        """Delete the rows of `source_path` stored under another source hash; returns success"""
+        raise NotImplementedError
+    
+    def search_embeddings(self, query_embeddings, top_k=5, filters=None, offset=0):
+        """Closest speaker embeddings for each query vector
+        
+        `filters` maps "audio_name" / "speaker_id" to a value or a list of
+        allowed values; `offset` skips that many of the closest hits. Returns
+        one list per query of dicts with audio_name, speaker_id, audio_path and
+        distance (cosine similarity, higher is closer).
+        """
+        raise NotImplementedError
+    
+    def get_collection_stats(self):
+        """(embedding_count, logmel_count)"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Persist queued rows and release resources"""
+        return self.flush_collections()
+
+def create_vector_store(backend=None, output_folder=None, milvus_host=None, milvus_port=None, write_mode=None):
+    """Build the configured backend (Config.VECTOR_STORE_BACKEND by default)
+    
+    "milvus" connects to a Milvus server; "local" keeps an embedded index in
+    Config.LOCAL_STORE_DIRNAME inside the output folder and needs no service.
+    The backend modules are imported here, so only the chosen one is loaded.
+    """
+    backend = backend or Config.VECTOR_STORE_BACKEND
+    if backend == "milvus":
+        from database.milvus_handler import MilvusHandler
+        
+        return MilvusHandler(milvus_host, milvus_port, write_mode)
+    if backend == "local":
+        from database.local_store import LocalVectorStore
+        
+        return LocalVectorStore(os.path.join(output_folder, Config.LOCAL_STORE_DIRNAME), write_mode)
+    raise ValueError(f"Unknown vector store backend: {backend} (expected one of {VECTOR_STORE_BACKENDS})")
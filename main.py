@@ -41,9 +41,10 @@ def main():
         print("\n🎉 Arabic-Audio-Preprocessing-and-Feature-Extraction completed!")
         
         # Optional: Demo similarity search (uncomment to test)
-        # if processor.all_embeddings:
-        #     first_audio_path = processor.all_embeddings[0]["audio_path"]
-        #     processor.demo_similarity_search(first_audio_path, top_k=3)
+        # from utils.feature_store import FeatureReader
+        # _, metadata = FeatureReader(os.path.join(OUTPUT_FOLDER, Config.FEATURE_STORE_DIRNAME)).slice("embeddings", 0, 1)
+        # if metadata:
+        #     processor.demo_similarity_search(metadata["audio_path"][0], top_k=3)
         
     except Exception as e:
         print(f"❌ Pipeline failed with error: {str(e)}")
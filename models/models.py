@@ -2,17 +2,23 @@
 Model initialization and management for the Arabic-Audio-Preprocessing-and-Feature-Extraction
 """
 
-import torch
-import nemo.collections.asr as nemo_asr
-from pyannote.audio import Pipeline, Model, Inference
+import threading
 from config.config import Config
 
+MODEL_NAMES = ("vad", "diarization", "embedding")
+
 class ModelManager:
-    """Manages all ML models used in the pipeline"""
+    """Manages all ML models used in the pipeline
+    
+    Models are loaded on first access through the getters, and NeMo and
+    pyannote are only imported then, so callers that never run a model (search,
+    collection stats, pool parents) start quickly. prewarm() loads everything
+    in a background thread; a getter called meanwhile waits for its model.
+    """
     
-    def __init__(self, auth_token):
+    def __init__(self, auth_token, prewarm=False):
         self.auth_token = auth_token
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self._device = None
         
         # Model instances
         self.vad_model = None
@@ -20,33 +26,70 @@ class ModelManager:
         self.embedding_model = None
         self.embedding_inference = None
         
-        # Initialize all models
-        self.setup_models()
+        # One lock per model, so loading one does not hold up the others
+        self._locks = {name: threading.Lock() for name in MODEL_NAMES}
+        self._prewarm_thread = None
+        
+        if prewarm:
+            self.prewarm()
+    
+    @property
+    def device(self):
+        """'cuda' when available, otherwise 'cpu' (torch is imported on first use)"""
+        if self._device is None:
+            import torch
+            
+            self._device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        return self._device
     
-    def setup_models(self):
-        """Initialize VAD, Diarization, and Embedding models"""
+    def setup_models(self, models=None):
+        """Initialize VAD, Diarization, and Embedding models (or only the names in `models`)"""
         print("🔄 Loading models...")
         
-        # Load VAD model
-        self._load_vad_model()
-        
-        # Load Diarization pipeline
-        self._load_diarization_pipeline()
-        
-        # Load native pyannote Speaker Embedding model
-        self._load_embedding_model()
+        getters = {
+            "vad": self.get_vad_model,
+            "diarization": self.get_diarization_pipeline,
+            "embedding": self.get_embedding_inference,
+        }
+        for name in models or MODEL_NAMES:
+            getters[name]()
         
         print(f"✅ Models loaded on device: {self.device}")
-        print("✅ Using native pyannote embedding model")
+    
+    def prewarm(self, models=None):
+        """Start loading models ("vad", "diarization", "embedding"; default all) in a background thread"""
+        if self._prewarm_thread is None:
+            self._prewarm_thread = threading.Thread(
+                target=self._run_prewarm, args=(models,), name="model-prewarm", daemon=True
+            )
+            self._prewarm_thread.start()
+        return self._prewarm_thread
+    
+    def _run_prewarm(self, models):
+        try:
+            self.setup_models(models)
+        except Exception as e:
+            # The getter that needs the model retries and raises
+            print(f"⚠️ Warning: Model prewarm failed: {str(e)}")
+    
+    def _ensure_loaded(self, name, attribute, loader):
+        """Run `loader` once, the first time the model is requested"""
+        if getattr(self, attribute) is None:
+            with self._locks[name]:
+                if getattr(self, attribute) is None:
+                    loader()
+        return getattr(self, attribute)
     
     def _load_vad_model(self):
         """Load Voice Activity Detection model"""
         try:
-            self.vad_model = nemo_asr.models.EncDecFrameClassificationModel.from_pretrained(
+            import nemo.collections.asr as nemo_asr
+            
+            vad_model = nemo_asr.models.EncDecFrameClassificationModel.from_pretrained(
                 model_name=Config.VAD_MODEL_NAME
             )
-            self.vad_model.eval()
-            self.vad_model = self.vad_model.to(self.device)
+            vad_model.eval()
+            self.vad_model = vad_model.to(self.device)
             print("✅ VAD model loaded successfully")
         except Exception as e:
             print(f"❌ Error loading VAD model: {str(e)}")
@@ -55,6 +98,8 @@ class ModelManager:
     def _load_diarization_pipeline(self):
         """Load Speaker Diarization pipeline"""
         try:
+            from pyannote.audio import Pipeline
+            
             self.diarization_pipeline = Pipeline.from_pretrained(
                 Config.DIARIZATION_MODEL_NAME,
                 use_auth_token=self.auth_token
@@ -67,6 +112,9 @@ class ModelManager:
     def _load_embedding_model(self):
         """Load Speaker Embedding model"""
         try:
+            import torch
+            from pyannote.audio import Model, Inference
+            
             # Load native pyannote Speaker Embedding model
             self.embedding_model = Model.from_pretrained(
                 Config.EMBEDDING_MODEL_NAME,
@@ -85,17 +133,17 @@ class ModelManager:
             raise
     
     def get_vad_model(self):
-        """Get VAD model instance"""
-        return self.vad_model
+        """Get VAD model instance, loading it on first use"""
+        return self._ensure_loaded("vad", "vad_model", self._load_vad_model)
     
     def get_diarization_pipeline(self):
-        """Get diarization pipeline instance"""
-        return self.diarization_pipeline
+        """Get diarization pipeline instance, loading it on first use"""
+        return self._ensure_loaded("diarization", "diarization_pipeline", self._load_diarization_pipeline)
     
     def get_embedding_inference(self):
-        """Get embedding inference instance"""
-        return self.embedding_inference
+        """Get embedding inference instance, loading it on first use"""
+        return self._ensure_loaded("embedding", "embedding_inference", self._load_embedding_model)
     
     def get_device(self):
         """Get the device being used"""
-        return self.device
\ No newline at end of file
+        return self.device
@@ -0,0 +1,68 @@
+"""
+Cross-file batched speaker embedding inference for the Arabic-Audio-Preprocessing-and-Feature-Extraction
+"""
+
+import inspect
+import traceback
+import numpy as np
+import torch
+from config.config import Config
+from processing.feature_extraction import load_waveform
+from utils.audio import make_length_buckets
+
+def _supports_weights(model):
+    """Whether the embedding model can ignore padded samples through `weights`"""
+    try:
+        return "weights" in inspect.signature(model.forward).parameters
+    except (TypeError, ValueError):
+        return False
+
+def extract_embeddings_batched(items, embedding_inference, batch_size=None, max_batch_samples=None):
+    """Run the embedding model over many speaker waveforms in padded batches
+    
+    `items` is a list of (key, audio) pairs where audio is an AudioBuffer or a
+    path, typically keyed by (audio_name, speaker_id). Waveforms are sorted into
+    length buckets and zero-padded; when the model accepts `weights` the padding
+    is masked out of the statistics pooling. Returns {key: 1D embedding vector},
+    with None for items whose batch failed.
+    """
+    if batch_size is None:
+        batch_size = Config.EMBEDDING_BATCH_SIZE
+    if max_batch_samples is None:
+        max_batch_samples = Config.EMBEDDING_BATCH_MAX_SAMPLES
+    
+    keys = [key for key, _ in items]
+    waveforms = [load_waveform(audio)[0][0] for _, audio in items]
+    lengths = [len(waveform) for waveform in waveforms]
+    
+    model = embedding_inference.model
+    device = embedding_inference.device
+    use_weights = _supports_weights(model)
+    
+    embeddings = {}
+    for bucket in make_length_buckets(lengths, batch_size, max_batch_samples):
+        max_length = max(lengths[index] for index in bucket)
+        batch = torch.zeros(len(bucket), 1, max_length)
+        weights = torch.zeros(len(bucket), max_length)
+        
+        for row, index in enumerate(bucket):
+            batch[row, 0, :lengths[index]] = waveforms[index]
+            weights[row, :lengths[index]] = 1.0
+        
+        try:
+            with torch.no_grad():
+                if use_weights:
+                    output = model(batch.to(device), weights=weights.to(device))
+                else:
+                    output = model(batch.to(device))
+            vectors = output.reshape(len(bucket), -1).cpu().numpy()
+        except Exception as e:
+            print(f"❌ Error in batched embedding inference: {str(e)}")
+            traceback.print_exc()
+            vectors = [None] * len(bucket)
+        
+        for row, index in enumerate(bucket):
+            embeddings[keys[index]] = vectors[row]
+    
+    print(f"✅ Extracted {len(items)} pyannote embeddings in batches of up to {batch_size}")
+    return embeddings
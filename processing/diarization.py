@@ -2,40 +2,95 @@
 Speaker Diarization processing for the Arabic-Audio-Preprocessing-and-Feature-Extraction
 """
 
+import io
 import os
-from pydub import AudioSegment
+import numpy as np
+from utils.audio import AudioBuffer, load_audio_buffer, gather_ranges
 from config.config import Config
 
-def perform_diarization(audio_path, output_folder, diarization_pipeline):
-    """Step 3: Speaker Diarization"""
-    # Apply diarization
-    diarization = diarization_pipeline(audio_path, num_speakers=2)
+def speaker_sample_ranges(diarization, sample_rate, num_samples):
+    """Map each speaker label to the [start, end) sample indices of its turns
     
-    # Save RTTM file
+    Turns are read from `itertracks` once; conversion to clipped sample indices
+    and grouping by speaker are done on arrays, keeping each speaker's turns in
+    time order.
+    """
+    turns = [
+        (turn.start, turn.end, speaker)
+        for turn, _, speaker in diarization.itertracks(yield_label=True)
+    ]
+    if not turns:
+        return {}
+    
+    turn_starts, turn_ends, labels = zip(*turns)
+    starts = np.clip((np.asarray(turn_starts) * sample_rate).astype(np.int64), 0, num_samples)
+    ends = np.clip((np.asarray(turn_ends) * sample_rate).astype(np.int64), 0, num_samples)
+    speakers, speaker_index = np.unique(np.asarray(labels), return_inverse=True)
+    
+    # Group turns by speaker, preserving time order within each speaker
+    order = np.argsort(speaker_index, kind="stable")
+    boundaries = np.flatnonzero(np.diff(speaker_index[order])) + 1
+    
+    speaker_ranges = {}
+    for speaker, group in zip(speakers, np.split(order, boundaries)):
+        speaker_ranges[str(speaker)] = (starts[group], ends[group])
+    return speaker_ranges
+
+def diarize(audio, diarization_pipeline):
+    """Run the diarization pipeline on an AudioBuffer
+    
+    Returns the speaker sample ranges and the diarization in RTTM format.
+    """
+    # Apply diarization on the in-memory waveform
+    diarization = diarization_pipeline(audio.to_pyannote(), num_speakers=2)
+    
+    rttm = io.StringIO()
+    diarization.write_rttm(rttm)
+    
+    # Separate speakers
+    speaker_ranges = speaker_sample_ranges(diarization, audio.sample_rate, len(audio))
+    return speaker_ranges, rttm.getvalue()
+
+def save_rttm(rttm_text, output_folder):
+    """Write the RTTM text to the output folder and return its path"""
     rttm_path = os.path.join(output_folder, Config.DIARIZATION_RTTM_FILENAME)
     with open(rttm_path, "w") as rttm:
-        diarization.write_rttm(rttm)
+        rttm.write(rttm_text)
+    return rttm_path
+
+def build_speaker_audio(audio, speaker_ranges, output_folder, save_audio=None):
+    """Gather each speaker's turns into an AudioBuffer, optionally exporting it
     
-    # Separate speakers
-    audio = AudioSegment.from_wav(audio_path)
-    speaker_segments = {}
-    
-    for turn, _, speaker in diarization.itertracks(yield_label=True):
-        start = turn.start * 1000  # convert to ms
-        end = turn.end * 1000
-        
-        segment_audio = audio[start:end]
-        
-        if speaker not in speaker_segments:
-            speaker_segments[speaker] = segment_audio
-        else:
-            speaker_segments[speaker] += segment_audio
-    
-    # Export separated speaker audio
-    speaker_files = {}
-    for speaker, combined_audio in speaker_segments.items():
-        speaker_file = os.path.join(output_folder, f"speaker_{speaker}.wav")
-        combined_audio.export(speaker_file, format="wav")
-        speaker_files[speaker] = speaker_file
-    
-    return speaker_files, rttm_path
\ No newline at end of file
+    A buffer's path is its exported WAV, or None when it only lives in memory.
+    """
+    if save_audio is None:
+        save_audio = Config.SAVE_INTERMEDIATE_AUDIO
+    
+    speaker_audio = {}
+    for speaker, (starts, ends) in speaker_ranges.items():
+        samples = gather_ranges(audio.samples, starts, ends)
+        combined_audio = AudioBuffer(samples, audio.sample_rate)
+        if save_audio:
+            combined_audio.save(os.path.join(output_folder, f"speaker_{speaker}.wav"))
+        speaker_audio[speaker] = combined_audio
+    
+    return speaker_audio
+
+def perform_diarization(audio, output_folder, diarization_pipeline, save_audio=None):
+    """Step 3: Speaker Diarization
+    
+    `audio` is the AudioBuffer from VAD or a path to decode. Returns a dictionary
+    of speaker label -> AudioBuffer and the RTTM path. Speaker WAVs are only
+    exported when save_audio (default Config.SAVE_INTERMEDIATE_AUDIO) is set.
+    """
+    audio = load_audio_buffer(audio)
+    
+    speaker_ranges, rttm_text = diarize(audio, diarization_pipeline)
+    
+    # Save RTTM file
+    rttm_path = save_rttm(rttm_text, output_folder)
+    
+    # Build separated speaker audio
+    speaker_audio = build_speaker_audio(audio, speaker_ranges, output_folder, save_audio)
+    
+    return speaker_audio, rttm_path
\ No newline at end of file
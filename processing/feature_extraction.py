@@ -0,0 +1,183 @@
+"""
+Feature extraction functions for the Arabic-Audio-Preprocessing-and-Feature-Extraction
+"""
+
+import numpy as np
+import torch
+import torchaudio
+import uuid
+from datetime import datetime
+from functools import lru_cache
+import traceback
+from config.config import Config
+from utils.audio import AudioBuffer
+from utils.audio_reader import get_audio_reader
+from utils.utils import make_record_id
+
+@lru_cache(maxsize=None)
+def get_resampler(orig_sr, target_sr):
+    """Return a cached Resample transform for (orig_sr, target_sr)"""
+    return torchaudio.transforms.Resample(orig_freq=orig_sr, new_freq=target_sr)
+
+@lru_cache(maxsize=None)
+def get_mel_transform(sample_rate, n_fft, win_length, hop_length, n_mels, f_min, f_max, power):
+    """Return a cached MelSpectrogram transform for the given configuration"""
+    return torchaudio.transforms.MelSpectrogram(
+        sample_rate=sample_rate,
+        n_fft=n_fft,
+        win_length=win_length,
+        hop_length=hop_length,
+        n_mels=n_mels,
+        f_min=f_min,
+        f_max=f_max,
+        power=power,
+    )
+
+def load_waveform(audio):
+    """Decode and normalize audio once for all extractors
+    
+    Accepts an AudioBuffer or a file path and returns a (1, num_samples) float32
+    mono tensor at Config.SAMPLE_RATE together with the audio path.
+    """
+    if isinstance(audio, AudioBuffer):
+        waveform, sample_rate, audio_path = audio.as_tensor(), audio.sample_rate, audio.path or ""
+    else:
+        waveform, sample_rate = torch.from_numpy(get_audio_reader().read(audio)).unsqueeze(0), Config.SAMPLE_RATE
+        audio_path = audio
+    
+    waveform = waveform.to(torch.float32)
+    
+    # Convert to mono if stereo
+    if waveform.shape[0] > 1:
+        waveform = waveform.mean(dim=0, keepdim=True)
+    
+    # Resample to 16kHz if needed (pyannote typically expects 16kHz)
+    if sample_rate != Config.SAMPLE_RATE:
+        waveform = get_resampler(sample_rate, Config.SAMPLE_RATE)(waveform)
+    
+    return waveform, audio_path
+
+def compute_embedding_vector(waveform, embedding_inference):
+    """Run the pyannote embedding model on a normalized waveform"""
+    # Create audio dictionary for pyannote
+    audio_dict = {
+        "waveform": waveform,
+        "sample_rate": Config.SAMPLE_RATE
+    }
+    
+    # Extract embeddings using pyannote inference
+    with torch.no_grad():
+        embedding = embedding_inference(audio_dict)
+    
+    # Convert to numpy array
+    if isinstance(embedding, torch.Tensor):
+        embedding_vector = embedding.cpu().numpy()
+    else:
+        embedding_vector = np.array(embedding)
+    
+    # Ensure embedding is 1D
+    if len(embedding_vector.shape) > 1:
+        embedding_vector = embedding_vector.flatten()
+    
+    print(f"✅ Extracted pyannote embedding with shape: {embedding_vector.shape}")
+    return embedding_vector
+
+def compute_logmel_vector(waveform):
+    """Compute the 192D log-mel/delta/delta-delta summary of a normalized waveform"""
+    # Extract Log-Mel features (192D)
+    mel_spec_transform = get_mel_transform(
+        Config.SAMPLE_RATE,
+        Config.N_FFT,
+        int(Config.WIN_LENGTH_RATIO * Config.SAMPLE_RATE),
+        int(Config.HOP_LENGTH_RATIO * Config.SAMPLE_RATE),
+        Config.N_MELS,
+        Config.F_MIN,
+        Config.F_MAX,
+        Config.POWER,
+    )
+    
+    with torch.no_grad():
+        mel_spec = mel_spec_transform(waveform)
+        log_mel_spec = torch.log(mel_spec + 1e-9).squeeze(0)
+        delta = torchaudio.functional.compute_deltas(log_mel_spec)
+        delta2 = torchaudio.functional.compute_deltas(delta)
+        features_all = torch.cat([log_mel_spec, delta, delta2], dim=0)
+        
+        # Normalize
+        mean = features_all.mean(dim=1, keepdim=True)
+        std = features_all.std(dim=1, keepdim=True)
+        features_norm = (features_all - mean) / (std + 1e-9)
+    
+    # Mean over time (192D): mel, delta and delta-delta blocks in order
+    return features_norm.mean(dim=1).cpu().numpy()
+
+def build_embedding_record(embedding_vector, audio_path, audio_name, speaker_id=None):
+    """Wrap an embedding vector in the row format stored in Milvus"""
+    embedding_vector = np.asarray(embedding_vector).flatten()
+    
+    # Prepare embedding data
+    return {
+        "id": str(uuid.uuid4()),
+        "audio_name": audio_name,
+        "speaker_id": speaker_id if speaker_id else "combined",
+        "audio_path": audio_path,
+        "embedding_vector": embedding_vector.tolist(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+def build_logmel_record(logmel_vector, audio_path, audio_name, speaker_id=None):
+    """Wrap a log-mel vector in the row format stored in Milvus"""
+    logmel_vector = np.asarray(logmel_vector).flatten()
+    
+    # Prepare Log-Mel data
+    return {
+        "id": str(uuid.uuid4()),
+        "audio_name": audio_name,
+        "speaker_id": speaker_id if speaker_id else "combined",
+        "audio_path": audio_path,
+        "logmel_vector": logmel_vector.tolist(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+def _build_embedding_data(waveform, audio_path, audio_name, embedding_inference, speaker_id):
+    """Embedding row for a normalized waveform"""
+    embedding_vector = compute_embedding_vector(waveform, embedding_inference)
+    return build_embedding_record(embedding_vector, audio_path, audio_name, speaker_id)
+
+def _build_logmel_data(waveform, audio_path, audio_name, speaker_id):
+    """Log-mel row for a normalized waveform"""
+    logmel_vector = compute_logmel_vector(waveform)
+    return build_logmel_record(logmel_vector, audio_path, audio_name, speaker_id)
+
+def assign_record_id(record, source_hash, source_path):
+    """Give a feature row a primary key derived from its source hash and speaker
+    
+    `source_path` identifies the source across versions of its content (the
+    path relative to the input folder), so rows of an earlier version can be
+    found and replaced.
+    """
+    record["source_hash"] = source_hash
+    record["source_path"] = source_path
+    record["id"] = make_record_id(source_hash, record["speaker_id"])
+    return record
+
+def extract_speaker_embedding(audio, audio_name, embedding_inference, speaker_id=None):
+    """Step 4A: Extract speaker embeddings using native pyannote"""
+    try:
+        waveform, audio_path = load_waveform(audio)
+        return _build_embedding_data(waveform, audio_path, audio_name, embedding_inference, speaker_id)
+    
+    except Exception as e:
+        print(f"❌ Error extracting pyannote embeddings for {audio_name}: {str(e)}")
+        traceback.print_exc()
+        return None
+
+def extract_logmel_features(audio, audio_name, speaker_id=None):
+    """Step 4B: Extract Log-Mel features (kept for comparison)"""
+    try:
+        waveform, audio_path = load_waveform(audio)
+        return _build_logmel_data(waveform, audio_path, audio_name, speaker_id)
+    
+    except Exception as e:
+        print(f"❌ Error extracting log-mel features for {audio_name}: {str(e)}")
+        return None
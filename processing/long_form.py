@@ -0,0 +1,231 @@
+"""
+Bounded-memory processing of long recordings in overlapping blocks
+"""
+
+import os
+import numpy as np
+import soundfile as sf
+import torch
+from processing.denoise import denoise
+from processing.vad import (
+    SEGMENT_DTYPE, compute_speech_probs_batched, detect_speech_segments, get_pre_vad_gate,
+    segments_to_sample_ranges
+)
+from processing.diarization import speaker_sample_ranges
+from processing.feature_extraction import (
+    compute_embedding_vector, compute_logmel_vector, build_embedding_record, build_logmel_record
+)
+from utils.audio_reader import get_audio_reader
+from utils.utils import save_waveform_plot
+from config.config import Config
+
+def is_long_form(audio_path):
+    """Whether a file is long enough for chunked processing (Config.LONG_FORM_MIN_DURATION)"""
+    if not Config.LONG_FORM_MIN_DURATION:
+        return False
+    try:
+        info = sf.info(audio_path)
+    except RuntimeError:
+        return False  # only formats soundfile can stream are processed in blocks
+    return info.frames >= Config.LONG_FORM_MIN_DURATION * info.samplerate
+
+def _frame_aligned(duration):
+    """Number of samples in `duration` seconds, rounded to whole VAD frames"""
+    frame_samples = int(round(Config.FRAME_DURATION * Config.SAMPLE_RATE))
+    return max(1, int(round(duration / Config.FRAME_DURATION))) * frame_samples
+
+def iter_audio_blocks(audio_path, block_samples):
+    """Yield consecutive mono float32 blocks of `block_samples` at Config.SAMPLE_RATE
+    
+    Memory does not grow with the file (see AudioReader.iter_blocks). The
+    last block may be shorter.
+    """
+    return get_audio_reader().iter_blocks(audio_path, block_samples)
+
+def iter_blocks_with_context(blocks, context_samples):
+    """Pair each block with up to `context_samples` of its neighbours on both sides
+    
+    Yields (window, offset, length): the block occupies window[offset:offset + length].
+    Only the previous, current and next blocks are held at a time.
+    """
+    previous = np.zeros(0, dtype=np.float32)
+    blocks = iter(blocks)
+    current = next(blocks, None)
+    
+    while current is not None:
+        following = next(blocks, None)
+        before = previous[max(0, len(previous) - context_samples):] if context_samples else previous[:0]
+        after = following[:context_samples] if following is not None else current[:0]
+        yield np.concatenate([before, current, after]), len(before), len(current)
+        previous, current = current, following
+
+def _gated_block_frames(window, offset, length, frame_samples):
+    """VAD frames of the block the pre-VAD gate keeps, judged on the whole window; and the samples kept"""
+    starts, ends = get_pre_vad_gate().keep_ranges(window, Config.SAMPLE_RATE)
+    starts = np.clip(starts - offset, 0, length)
+    ends = np.clip(ends - offset, 0, length)
+    keep = np.zeros(-(-length // frame_samples), dtype=bool)
+    for start, end in zip(starts // frame_samples, -(-ends // frame_samples)):
+        keep[start:end] = True
+    return keep, int(np.sum(ends - starts))
+
+def denoise_and_detect_speech(audio_path, output_folder, vad_model, device):
+    """Steps 1-2 for a long file: block-wise denoising and VAD, written incrementally
+    
+    Each block is denoised and passed through the VAD model together with
+    Config.LONG_FORM_CONTEXT_DURATION seconds of its neighbours; only the
+    block's own samples and frames are kept, so every stitched frame
+    probability was computed with context on both sides. Denoised audio is
+    streamed to disk, speech segments are detected on the frame
+    probabilities (a few bytes per 20 ms), and the speech regions are then
+    copied block by block into the VAD WAV. Returns (vad_path, segments).
+    
+    With Config.PRE_VAD_ENABLED the pre-VAD gate runs on each window first:
+    blocks it keeps nothing of are neither denoised nor passed to the VAD
+    model (they are written as silence), and frames it cuts get no speech.
+    vad_path is None when the gate kept nothing of the file.
+    """
+    sr = Config.SAMPLE_RATE
+    frame_samples = int(round(Config.FRAME_DURATION * sr))
+    block_samples = _frame_aligned(Config.LONG_FORM_BLOCK_DURATION)
+    context_samples = _frame_aligned(Config.LONG_FORM_CONTEXT_DURATION)
+    
+    denoised_path = os.path.join(output_folder, Config.DENOISED_AUDIO_FILENAME)
+    block_probs = []
+    num_samples = 0
+    num_kept = 0
+    
+    with sf.SoundFile(denoised_path, 'w', samplerate=sr, channels=1, subtype='FLOAT') as denoised_file:
+        blocks = iter_audio_blocks(audio_path, block_samples)
+        for window, offset, length in iter_blocks_with_context(blocks, context_samples):
+            keep, kept = None, length
+            if Config.PRE_VAD_ENABLED:
+                keep, kept = _gated_block_frames(window, offset, length, frame_samples)
+            num_kept += kept
+            
+            if keep is not None and not keep.any():
+                # Nothing to keep in this block: no denoising or VAD, silence in the denoised WAV
+                denoised_block = np.zeros(length, dtype=np.float32)
+                block_probs.append(np.zeros(len(keep), dtype=np.float32))
+            else:
+                denoised_window = denoise(window, sr).astype(np.float32)
+                denoised_block = denoised_window[offset:offset + length]
+                
+                # VAD over the window, keeping only the block's own frames
+                window_probs = compute_speech_probs_batched([denoised_window], vad_model, device, batch_size=1)[0]
+                first_frame = offset // frame_samples
+                probs = window_probs[first_frame:first_frame + -(-length // frame_samples)]
+                if keep is not None:
+                    probs = np.where(keep[:len(probs)], probs, 0.0).astype(np.float32)
+                block_probs.append(probs)
+            
+            # Plots only show the beginning of the recording
+            if num_samples == 0:
+                save_waveform_plot(
+                    window[offset:offset + length], sr, "Original Audio Waveform",
+                    os.path.join(output_folder, Config.ORIGINAL_PLOT_FILENAME)
+                )
+                save_waveform_plot(
+                    denoised_block, sr, "Denoised Audio Waveform",
+                    os.path.join(output_folder, Config.DENOISED_PLOT_FILENAME)
+                )
+            
+            denoised_file.write(denoised_block)
+            num_samples += length
+    
+    if Config.PRE_VAD_ENABLED:
+        get_pre_vad_gate().count_file(num_samples / sr, (num_samples - num_kept) / sr, num_kept == 0)
+        if num_kept == 0:
+            return None, np.zeros(0, dtype=SEGMENT_DTYPE)
+    
+    speech_probs = np.concatenate(block_probs) if block_probs else np.zeros(0, dtype=np.float32)
+    segments = detect_speech_segments(speech_probs, max_duration=num_samples / sr)
+    starts, ends = segments_to_sample_ranges(segments, sr, num_samples)
+    
+    if len(segments) == 0 or not np.any(ends > starts):
+        print(f"⚠️ Warning: No speech detected in audio, using original audio")
+        return denoised_path, segments
+    
+    vad_path = os.path.join(output_folder, Config.VAD_AUDIO_FILENAME)
+    copy_sample_ranges(denoised_path, vad_path, starts, ends, block_samples)
+    
+    with sf.SoundFile(vad_path) as f:
+        preview = f.read(block_samples, dtype='float32')
+    save_waveform_plot(
+        preview, sr, "VAD Processed Audio Waveform", os.path.join(output_folder, Config.VAD_PLOT_FILENAME)
+    )
+    
+    return vad_path, segments
+
+def copy_sample_ranges(source_path, output_path, starts, ends, block_samples=None):
+    """Write the concatenated [start, end) sample ranges of a file to a new WAV
+    
+    Ranges are read in pieces of at most `block_samples` samples.
+    """
+    if block_samples is None:
+        block_samples = _frame_aligned(Config.LONG_FORM_BLOCK_DURATION)
+    
+    with sf.SoundFile(source_path) as source, \
+         sf.SoundFile(output_path, 'w', samplerate=source.samplerate, channels=1, subtype='FLOAT') as output:
+        for start, end in zip(starts, ends):
+            source.seek(int(start))
+            remaining = int(end - start)
+            while remaining > 0:
+                samples = source.read(min(remaining, block_samples), dtype='float32')
+                if len(samples) == 0:
+                    break
+                output.write(samples)
+                remaining -= len(samples)
+    
+    return output_path
+
+def diarize_long_form(vad_path, output_folder, diarization_pipeline):
+    """Step 3 for a long file: diarize from disk and export each speaker's WAV
+    
+    pyannote reads the file lazily when given a path. Returns a dictionary of
+    speaker label -> speaker WAV path and the RTTM path.
+    """
+    diarization = diarization_pipeline(vad_path, num_speakers=2)
+    
+    # Save RTTM file
+    rttm_path = os.path.join(output_folder, Config.DIARIZATION_RTTM_FILENAME)
+    with open(rttm_path, "w") as rttm:
+        diarization.write_rttm(rttm)
+    
+    num_samples = sf.info(vad_path).frames
+    speaker_paths = {}
+    for speaker, (starts, ends) in speaker_sample_ranges(diarization, Config.SAMPLE_RATE, num_samples).items():
+        speaker_path = os.path.join(output_folder, f"speaker_{speaker}.wav")
+        speaker_paths[speaker] = copy_sample_ranges(vad_path, speaker_path, starts, ends)
+    
+    return speaker_paths, rttm_path
+
+def extract_long_form_features(speaker_path, audio_name, embedding_inference, speaker_id=None):
+    """Step 4 for a long speaker track: features averaged over fixed windows
+    
+    The track is read in Config.LONG_FORM_FEATURE_WINDOW second windows; the
+    embedding and log-mel vectors of each window are averaged, weighted by
+    window length. Windows shorter than a second are skipped unless the track
+    has nothing longer. Returns (embedding_data, logmel_data).
+    """
+    window_samples = int(Config.LONG_FORM_FEATURE_WINDOW * Config.SAMPLE_RATE)
+    min_samples = Config.SAMPLE_RATE
+    embeddings, logmels, weights = [], [], []
+    
+    for block in iter_audio_blocks(speaker_path, window_samples):
+        if len(block) < min_samples and weights:
+            continue
+        waveform = torch.from_numpy(np.ascontiguousarray(block)).unsqueeze(0)
+        embeddings.append(compute_embedding_vector(waveform, embedding_inference))
+        logmels.append(compute_logmel_vector(waveform))
+        weights.append(len(block))
+    
+    if not weights:
+        return None, None
+    
+    embedding_vector = np.average(np.stack(embeddings), axis=0, weights=weights)
+    logmel_vector = np.average(np.stack(logmels), axis=0, weights=weights)
+    return (
+        build_embedding_record(embedding_vector, speaker_path, audio_name, speaker_id),
+        build_logmel_record(logmel_vector, speaker_path, audio_name, speaker_id),
+    )
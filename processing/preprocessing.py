@@ -3,34 +3,71 @@ Audio preprocessing functions for the Arabic-Audio-Preprocessing-and-Feature-Ext
 """
 
 import os
-import librosa
-import noisereduce as nr
 import soundfile as sf
+from processing.denoise import denoise
+from processing.vad import trim_non_speech
+from utils.audio_reader import get_audio_reader
+from utils.metrics import stage, record_audio_duration
 from utils.utils import save_waveform_plot
 from config.config import Config
 
-def preprocess_audio(audio_path, output_folder):
-    """Step 1: Audio preprocessing (denoising + resampling)"""
-    # Load audio
-    y, sr = librosa.load(audio_path, sr=Config.SAMPLE_RATE)
+def reduce_noise(y, sr):
+    """Apply noise reduction with Config.DENOISE_BACKEND (picklable, so it can run in a process pool)"""
+    return denoise(y, sr)
+
+def save_preprocessing_outputs(y, y_denoised, sr, output_folder, save_audio=None):
+    """Write the original/denoised plots and, if save_audio is set, WAV copies
+    
+    Returns the denoised WAV path, or None when no WAVs are written.
+    """
+    if save_audio is None:
+        save_audio = Config.SAVE_INTERMEDIATE_AUDIO
     
     # Save original waveform plot
     original_plot_path = os.path.join(output_folder, Config.ORIGINAL_PLOT_FILENAME)
     save_waveform_plot(y, sr, "Original Audio Waveform", original_plot_path)
     
-    # Apply noise reduction
-    y_denoised = nr.reduce_noise(y=y, sr=sr)
-    
     # Save denoised waveform plot
     denoised_plot_path = os.path.join(output_folder, Config.DENOISED_PLOT_FILENAME)
     save_waveform_plot(y_denoised, sr, "Denoised Audio Waveform", denoised_plot_path)
     
-    # Save denoised audio
-    denoised_path = os.path.join(output_folder, Config.DENOISED_AUDIO_FILENAME)
-    sf.write(denoised_path, y_denoised, sr)
+    denoised_path = None
+    if save_audio:
+        # Save denoised audio
+        denoised_path = os.path.join(output_folder, Config.DENOISED_AUDIO_FILENAME)
+        sf.write(denoised_path, y_denoised, sr)
+        
+        # Save original audio copy
+        original_path = os.path.join(output_folder, Config.ORIGINAL_AUDIO_FILENAME)
+        sf.write(original_path, y, sr)
+    
+    return denoised_path
+
+def preprocess_audio(audio_path, output_folder, save_audio=None):
+    """Step 1: Audio preprocessing (pre-VAD gate + denoising + resampling)
+    
+    The denoised samples are returned for the next stage; the WAV copies are only
+    written when save_audio (default Config.SAVE_INTERMEDIATE_AUDIO) is set, in
+    which case denoised_path points at the written file, otherwise it is None.
+    Long non-speech stretches are cut before denoising (see PreVadGate); for a
+    file without speech the samples are empty and no outputs are written.
+    """
+    # Load audio
+    with stage("decode"):
+        y, sr = get_audio_reader().read(audio_path), Config.SAMPLE_RATE
+    record_audio_duration(len(y) / sr)
+    
+    # Cut non-speech before the expensive stages
+    with stage("pre_vad"):
+        y_gated = trim_non_speech(y, sr)
+    if len(y_gated) == 0:
+        return None, y_gated, sr
+    
+    # Apply noise reduction
+    with stage("denoise"):
+        y_denoised = reduce_noise(y_gated, sr)
     
-    # Save original audio copy
-    original_path = os.path.join(output_folder, Config.ORIGINAL_AUDIO_FILENAME)
-    sf.write(original_path, y, sr)
+    with stage("plotting"):
+        denoised_path = save_preprocessing_outputs(y, y_denoised, sr, output_folder, save_audio)
     
-    return denoised_path, y_denoised, sr
\ No newline at end of file
+    return denoised_path, y_denoised, sr
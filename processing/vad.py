@@ -3,77 +3,351 @@ Voice Activity Detection (VAD) processing for the Arabic-Audio-Preprocessing-and
 """
 
 import os
-import librosa
-import soundfile as sf
+import threading
 import numpy as np
 import torch
 import torch.nn.functional as F
+from utils.audio import AudioBuffer, load_audio_buffer, gather_ranges, make_length_buckets
+from utils.metrics import stage
 from utils.utils import save_waveform_plot
 from config.config import Config
 
-def apply_vad(audio_path, output_folder, vad_model, device, 
-              threshold=None, min_speech_duration=None):
-    """Step 2: Voice Activity Detection"""
+# Speech regions in seconds, as returned by detect_speech_segments
+SEGMENT_DTYPE = np.dtype([("start", np.float64), ("end", np.float64)])
+
+def detect_speech_segments(speech_probs, threshold=None, min_speech_duration=None,
+                           frame_duration=None, padding=None, max_duration=None):
+    """Turn frame speech probabilities into padded, merged speech segments
+    
+    Runs above `threshold` shorter than `min_speech_duration` are dropped, the
+    rest are padded by `padding` seconds on both sides, clipped to
+    [0, max_duration] and merged where the padded regions overlap. Everything
+    is done with array operations; the result is a SEGMENT_DTYPE array.
+    """
     if threshold is None:
         threshold = Config.VAD_THRESHOLD
     if min_speech_duration is None:
         min_speech_duration = Config.MIN_SPEECH_DURATION
+    if frame_duration is None:
+        frame_duration = Config.FRAME_DURATION
+    if padding is None:
+        padding = Config.AUDIO_PADDING
     
-    # Load audio
-    y, sr = librosa.load(audio_path, sr=Config.SAMPLE_RATE, mono=True)
+    # Run detection from the rising and falling edges of the speech mask
+    is_speech = np.asarray(speech_probs) > threshold
+    edges = np.diff(np.concatenate(([False], is_speech, [False])).astype(np.int8))
+    start_frames = np.flatnonzero(edges == 1)
+    end_frames = np.flatnonzero(edges == -1)
     
-    # Run VAD
-    signal = torch.tensor(y).unsqueeze(0).to(device)
-    length = torch.tensor([signal.shape[1]]).to(device)
+    # Minimum duration filter
+    keep = (end_frames - start_frames) * frame_duration >= min_speech_duration
+    start_frames, end_frames = start_frames[keep], end_frames[keep]
     
-    with torch.no_grad():
-        logits = vad_model(input_signal=signal, input_signal_length=length)
-        probs = F.softmax(logits, dim=2).cpu().numpy()[0]
-        speech_probs = probs[:, 1]
+    # Padding
+    start_times = np.maximum(start_frames * frame_duration - padding, 0.0)
+    end_times = end_frames * frame_duration + padding
+    if max_duration is not None:
+        end_times = np.minimum(end_times, max_duration)
     
-    # Detect speech segments
-    is_speech = (speech_probs > threshold).astype(bool).tolist()
+    # Merge overlapping padded segments (starts are already sorted)
+    if len(start_times) > 0:
+        running_end = np.maximum.accumulate(end_times)
+        new_group = np.empty(len(start_times), dtype=bool)
+        new_group[0] = True
+        new_group[1:] = start_times[1:] > running_end[:-1]
+        group_starts = np.flatnonzero(new_group)
+        start_times = start_times[group_starts]
+        end_times = np.maximum.reduceat(end_times, group_starts)
     
-    segments = []
-    start = None
+    segments = np.empty(len(start_times), dtype=SEGMENT_DTYPE)
+    segments["start"] = start_times
+    segments["end"] = end_times
+    return segments
+
+def segments_to_sample_ranges(segments, sample_rate, num_samples):
+    """Convert a SEGMENT_DTYPE array to clipped [start, end) sample indices"""
+    starts = np.maximum((segments["start"] * sample_rate).astype(np.int64), 0)
+    ends = np.minimum((segments["end"] * sample_rate).astype(np.int64), num_samples)
+    return starts, ends
+
+class PreVadGate:
+    """Energy and zero-crossing gate run on the decoded audio before denoising
     
-    for i, val in enumerate(is_speech):
-        if val and start is None:
-            start = i
-        elif not val and start is not None:
-            end = i
-            if (end - start) * Config.FRAME_DURATION >= min_speech_duration:
-                segments.append((start, end))
-            start = None
+    Frames of Config.PRE_VAD_FRAME_DURATION are active when their energy is
+    PRE_VAD_ENERGY_THRESHOLD_DB above the file's noise floor (a low percentile
+    of frame energy), or up to PRE_VAD_UNVOICED_MARGIN_DB below that with a
+    high zero-crossing rate (unvoiced consonants). Windows whose energy hardly
+    varies are inactive: hum, tones and steady noise lack the syllable-rate
+    modulation of speech. Inactive stretches of at least PRE_VAD_MIN_SILENCE
+    are cut, keeping PRE_VAD_PADDING around active audio, and a file with less
+    than PRE_VAD_MIN_ACTIVE_DURATION of active audio is rejected whole. It is
+    a coarse, conservative filter; the VAD model still decides what is speech.
+    Seconds removed are totalled per process (see stats). Safe to share
+    between threads.
+    """
     
-    if start is not None:
-        end = len(is_speech)
-        if (end - start) * Config.FRAME_DURATION >= min_speech_duration:
-            segments.append((start, end))
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {"files": 0, "rejected": 0, "input_seconds": 0.0, "removed_seconds": 0.0}
     
-    # Extract speech segments
-    final_audio = []
+    def active_frames(self, y, sr):
+        """(activity per frame, samples per frame); a trailing partial frame is left out"""
+        frame = max(2, int(round(Config.PRE_VAD_FRAME_DURATION * sr)))
+        num_frames = len(y) // frame
+        if num_frames == 0:
+            return np.zeros(0, dtype=bool), frame
+        frames = np.asarray(y[:num_frames * frame], dtype=np.float32).reshape(num_frames, frame)
+        
+        energy_db = 10 * np.log10(np.einsum("ij,ij->i", frames, frames) / frame + 1e-12)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame - 1)
+        
+        noise_floor = np.percentile(energy_db, Config.PRE_VAD_NOISE_PERCENTILE)
+        threshold = max(noise_floor + Config.PRE_VAD_ENERGY_THRESHOLD_DB, Config.PRE_VAD_ABSOLUTE_FLOOR_DB)
+        active = (energy_db >= threshold) | (
+            (energy_db >= threshold - Config.PRE_VAD_UNVOICED_MARGIN_DB) & (zcr >= Config.PRE_VAD_UNVOICED_ZCR)
+        )
+        
+        # Stationary sound: energy spread per window. The remainder shorter than
+        # half a window joins the last window; a window of one frame has no spread to test
+        window = max(2, int(round(Config.PRE_VAD_STATIONARY_WINDOW * sr / frame)))
+        window_starts = np.arange(max(1, int(round(num_frames / window)))) * window
+        window_sizes = np.diff(np.append(window_starts, num_frames))
+        deviation = energy_db - np.repeat(np.add.reduceat(energy_db, window_starts) / window_sizes, window_sizes)
+        spread = np.sqrt(np.add.reduceat(deviation * deviation, window_starts) / window_sizes)
+        modulated = (spread >= Config.PRE_VAD_MIN_MODULATION_DB) | (window_sizes < 2)
+        active &= np.repeat(modulated, window_sizes)
+        return active, frame
+    
+    def keep_ranges(self, y, sr):
+        """[start, end) sample ranges to keep; empty when the file is rejected"""
+        active, frame = self.active_frames(y, sr)
+        num_active = np.count_nonzero(active)
+        if num_active == 0 or num_active * frame / sr < Config.PRE_VAD_MIN_ACTIVE_DURATION:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        num_frames = len(active)
+        
+        edges = np.diff(np.concatenate(([False], active, [False])).astype(np.int8))
+        start_frames = np.flatnonzero(edges == 1)
+        end_frames = np.flatnonzero(edges == -1)
+        
+        # Padding, then merge runs separated by less than PRE_VAD_MIN_SILENCE
+        padding = int(round(Config.PRE_VAD_PADDING * sr / frame))
+        min_gap = int(np.ceil(Config.PRE_VAD_MIN_SILENCE * sr / frame))
+        start_frames = np.maximum(start_frames - padding, 0)
+        end_frames = np.minimum(end_frames + padding, num_frames)
+        running_end = np.maximum.accumulate(end_frames)
+        new_group = np.empty(len(start_frames), dtype=bool)
+        new_group[0] = True
+        new_group[1:] = start_frames[1:] - running_end[:-1] >= min_gap
+        group_starts = np.flatnonzero(new_group)
+        start_frames = start_frames[group_starts]
+        end_frames = np.maximum.reduceat(end_frames, group_starts)
+        
+        # Short silences at the edges of the file are kept as well
+        if start_frames[0] < min_gap:
+            start_frames[0] = 0
+        if num_frames - end_frames[-1] < min_gap:
+            end_frames[-1] = num_frames
+        
+        starts, ends = start_frames * frame, end_frames * frame
+        if end_frames[-1] == num_frames:
+            ends[-1] = len(y)
+        return starts, ends
+    
+    def trim(self, y, sr):
+        """Samples of y with non-speech stretches cut; empty when the file is rejected"""
+        if not Config.PRE_VAD_ENABLED:
+            return y
+        starts, ends = self.keep_ranges(y, sr)
+        kept = y if len(starts) == 1 and starts[0] == 0 and ends[0] == len(y) else gather_ranges(y, starts, ends)
+        self.count_file(len(y) / sr, (len(y) - len(kept)) / sr, len(kept) == 0)
+        return kept
+    
+    def count_file(self, input_seconds, removed_seconds, rejected):
+        """Add one gated file to the totals (trim does this; block-wise callers gate themselves)"""
+        with self._lock:
+            self._totals["files"] += 1
+            self._totals["rejected"] += int(rejected)
+            self._totals["input_seconds"] += input_seconds
+            self._totals["removed_seconds"] += removed_seconds
+    
+    def stats(self):
+        """Totals so far: files gated and rejected, input seconds and seconds removed"""
+        with self._lock:
+            return dict(self._totals)
+    
+    def pop_stats(self):
+        """stats(), resetting the totals"""
+        with self._lock:
+            stats = self._totals
+            self._totals = dict.fromkeys(stats, 0)
+        return stats
+    
+    def merge_stats(self, stats):
+        """Add pop_stats output from another process (a pool worker) to this gate's totals"""
+        with self._lock:
+            for field, value in stats.items():
+                self._totals[field] += value
+    
+    def print_report(self):
+        """Print how much audio the gate kept away from the model stages"""
+        stats = self.stats()
+        if not stats["files"]:
+            return
+        share = stats["removed_seconds"] / stats["input_seconds"] if stats["input_seconds"] else 0.0
+        print(f"\n🔇 Pre-VAD gate: {stats['removed_seconds']:.1f}s of {stats['input_seconds']:.1f}s removed "
+              f"({share:.0%}) before denoising, VAD, diarization and embedding; "
+              f"{stats['rejected']} of {stats['files']} files rejected as non-speech")
+
+# One gate per process, so the seconds saved in a run are collected in one place
+_default_gate = None
+_default_gate_lock = threading.Lock()
+
+def get_pre_vad_gate():
+    """The process-wide PreVadGate, created on first use"""
+    global _default_gate
+    with _default_gate_lock:
+        if _default_gate is None:
+            _default_gate = PreVadGate()
+        return _default_gate
+
+def trim_non_speech(y, sr):
+    """Gate decoded samples with the process-wide PreVadGate (picklable for executors)"""
+    return get_pre_vad_gate().trim(y, sr)
+
+def compute_speech_probs_batched(signals, vad_model, device, batch_size=None,
+                                 max_batch_samples=None, chunk_duration=None):
+    """Run the frame VAD model over many signals in padded, length-bucketed batches
     
-    for start_f, end_f in segments:
-        start_t = max(0, int((start_f * Config.FRAME_DURATION - Config.AUDIO_PADDING) * sr))
-        end_t = min(len(y), int((end_f * Config.FRAME_DURATION + Config.AUDIO_PADDING) * sr))
-        final_audio.extend(y[start_t:end_t])
+    Signals longer than `chunk_duration` seconds are split into fixed-length
+    chunks (a whole number of VAD frames), chunks from all signals are grouped by
+    duration and padded, and each batch is one forward pass with per-item
+    `input_signal_length`. Batches close at `batch_size` items or
+    `max_batch_samples` padded samples, whichever comes first. Returns one array
+    of frame speech probabilities per input signal.
+    """
+    if batch_size is None:
+        batch_size = Config.VAD_BATCH_SIZE
+    if max_batch_samples is None:
+        max_batch_samples = Config.VAD_BATCH_MAX_SAMPLES
+    if chunk_duration is None:
+        chunk_duration = Config.VAD_CHUNK_DURATION
+    batch_size = max(1, batch_size)
     
-    final_audio = np.array(final_audio)
+    frame_samples = int(round(Config.FRAME_DURATION * Config.SAMPLE_RATE))
+    chunk_samples = max(1, int(chunk_duration / Config.FRAME_DURATION)) * frame_samples
+    
+    # Split signals into chunks, remembering where each chunk belongs
+    chunks = []
+    owners = []
+    for signal_index, samples in enumerate(signals):
+        for start in range(0, len(samples), chunk_samples):
+            chunks.append(samples[start:start + chunk_samples])
+            owners.append(signal_index)
+    
+    lengths = np.array([len(chunk) for chunk in chunks], dtype=np.int64)
+    chunk_probs = [None] * len(chunks)
+    
+    for bucket in make_length_buckets(lengths, batch_size, max_batch_samples):
+        max_length = int(lengths[bucket].max())
+        batch = np.zeros((len(bucket), max_length), dtype=np.float32)
+        for row, index in enumerate(bucket):
+            batch[row, :lengths[index]] = chunks[index]
+        
+        signal = torch.from_numpy(batch).to(device)
+        length = torch.from_numpy(lengths[bucket]).to(device)
+        
+        with torch.no_grad():
+            logits = vad_model(input_signal=signal, input_signal_length=length)
+            probs = F.softmax(logits, dim=2)[:, :, 1].cpu().numpy()
+        
+        # Slice each item's valid frames back out using its length
+        num_frames = np.minimum(-(-lengths[bucket] // frame_samples), probs.shape[1])
+        for row, index in enumerate(bucket):
+            chunk_probs[index] = probs[row, :num_frames[row]]
+    
+    # Stitch chunk probabilities back together per signal
+    signal_probs = [[] for _ in signals]
+    for owner, probs in zip(owners, chunk_probs):
+        signal_probs[owner].append(probs)
+    return [
+        np.concatenate(probs) if probs else np.zeros(0, dtype=np.float32)
+        for probs in signal_probs
+    ]
+
+def extract_speech_audio(audio, segments):
+    """Concatenate the speech segments of an AudioBuffer
+    
+    Falls back to `audio` itself when the segments contain no samples.
+    """
+    starts, ends = segments_to_sample_ranges(segments, audio.sample_rate, len(audio))
+    speech = gather_ranges(audio.samples, starts, ends)
+    if len(speech) == 0:
+        return audio
+    return AudioBuffer(speech, audio.sample_rate, path=audio.path)
+
+def apply_vad(audio, output_folder, vad_model, device, 
+              threshold=None, min_speech_duration=None, save_audio=None,
+              speech_probs=None):
+    """Step 2: Voice Activity Detection
+    
+    `audio` is an AudioBuffer from the previous stage or a path to decode.
+    `speech_probs` may carry frame probabilities already computed by
+    compute_speech_probs_batched; otherwise the model runs here, batched over
+    chunks when Config.VAD_BATCH_SIZE is set. Returns (vad_path, vad_audio,
+    segments) where segments is a SEGMENT_DTYPE array of padded speech
+    regions in seconds; vad_path is None unless the speech audio was written
+    to disk (save_audio, default Config.SAVE_INTERMEDIATE_AUDIO).
+    """
+    if threshold is None:
+        threshold = Config.VAD_THRESHOLD
+    if min_speech_duration is None:
+        min_speech_duration = Config.MIN_SPEECH_DURATION
+    if save_audio is None:
+        save_audio = Config.SAVE_INTERMEDIATE_AUDIO
+    
+    # Load audio
+    audio = load_audio_buffer(audio)
+    y, sr = audio.samples, audio.sample_rate
+    
+    # Run VAD
+    if speech_probs is None and Config.VAD_BATCH_SIZE:
+        speech_probs = compute_speech_probs_batched([y], vad_model, device)[0]
+    elif speech_probs is None:
+        signal = audio.as_tensor().to(device)
+        length = torch.tensor([signal.shape[1]]).to(device)
+        
+        with torch.no_grad():
+            logits = vad_model(input_signal=signal, input_signal_length=length)
+            probs = F.softmax(logits, dim=2).cpu().numpy()[0]
+            speech_probs = probs[:, 1]
+    
+    # Detect speech segments
+    segments = detect_speech_segments(
+        speech_probs, threshold, min_speech_duration, max_duration=audio.duration
+    )
+    
+    # Extract speech segments
+    vad_audio = extract_speech_audio(audio, segments)
     
     # Save VAD waveform plot
-    if len(final_audio) > 0:
+    if vad_audio is not audio:
         vad_plot_path = os.path.join(output_folder, Config.VAD_PLOT_FILENAME)
-        save_waveform_plot(final_audio, sr, "VAD Processed Audio Waveform", vad_plot_path)
+        with stage("plotting"):
+            save_waveform_plot(vad_audio.samples, sr, "VAD Processed Audio Waveform", vad_plot_path)
+        
+        vad_path = None
         
         # Save VAD output
-        vad_path = os.path.join(output_folder, Config.VAD_AUDIO_FILENAME)
-        sf.write(vad_path, final_audio, sr)
+        if save_audio:
+            vad_path = vad_audio.save(os.path.join(output_folder, Config.VAD_AUDIO_FILENAME))
     else:
         print(f"⚠️ Warning: No speech detected in audio, using original audio")
-        vad_path = audio_path
+        vad_path = audio.path
         # Create a plot showing no speech detected
         vad_plot_path = os.path.join(output_folder, Config.VAD_PLOT_FILENAME)
-        save_waveform_plot(y, sr, "VAD: No Speech Detected (Original Audio)", vad_plot_path)
+        with stage("plotting"):
+            save_waveform_plot(y, sr, "VAD: No Speech Detected (Original Audio)", vad_plot_path)
     
-    return vad_path
\ No newline at end of file
+    return vad_path, vad_audio, segments
\ No newline at end of file
@@ -21,7 +21,7 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/mohamed5523/Arabic-Audio-Preprocessing-and-Feature-Extraction",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
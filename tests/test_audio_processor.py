@@ -60,6 +60,101 @@ class TestUtils(unittest.TestCase):
         is_valid, message = validate_audio_file("nonexistent.wav")
         self.assertFalse(is_valid)
         self.assertIn("not found", message)
+    
+    def test_find_audio_files_uses_headers_and_manifest(self):
+        """Test header-based discovery, duration ordering and manifest reuse"""
+        import numpy as np
+        import soundfile as sf
+        from utils import discovery
+        
+        os.makedirs(os.path.join(self.test_dir, "sub"))
+        sf.write(os.path.join(self.test_dir, "short.wav"), np.zeros(1600), 16000)
+        sf.write(os.path.join(self.test_dir, "sub", "long.wav"), np.zeros(32000), 16000)
+        with open(os.path.join(self.test_dir, "broken.wav"), "w") as f:
+            f.write("not audio")
+        manifest_path = os.path.join(self.test_dir, "manifest.jsonl")
+        
+        files = find_audio_files(self.test_dir, manifest_path, longest_first=True)
+        self.assertEqual([get_audio_name(path) for path in files], ["long", "short"])
+        
+        # Unchanged files are served from the manifest without probing
+        with patch.object(discovery, 'probe_audio_header', side_effect=AssertionError):
+            self.assertEqual(find_audio_files(self.test_dir, manifest_path, longest_first=True), files)
+        
+        self.assertEqual(find_audio_files(self.test_dir, manifest_path, min_duration=1.0), files[:1])
+
+class TestWaveformPlotting(unittest.TestCase):
+    """Test envelope-based waveform plotting"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_envelope_keeps_extremes(self):
+        """Test that each column holds the min and max of its samples"""
+        import numpy as np
+        from utils.plotting import compute_envelope
+        
+        y = np.zeros(1000, dtype=np.float32)
+        y[5], y[995] = 1.0, -1.0
+        times, mins, maxs = compute_envelope(y, 100, num_points=10)
+        
+        self.assertEqual(len(times), 10)
+        self.assertEqual(maxs[0], 1.0)
+        self.assertEqual(mins[-1], -1.0)
+        self.assertAlmostEqual(float(times[1]), 1.0)
+    
+    def test_lazy_mode_renders_on_demand(self):
+        """Test that lazy mode stores envelopes that render later"""
+        import numpy as np
+        from utils.plotting import WaveformPlotter, render_pending_plots
+        
+        plot_path = os.path.join(self.test_dir, "plot.png")
+        plotter = WaveformPlotter(mode="lazy")
+        plotter.plot(np.random.randn(16000), 16000, "Test", plot_path)
+        self.assertFalse(os.path.exists(plot_path))
+        
+        self.assertEqual(render_pending_plots(self.test_dir), [plot_path])
+        self.assertTrue(os.path.exists(plot_path))
+    
+    def test_background_mode(self):
+        """Test that background plots are written by wait()"""
+        import numpy as np
+        from utils.plotting import WaveformPlotter
+        
+        plot_path = os.path.join(self.test_dir, "plot.png")
+        plotter = WaveformPlotter(mode="background")
+        plotter.plot(np.random.randn(16000), 16000, "Test", plot_path)
+        
+        self.assertEqual(plotter.wait(), 0)
+        self.assertTrue(os.path.exists(plot_path))
+        plotter.close()
+    
+    def test_shared_plotter_created_once(self):
+        """Test that threads asking for the plotter at the same time share one instance"""
+        import threading
+        import time
+        
+        def slow_plotter():
+            time.sleep(0.01)
+            return object()
+        
+        plotters = []
+        with patch('utils.plotting._plotter', None), \
+             patch('utils.plotting.WaveformPlotter', side_effect=slow_plotter) as mock_plotter:
+            from utils.plotting import get_plotter
+            threads = [threading.Thread(target=lambda: plotters.append(get_plotter())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        self.assertEqual(mock_plotter.call_count, 1)
+        self.assertEqual(len({id(plotter) for plotter in plotters}), 1)
 
 class TestFeatureExtraction(unittest.TestCase):
     """Test feature extraction functions"""
@@ -83,33 +178,1629 @@ class TestFeatureExtraction(unittest.TestCase):
         self.assertIsNotNone(features)
         self.assertIn("logmel_vector", features)
 
+class TestAudioReader(unittest.TestCase):
+    """Test the shared audio decode layer"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_soundfile_read_and_blocks(self):
+        """Test block reads, downmixing, resampler presets, streaming blocks and decode timing"""
+        import numpy as np
+        import soundfile as sf
+        from utils.audio_reader import AudioReader
+        
+        t = np.arange(44100 * 2) / 44100
+        tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+        audio_path = os.path.join(self.test_dir, "stereo.wav")
+        sf.write(audio_path, np.stack([tone, tone], axis=1), 44100)
+        
+        with patch.object(Config, "AUDIO_READ_BLOCK_SIZE", 1000):
+            reader = AudioReader()
+            samples = reader.read(audio_path)
+        self.assertEqual(samples.dtype, np.float32)
+        self.assertEqual(len(samples), 32000)
+        self.assertAlmostEqual(float(np.abs(samples[1000:-1000]).max()), 0.5, places=2)
+        
+        fast = AudioReader(resampler="fast").read(audio_path)
+        self.assertLess(float(np.abs(fast - samples)[1000:-1000].max()), 0.05)
+        with self.assertRaises(ValueError):
+            AudioReader(resampler="unknown")
+        
+        blocks = list(reader.iter_blocks(audio_path, 5000))
+        self.assertEqual([len(block) for block in blocks[:-1]], [5000] * (len(blocks) - 1))
+        np.testing.assert_allclose(np.concatenate(blocks), samples, atol=1e-3)
+        
+        self.assertEqual(reader.decode_stats()["soundfile"]["files"], 1)
+        self.assertAlmostEqual(reader.decode_stats()["soundfile"]["duration"], 2.0)
+        self.assertEqual(reader.decode_times[-1]["path"], audio_path)
+    
+    @patch('utils.audio_reader.subprocess.run')
+    def test_compressed_formats_use_one_ffmpeg_pipe(self, mock_run):
+        """Test that compressed audio is decoded, downmixed and resampled by ffmpeg"""
+        import numpy as np
+        from utils.audio_reader import AudioReader
+        
+        mock_run.return_value = Mock(returncode=0, stdout=np.full(16000, 0.25, dtype=np.float32).tobytes())
+        reader = AudioReader(resampler="high_quality")
+        reader.ffmpeg = "/usr/bin/ffmpeg"
+        
+        samples = reader.read("/data/call.mp3")
+        self.assertEqual(len(samples), 16000)
+        self.assertEqual(samples[0], 0.25)
+        command = mock_run.call_args[0][0]
+        self.assertEqual(command[0], "/usr/bin/ffmpeg")
+        self.assertEqual(command[command.index("-ac") + 1], "1")
+        self.assertTrue(command[command.index("-af") + 1].startswith("aresample=16000:filter_size=64"))
+        self.assertEqual(reader.decode_stats()["ffmpeg"]["files"], 1)
+        
+        mock_run.return_value = Mock(returncode=1, stdout=b"", stderr=b"Invalid data")
+        with self.assertRaises(RuntimeError):
+            reader.read("/data/broken.mp3")
+
+class TestDenoiseBackends(unittest.TestCase):
+    """Test the noise reduction backends against noisereduce"""
+    
+    def test_spectral_gate_matches_noisereduce(self):
+        """Test that the vectorized gate reproduces noisereduce's default output"""
+        from processing.denoise import denoise, snr_db, synthetic_noisy_speech
+        
+        noisy, _ = synthetic_noisy_speech(5.0)
+        reference = denoise(noisy, Config.SAMPLE_RATE, "noisereduce")
+        denoised = denoise(noisy, Config.SAMPLE_RATE, "spectral_gate")
+        self.assertEqual(denoised.shape, noisy.shape)
+        self.assertGreater(snr_db(reference, denoised), 40)
+        
+        with self.assertRaises(ValueError):
+            denoise(noisy, Config.SAMPLE_RATE, "unknown")
+    
+    @patch.object(Config, "DENOISE_BLOCK_DURATION", 2.0)
+    @patch.object(Config, "DENOISE_BLOCK_OVERLAP", 0.5)
+    def test_block_parallel_crossfades_blocks(self):
+        """Test that blocks are denoised in threads and joined without gaps or seams"""
+        import numpy as np
+        from processing.denoise import block_parallel_gate, spectral_gate, snr_db, synthetic_noisy_speech, benchmark_denoise
+        
+        noisy, clean = synthetic_noisy_speech(7.3)
+        denoised = block_parallel_gate(noisy, Config.SAMPLE_RATE, workers=3)
+        self.assertEqual(denoised.shape, noisy.shape)
+        self.assertGreater(snr_db(spectral_gate(noisy, Config.SAMPLE_RATE), denoised), 25)
+        
+        # A constant gain passes through the crossfades unchanged
+        ones = np.ones(len(noisy), dtype=np.float32)
+        with patch('processing.denoise.spectral_gate', side_effect=lambda y, sr: y.copy()):
+            np.testing.assert_allclose(block_parallel_gate(ones, Config.SAMPLE_RATE, workers=2), ones, rtol=1e-6)
+        
+        results = benchmark_denoise(noisy, Config.SAMPLE_RATE, clean, repeats=1)
+        self.assertEqual([result["backend"] for result in results], ["noisereduce", "spectral_gate", "block_parallel"])
+        self.assertTrue(all(result["seconds"] > 0 and result["output_snr_db"] is not None for result in results))
+
+class FakeTurn:
+    """Minimal stand-in for a pyannote Segment"""
+    
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+class FakeDiarization:
+    """Minimal stand-in for a pyannote Annotation"""
+    
+    def __init__(self, tracks):
+        self.tracks = tracks
+    
+    def itertracks(self, yield_label=False):
+        for start, end, speaker in self.tracks:
+            yield FakeTurn(start, end), None, speaker
+    
+    def write_rttm(self, file):
+        for start, end, speaker in self.tracks:
+            file.write(f"SPEAKER audio 1 {start:.3f} {end - start:.3f} <NA> <NA> {speaker} <NA> <NA>\n")
+
+class TestInMemoryStages(unittest.TestCase):
+    """Test in-memory audio handoff between stages"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_audio_buffer_tensor_shares_memory(self):
+        """Test that the torch view does not copy the samples"""
+        import numpy as np
+        from utils.audio import AudioBuffer
+        
+        buffer = AudioBuffer(np.zeros(1600, dtype=np.float32))
+        tensor = buffer.as_tensor()
+        tensor[0, 0] = 1.0
+        self.assertEqual(buffer.samples[0], 1.0)
+        self.assertEqual(tuple(tensor.shape), (1, 1600))
+        self.assertAlmostEqual(buffer.duration, 0.1)
+    
+    def test_diarization_without_export(self):
+        """Test speaker separation from an in-memory buffer"""
+        import numpy as np
+        from utils.audio import AudioBuffer
+        from processing.diarization import perform_diarization
+        
+        sr = Config.SAMPLE_RATE
+        buffer = AudioBuffer(np.arange(3 * sr, dtype=np.float32), sr, path="source.wav")
+        pipeline = Mock(return_value=FakeDiarization([
+            (0.0, 1.0, "SPEAKER_00"), (1.0, 2.0, "SPEAKER_01"), (2.0, 3.0, "SPEAKER_00")
+        ]))
+        
+        speaker_audio, rttm_path = perform_diarization(buffer, self.test_dir, pipeline, save_audio=False)
+        
+        self.assertTrue(os.path.exists(rttm_path))
+        self.assertEqual(sorted(os.listdir(self.test_dir)), [Config.DIARIZATION_RTTM_FILENAME])
+        self.assertEqual(len(speaker_audio["SPEAKER_00"]), 2 * sr)
+        self.assertEqual(speaker_audio["SPEAKER_00"].samples[sr], 2 * sr)
+        self.assertIsNone(speaker_audio["SPEAKER_01"].path)
+        
+        speaker_audio, _ = perform_diarization(buffer, self.test_dir, pipeline, save_audio=True)
+        self.assertEqual(speaker_audio["SPEAKER_01"].path, os.path.join(self.test_dir, "speaker_SPEAKER_01.wav"))
+    
+    def test_speaker_sample_ranges(self):
+        """Test grouping of interleaved turns into clipped per-speaker ranges"""
+        import numpy as np
+        from processing.diarization import speaker_sample_ranges
+        
+        diarization = FakeDiarization([
+            (0.0, 0.5, "B"), (0.5, 1.0, "A"), (1.0, 1.5, "B"), (1.5, 9.0, "A")
+        ])
+        ranges = speaker_sample_ranges(diarization, 10, 15)
+        
+        np.testing.assert_array_equal(ranges["A"][0], [5, 15])
+        np.testing.assert_array_equal(ranges["A"][1], [10, 15])
+        np.testing.assert_array_equal(ranges["B"][0], [0, 10])
+        np.testing.assert_array_equal(ranges["B"][1], [5, 15])
+        self.assertEqual(speaker_sample_ranges(FakeDiarization([]), 10, 15), {})
+    
+    def test_logmel_from_buffer(self):
+        """Test log-mel extraction without decoding a file"""
+        import numpy as np
+        from utils.audio import AudioBuffer
+        
+        rng = np.random.default_rng(0)
+        buffer = AudioBuffer(rng.standard_normal(Config.SAMPLE_RATE), path="speaker.wav")
+        features = extract_logmel_features(buffer, "test_audio", "SPEAKER_00")
+        
+        self.assertIsNotNone(features)
+        self.assertEqual(len(features["logmel_vector"]), Config.LOGMEL_DIM)
+        self.assertEqual(features["audio_path"], "speaker.wav")
+    
+    def test_embedding_resamples_with_cached_transform(self):
+        """Test that speaker audio is resampled to the model rate with a cached resampler"""
+        import numpy as np
+        from utils.audio import AudioBuffer
+        from processing.feature_extraction import extract_speaker_embedding, get_resampler
+        
+        rng = np.random.default_rng(0)
+        buffer = AudioBuffer(rng.standard_normal(8000), sample_rate=8000)
+        inference = Mock(return_value=np.ones((1, Config.EMBEDDING_DIM)))
+        
+        embedding_data = extract_speaker_embedding(buffer, "test_audio", inference, "SPEAKER_00")
+        
+        waveform = inference.call_args[0][0]["waveform"]
+        self.assertEqual(tuple(waveform.shape), (1, Config.SAMPLE_RATE))
+        self.assertEqual(len(embedding_data["embedding_vector"]), Config.EMBEDDING_DIM)
+        self.assertIs(get_resampler(8000, Config.SAMPLE_RATE), get_resampler(8000, Config.SAMPLE_RATE))
+    
+    def test_speaker_file_is_decoded_once(self):
+        """Test that a speaker given as a path is decoded once for embedding and log-mel features"""
+        import numpy as np
+        import soundfile as sf
+        from core.pipeline import extract_speaker_features
+        from utils.audio_reader import AudioReader
+        
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        speaker_path = os.path.join(test_dir, "speaker.wav")
+        sf.write(speaker_path, np.random.default_rng(0).standard_normal(Config.SAMPLE_RATE) * 0.1, Config.SAMPLE_RATE)
+        model_manager = Mock()
+        model_manager.get_embedding_inference.return_value = Mock(return_value=np.ones((1, Config.EMBEDDING_DIM)))
+        
+        with patch.object(AudioReader, "read", autospec=True, side_effect=AudioReader.read) as mock_read:
+            [(embedding_data, logmel_data)] = extract_speaker_features(
+                {"SPEAKER_00": speaker_path}, "test_audio", model_manager
+            )
+        self.assertEqual(mock_read.call_count, 1)
+        self.assertEqual(len(embedding_data["embedding_vector"]), Config.EMBEDDING_DIM)
+        self.assertEqual(len(logmel_data["logmel_vector"]), Config.LOGMEL_DIM)
+
+class TestVADSegmentation(unittest.TestCase):
+    """Test vectorized VAD segmentation"""
+    
+    def test_detect_speech_segments(self):
+        """Test run detection, minimum duration filtering, padding and merging"""
+        import numpy as np
+        from processing.vad import detect_speech_segments
+        
+        probs = np.zeros(100)
+        probs[10:20] = 1.0   # 0.2s run
+        probs[25:35] = 1.0   # 0.2s run, overlaps the first once padded
+        probs[50:52] = 1.0   # 0.04s run, below minimum duration
+        probs[90:100] = 1.0  # run that reaches the end of the signal
+        
+        segments = detect_speech_segments(
+            probs, threshold=0.5, min_speech_duration=0.15,
+            frame_duration=0.02, padding=0.1, max_duration=2.0
+        )
+        
+        self.assertEqual(segments.dtype.names, ("start", "end"))
+        np.testing.assert_allclose(segments["start"], [0.1, 1.7])
+        np.testing.assert_allclose(segments["end"], [0.8, 2.0])
+    
+    def test_gather_ranges(self):
+        """Test that speech audio is gathered in order"""
+        import numpy as np
+        from utils.audio import gather_ranges
+        
+        samples = np.arange(10, dtype=np.float32)
+        gathered = gather_ranges(samples, np.array([1, 6]), np.array([3, 9]))
+        np.testing.assert_array_equal(gathered, [1, 2, 6, 7, 8])
+        self.assertEqual(len(gather_ranges(samples, np.array([]), np.array([]))), 0)
+    
+    @patch('processing.vad.save_waveform_plot')
+    def test_apply_vad_in_memory(self, mock_plot):
+        """Test apply_vad with a stand-in frame classifier"""
+        import numpy as np
+        import torch
+        from utils.audio import AudioBuffer
+        from processing.vad import apply_vad
+        
+        sr = Config.SAMPLE_RATE
+        buffer = AudioBuffer(np.ones(2 * sr, dtype=np.float32))
+        
+        def vad_model(input_signal, input_signal_length):
+            logits = torch.zeros(1, 100, 2)
+            logits[0, 40:60, 1] = 20.0
+            return logits
+        
+        vad_path, vad_audio, segments = apply_vad(
+            buffer, tempfile.gettempdir(), vad_model, "cpu", threshold=0.5, save_audio=False
+        )
+        
+        self.assertIsNone(vad_path)
+        self.assertEqual(len(segments), 1)
+        self.assertEqual(len(vad_audio), int(0.6 * sr))
+
+class TestBatchedVAD(unittest.TestCase):
+    """Test length-bucketed batched VAD inference"""
+    
+    @staticmethod
+    def frame_vad_model(input_signal, input_signal_length):
+        """Stand-in frame classifier: speech where the 20ms frame mean is positive"""
+        import torch
+        frames = input_signal.reshape(input_signal.shape[0], -1, 320).mean(dim=-1)
+        return torch.stack([-frames, frames], dim=-1) * 50
+    
+    def test_batched_probs_match_per_signal(self):
+        """Test that chunked, padded batches slice back to each signal's frames"""
+        import numpy as np
+        from processing.vad import compute_speech_probs_batched
+        
+        rng = np.random.default_rng(0)
+        signals = [
+            np.repeat(rng.choice([-1.0, 1.0], size=n), 320).astype(np.float32)
+            for n in (50, 230, 120)
+        ]
+        
+        probs = compute_speech_probs_batched(
+            signals, self.frame_vad_model, "cpu", batch_size=4,
+            max_batch_samples=320 * 300, chunk_duration=1.0
+        )
+        
+        self.assertEqual([len(p) for p in probs], [50, 230, 120])
+        for signal, signal_probs in zip(signals, probs):
+            expected = signal.reshape(-1, 320).mean(axis=1) > 0
+            np.testing.assert_array_equal(signal_probs > 0.5, expected)
+
+class TestPreVadGate(unittest.TestCase):
+    """Test the energy/zero-crossing gate run before denoising"""
+    
+    def setUp(self):
+        """Set up test signals"""
+        import numpy as np
+        from benchmarks.synthetic import synthesize_conversation
+        
+        self.sr = Config.SAMPLE_RATE
+        self.speech, _ = synthesize_conversation(20, seed=3)
+        self.noise = (0.01 * np.random.default_rng(1).standard_normal(self.sr * 10)).astype(np.float32)
+    
+    def test_non_speech_files_are_rejected(self):
+        """Test that background noise, digital silence and a steady tone come back empty"""
+        import numpy as np
+        from processing.vad import PreVadGate
+        
+        gate = PreVadGate()
+        t = np.arange(self.sr * 10) / self.sr
+        tone = (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32) + self.noise
+        for samples in (self.noise, np.zeros(self.sr * 5, dtype=np.float32), tone):
+            self.assertEqual(len(gate.trim(samples, self.sr)), 0)
+        self.assertEqual(gate.stats()["rejected"], 3)
+    
+    def test_long_silence_is_cut_and_speech_kept(self):
+        """Test that a long pause is trimmed to the padding while the speech around it stays"""
+        import numpy as np
+        from processing.vad import PreVadGate
+        
+        gate = PreVadGate()
+        samples = np.concatenate([self.speech, self.noise, self.speech])
+        kept = gate.trim(samples, self.sr)
+        
+        speech_only = len(gate.trim(self.speech, self.sr))
+        self.assertGreater(speech_only, 0.9 * len(self.speech))
+        self.assertLess(len(kept), len(samples) - 8 * self.sr)
+        self.assertGreater(len(kept), 1.9 * speech_only)
+        
+        stats = gate.stats()
+        self.assertEqual((stats["files"], stats["rejected"]), (2, 0))
+        removed = (len(samples) - len(kept) + len(self.speech) - speech_only) / self.sr
+        self.assertAlmostEqual(stats["removed_seconds"], removed)
+    
+    @patch.object(Config, "PRE_VAD_MIN_ACTIVE_DURATION", 0.0)
+    def test_nothing_active_without_a_minimum(self):
+        """Test that a file with no active frame is rejected even when any active audio would do"""
+        import numpy as np
+        from processing.vad import PreVadGate
+        
+        self.assertEqual(len(PreVadGate().trim(np.zeros(self.sr * 5, dtype=np.float32), self.sr)), 0)
+    
+    def test_last_frame_is_tested_with_its_window(self):
+        """Test that a lone frame after the last full window is not cut as stationary"""
+        from processing.vad import PreVadGate
+        
+        gate = PreVadGate()
+        active, frame = gate.active_frames(self.speech, self.sr)
+        window = int(round(Config.PRE_VAD_STATIONARY_WINDOW * self.sr / frame))
+        loud = [index for index in range(5 * window, len(active)) if active[index]][0]
+        
+        # Five full windows and one more frame, ending on a frame that is active in context
+        samples = self.speech[(loud - 5 * window) * frame:(loud + 1) * frame]
+        active, _ = gate.active_frames(samples, self.sr)
+        self.assertEqual(len(active), 5 * window + 1)
+        self.assertTrue(active[-1])
+    
+    @patch.object(Config, "PRE_VAD_ENABLED", False)
+    def test_disabled_gate_passes_audio_through(self):
+        """Test that the gate can be switched off"""
+        from processing.vad import PreVadGate
+        
+        gate = PreVadGate()
+        self.assertIs(gate.trim(self.noise, self.sr), self.noise)
+        self.assertEqual(gate.stats()["files"], 0)
+    
+    def test_rejected_file_skips_denoise_and_models(self):
+        """Test that a silent file is not denoised and yields no speakers"""
+        import numpy as np
+        import soundfile as sf
+        from core.pipeline import denoise_audio, segment_denoised_audio
+        
+        input_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, input_dir)
+        audio_path = os.path.join(input_dir, "music_break.wav")
+        sf.write(audio_path, self.noise, self.sr)
+        
+        with patch('processing.preprocessing.reduce_noise') as mock_denoise:
+            audio_output_folder, denoised_audio = denoise_audio(audio_path, input_dir, os.path.join(input_dir, "out"))
+        mock_denoise.assert_not_called()
+        self.assertEqual(len(denoised_audio), 0)
+        self.assertEqual(segment_denoised_audio(denoised_audio, audio_output_folder, Mock()), {})
+
+class TestLongForm(unittest.TestCase):
+    """Test block-wise processing of long recordings"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_blocks_are_resampled_seamlessly(self):
+        """Test fixed-size 16 kHz blocks and neighbour context from a 44.1 kHz file"""
+        import numpy as np
+        import soundfile as sf
+        from processing.long_form import iter_audio_blocks, iter_blocks_with_context
+        
+        audio_path = os.path.join(self.test_dir, "long.wav")
+        sf.write(audio_path, np.zeros((int(2.5 * 44100), 2)), 44100)
+        
+        blocks = list(iter_audio_blocks(audio_path, 16000))
+        self.assertEqual([len(block) for block in blocks[:-1]], [16000, 16000])
+        self.assertAlmostEqual(sum(len(block) for block in blocks), 40000, delta=2)
+        
+        windows = list(iter_blocks_with_context([np.arange(10), np.arange(10, 20), np.arange(20, 25)], 3))
+        window, offset, length = windows[1]
+        np.testing.assert_array_equal(window, np.arange(7, 23))
+        self.assertEqual((offset, length), (3, 10))
+        self.assertEqual(windows[2][1:], (3, 5))
+    
+    @patch('processing.long_form.save_waveform_plot')
+    @patch('processing.long_form.denoise', side_effect=lambda y, sr: y)
+    def test_vad_probabilities_are_stitched_across_blocks(self, mock_denoise, mock_plot):
+        """Test that speech spanning several blocks comes out as one segment"""
+        import numpy as np
+        import soundfile as sf
+        from processing.long_form import denoise_and_detect_speech
+        
+        sr = Config.SAMPLE_RATE
+        y = np.full(3 * sr, -0.5, dtype=np.float32)
+        y[sr:2 * sr] = 0.5
+        audio_path = os.path.join(self.test_dir, "long.wav")
+        sf.write(audio_path, y, sr, subtype='FLOAT')
+        
+        # The square wave is steady sound to the pre-VAD gate, so it is switched off here
+        with patch.object(Config, 'LONG_FORM_BLOCK_DURATION', 0.6), \
+             patch.object(Config, 'LONG_FORM_CONTEXT_DURATION', 0.2), \
+             patch.object(Config, 'PRE_VAD_ENABLED', False):
+            vad_path, segments = denoise_and_detect_speech(
+                audio_path, self.test_dir, TestBatchedVAD.frame_vad_model, "cpu"
+            )
+        
+        self.assertEqual(len(segments), 1)
+        self.assertAlmostEqual(segments["start"][0], 1.0 - Config.AUDIO_PADDING)
+        self.assertAlmostEqual(segments["end"][0], 2.0 + Config.AUDIO_PADDING)
+        self.assertEqual(sf.info(vad_path).frames, int(round((1.0 + 2 * Config.AUDIO_PADDING) * sr)))
+    
+    @patch('processing.long_form.save_waveform_plot')
+    @patch('processing.long_form.denoise', side_effect=lambda y, sr: y)
+    def test_gated_blocks_skip_denoise_and_vad(self, mock_denoise, mock_plot):
+        """Test that blocks of background noise are not denoised and a file of noise is rejected"""
+        import numpy as np
+        import soundfile as sf
+        from benchmarks.synthetic import synthesize_conversation
+        from processing.long_form import denoise_and_detect_speech
+        from processing.vad import PreVadGate
+        
+        sr = Config.SAMPLE_RATE
+        speech, _ = synthesize_conversation(20, seed=3)
+        noise = (0.01 * np.random.default_rng(1).standard_normal(40 * sr)).astype(np.float32)
+        gate = PreVadGate()
+        
+        for name, samples in (("pause", np.concatenate([speech, noise, speech])), ("noise", noise)):
+            audio_path = os.path.join(self.test_dir, f"{name}.wav")
+            sf.write(audio_path, samples, sr, subtype='FLOAT')
+            mock_denoise.reset_mock()
+            with patch.object(Config, 'LONG_FORM_BLOCK_DURATION', 10.0), \
+                 patch.object(Config, 'LONG_FORM_CONTEXT_DURATION', 1.0), \
+                 patch('processing.long_form.get_pre_vad_gate', return_value=gate):
+                vad_path, segments = denoise_and_detect_speech(
+                    audio_path, self.test_dir, TestBatchedVAD.frame_vad_model, "cpu"
+                )
+            
+            if name == "pause":
+                self.assertLessEqual(mock_denoise.call_count, 6)  # of 8 blocks
+                self.assertIsNotNone(vad_path)
+                self.assertGreater(gate.stats()["removed_seconds"], 20.0)
+            else:
+                mock_denoise.assert_not_called()
+                self.assertIsNone(vad_path)
+                self.assertEqual(len(segments), 0)
+        self.assertEqual((gate.stats()["files"], gate.stats()["rejected"]), (2, 1))
+
+class TestStreaming(unittest.TestCase):
+    """Test incremental streaming ingestion"""
+    
+    def test_segments_match_offline_vad_and_close_early(self):
+        """Test that streamed segments equal offline VAD and are emitted before the stream ends"""
+        import numpy as np
+        import torch
+        from core.streaming import StreamingSession
+        from processing.vad import compute_speech_probs_batched, detect_speech_segments
+        
+        sr = Config.SAMPLE_RATE
+        levels = [(-0.5, 2.0), (0.5, 1.0), (-0.5, 2.0), (0.5, 0.5), (-0.5, 1.0)]
+        y = np.concatenate([np.full(int(duration * sr), level, dtype=np.float32) for level, duration in levels])
+        
+        model_manager = Mock()
+        model_manager.get_vad_model.return_value = TestBatchedVAD.frame_vad_model
+        model_manager.get_device.return_value = "cpu"
+        model_manager.get_embedding_inference.return_value = Mock(return_value=torch.ones(1, 512))
+        vector_store = Mock()
+        
+        session = StreamingSession(model_manager, vector_store, "call-1")
+        segments = []
+        emitted_at = []
+        for position in range(0, len(y), 1600):
+            for segment in session.push((y[position:position + 1600] * 32767).astype(np.int16).tobytes()):
+                segments.append(segment)
+                emitted_at.append((position + 1600) / sr)
+        segments += session.push(b"") + session.close()
+        
+        probs = compute_speech_probs_batched([y], TestBatchedVAD.frame_vad_model, "cpu", batch_size=1)[0]
+        expected = detect_speech_segments(probs, max_duration=len(y) / sr)
+        
+        np.testing.assert_allclose([segment["start"] for segment in segments], expected["start"])
+        np.testing.assert_allclose([segment["end"] for segment in segments], expected["end"])
+        self.assertLess(emitted_at[0], 4.0)
+        self.assertEqual(vector_store.insert_data.call_count, len(expected))
+        
+        first = vector_store.insert_data.call_args_list[0][0][0]
+        self.assertEqual(first["speaker_id"], "segment_000000")
+        self.assertEqual(len(first["embedding_vector"]), 512)
+        
+        report = session.latency_report()
+        self.assertEqual(report["chunks"], len(y) // 1600 + 1)
+        self.assertIn("p95_ms", report)
+    
+    def test_stream_boundaries_match_offline(self):
+        """Test exact segment boundaries for chunks that split frames"""
+        import numpy as np
+        import torch
+        from core.streaming import StreamingSession
+        
+        sr = Config.SAMPLE_RATE
+        y = np.full(4 * sr, -0.5, dtype=np.float32)
+        y[sr:2 * sr] = 0.5
+        
+        model_manager = Mock()
+        model_manager.get_vad_model.return_value = TestBatchedVAD.frame_vad_model
+        model_manager.get_device.return_value = "cpu"
+        model_manager.get_embedding_inference.return_value = Mock(return_value=torch.ones(1, 512))
+        
+        session = StreamingSession(model_manager, Mock(), "call-2")
+        segments = session.ingest(y[position:position + 960] for position in range(0, len(y), 960))
+        
+        self.assertEqual(len(segments), 1)
+        self.assertAlmostEqual(segments[0]["start"], 1.0 - Config.AUDIO_PADDING)
+        self.assertAlmostEqual(segments[0]["end"], 2.0 + Config.AUDIO_PADDING)
+
+class TestBatchedEmbedding(unittest.TestCase):
+    """Test cross-file batched embedding inference"""
+    
+    def test_length_buckets(self):
+        """Test that buckets are sorted by length and respect both limits"""
+        from utils.audio import make_length_buckets
+        
+        buckets = make_length_buckets([50, 10, 40, 20, 30], batch_size=2)
+        self.assertEqual([list(b) for b in buckets], [[1, 3], [4, 2], [0]])
+        
+        buckets = make_length_buckets([10, 10, 10, 100], batch_size=8, max_batch_samples=100)
+        self.assertEqual([list(b) for b in buckets], [[0, 1, 2], [3]])
+    
+    def test_batched_embeddings_ignore_padding(self):
+        """Test that results map back to their keys and padding is masked"""
+        import numpy as np
+        import torch
+        from utils.audio import AudioBuffer
+        from processing.batched_embedding import extract_embeddings_batched
+        
+        class WeightedMean(torch.nn.Module):
+            def forward(self, waveforms, weights=None):
+                weights = weights.unsqueeze(1)
+                return (waveforms * weights).sum(dim=-1) / weights.sum(dim=-1)
+        
+        inference = Mock(model=WeightedMean(), device=torch.device("cpu"))
+        items = [
+            (("a", "SPEAKER_00"), AudioBuffer(np.full(100, 1.0))),
+            (("a", "SPEAKER_01"), AudioBuffer(np.full(300, 2.0))),
+            (("b", "SPEAKER_00"), AudioBuffer(np.full(200, 3.0))),
+        ]
+        
+        embeddings = extract_embeddings_batched(items, inference, batch_size=3, max_batch_samples=0)
+        
+        self.assertAlmostEqual(float(embeddings[("a", "SPEAKER_00")][0]), 1.0)
+        self.assertAlmostEqual(float(embeddings[("a", "SPEAKER_01")][0]), 2.0)
+        self.assertAlmostEqual(float(embeddings[("b", "SPEAKER_00")][0]), 3.0)
+    
+    def test_batched_stages_are_recorded_per_file(self):
+        """Test that each file of a batch gets its embedding and log-mel stages, the batch split by samples"""
+        import time
+        import numpy as np
+        import torch
+        from core.pipeline import extract_features_batched
+        from utils.audio import AudioBuffer
+        from utils.metrics import FileMetrics, shared_stage
+        
+        class Mean(torch.nn.Module):
+            def forward(self, waveforms, weights=None):
+                return waveforms.mean(dim=-1).repeat(1, Config.EMBEDDING_DIM)
+        
+        inference = Mock(model=Mean(), device=torch.device("cpu"))
+        rng = np.random.default_rng(0)
+        segmented_files = [
+            (audio_path, "out", {"SPEAKER_00": AudioBuffer(rng.standard_normal(length))})
+            for audio_path, length in (("a.wav", 8000), ("b.wav", 24000))
+        ]
+        file_metrics = {audio_path: FileMetrics(audio_path) for audio_path, _, _ in segmented_files}
+        
+        results = extract_features_batched(segmented_files, inference, batch_size=2, file_metrics=file_metrics)
+        self.assertEqual([len(features) for _, _, features in results], [1, 1])
+        for metrics in file_metrics.values():
+            self.assertEqual(sorted(metrics.stages), ["embedding", "logmel"])
+            self.assertGreater(metrics.wall_seconds, 0.0)
+        
+        shares = [(FileMetrics("a.wav"), 1), (FileMetrics("b.wav"), 3)]
+        with shared_stage("vad", shares):
+            time.sleep(0.02)
+        (first, _), (second, _) = shares
+        self.assertAlmostEqual(second.stages["vad"]["wall_seconds"], 3 * first.stages["vad"]["wall_seconds"])
+        self.assertEqual(second.wall_seconds, second.stages["vad"]["wall_seconds"])
+
+class FakeCollection:
+    """In-memory stand-in for a pymilvus Collection recording column inserts"""
+    
+    def __init__(self, failures=0):
+        self.inserts = []
+        self.failures = failures
+    
+    def insert(self, data):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("transient")
+        self.inserts.append(data)
+
+def make_rows(count, dim, vector_field):
+    """Build feature rows in the format produced by the extractors"""
+    return [
+        {"id": str(i), "audio_name": "audio", "speaker_id": "SPEAKER_00",
+         "audio_path": "audio.wav", vector_field: [0.5] * dim, "timestamp": "now"}
+        for i in range(count)
+    ]
+
+class TestBulkWriter(unittest.TestCase):
+    """Test the buffered columnar Milvus writer"""
+    
+    FIELDS = ["id", "audio_name", "speaker_id", "audio_path", "{vector}", "timestamp"]
+    
+    def make_writer(self, embedding_collection, logmel_collection, **kwargs):
+        from database.bulk_writer import MilvusBulkWriter
+        
+        embedding_fields = [f.format(vector="embedding_vector") for f in self.FIELDS]
+        logmel_fields = [f.format(vector="logmel_vector") for f in self.FIELDS]
+        return MilvusBulkWriter(
+            embedding_collection, embedding_fields, logmel_collection, logmel_fields,
+            flush_interval=0, retry_backoff=0, **kwargs
+        )
+    
+    def test_rows_are_inserted_in_columnar_batches(self):
+        """Test row-count triggered flushes and column layout"""
+        embeddings, logmels = FakeCollection(), FakeCollection()
+        writer = self.make_writer(embeddings, logmels, flush_rows=1000)
+        
+        embedding_rows = make_rows(2500, Config.EMBEDDING_DIM, "embedding_vector")
+        logmel_rows = make_rows(2500, Config.LOGMEL_DIM, "logmel_vector")
+        for embedding_data, logmel_data in zip(embedding_rows, logmel_rows):
+            self.assertTrue(writer.add(embedding_data, logmel_data))
+        self.assertTrue(writer.close())
+        
+        self.assertEqual([len(batch[0]) for batch in embeddings.inserts], [1000, 1000, 500])
+        self.assertEqual(len(logmels.inserts), 3)
+        vectors = embeddings.inserts[0][4]
+        self.assertEqual(vectors.shape, (1000, Config.EMBEDDING_DIM))
+        self.assertEqual(str(vectors.dtype), "float32")
+        self.assertEqual(writer.rows_written, 5000)
+    
+    def test_transient_errors_are_retried(self):
+        """Test retry after a failed insert and dimension validation"""
+        embeddings, logmels = FakeCollection(failures=2), FakeCollection()
+        writer = self.make_writer(embeddings, logmels, max_retries=3)
+        
+        writer.add(make_rows(1, Config.EMBEDDING_DIM, "embedding_vector")[0])
+        with self.assertRaises(ValueError):
+            writer.add(make_rows(1, 3, "embedding_vector")[0])
+        
+        self.assertTrue(writer.flush())
+        self.assertEqual(len(embeddings.inserts), 1)
+        self.assertEqual(writer.rows_failed, 0)
+        writer.close()
+    
+    def test_failed_flush_is_recorded_and_shutdown_hook_is_shared(self):
+        """Test that dropped rows are reported by file and writers share one atexit hook"""
+        embeddings, logmels = FakeCollection(failures=1), FakeCollection()
+        with patch('database.bulk_writer.atexit.register') as mock_register:
+            writer = self.make_writer(embeddings, logmels, max_retries=0)
+            other_writer = self.make_writer(FakeCollection(), FakeCollection())
+        mock_register.assert_not_called()
+        
+        writer.add(make_rows(1, Config.EMBEDDING_DIM, "embedding_vector")[0])
+        self.assertFalse(writer.flush())
+        self.assertEqual(writer.rows_failed, 1)
+        self.assertEqual(writer.failed_audio_names, {"audio"})
+        writer.close()
+        other_writer.close()
+    
+    def test_threshold_flush_failure_is_not_blamed_on_the_last_file(self):
+        """Test that a size-triggered flush failure is recorded for every file in the batch"""
+        embeddings, logmels = FakeCollection(failures=1), FakeCollection()
+        writer = self.make_writer(embeddings, logmels, flush_rows=2, max_retries=0)
+        
+        for audio_name in ("first", "second"):
+            row = dict(make_rows(1, Config.EMBEDDING_DIM, "embedding_vector")[0], audio_name=audio_name)
+            self.assertTrue(writer.add(row))
+        
+        self.assertEqual(writer.rows_failed, 2)
+        self.assertEqual(writer.failed_audio_names, {"first", "second"})
+        self.assertTrue(writer.close())
+
+class TestIncrementalIngest(unittest.TestCase):
+    """Test content-hash record ids and skipping of stored files"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        self.audio_paths = []
+        for name, content in (("a.wav", b"first"), ("b.wav", b"second")):
+            path = os.path.join(self.test_dir, name)
+            with open(path, "wb") as f:
+                f.write(content)
+            self.audio_paths.append(path)
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_source_hash_tracks_content_and_config(self):
+        """Test that the hash changes with the file content or a pipeline parameter"""
+        from utils.utils import get_source_hash
+        
+        first, second = (get_source_hash(path) for path in self.audio_paths)
+        self.assertEqual(first, get_source_hash(self.audio_paths[0]))
+        self.assertNotEqual(first, second)
+        
+        with patch.object(Config, "N_MELS", Config.N_MELS + 1):
+            self.assertNotEqual(first, get_source_hash(self.audio_paths[0]))
+        with patch.object(Config, "DENOISE_BACKEND", "block_parallel"):
+            self.assertNotEqual(first, get_source_hash(self.audio_paths[0]))
+        with patch.object(Config, "AUDIO_RESAMPLER", "fast"):
+            self.assertNotEqual(first, get_source_hash(self.audio_paths[0]))
+        with patch.object(Config, "VAD_CHUNK_DURATION", Config.VAD_CHUNK_DURATION / 2):
+            self.assertNotEqual(first, get_source_hash(self.audio_paths[0]))
+    
+    def test_record_ids_are_deterministic(self):
+        """Test primary keys derived from source hash and speaker id"""
+        from processing.feature_extraction import assign_record_id
+        
+        rows = [{"speaker_id": "SPEAKER_00"}, {"speaker_id": "SPEAKER_00"}, {"speaker_id": "SPEAKER_01"}]
+        ids = [assign_record_id(row, "abc", "calls/a.wav")["id"] for row in rows]
+        
+        self.assertEqual(ids[0], ids[1])
+        self.assertNotEqual(ids[0], ids[2])
+        self.assertEqual(rows[2]["source_hash"], "abc")
+        self.assertEqual(rows[2]["source_path"], "calls/a.wav")
+    
+    def test_processed_files_are_skipped(self):
+        """Test that files already stored are filtered out before processing"""
+        from core.audio_processor import AudioProcessor
+        from utils.utils import get_source_hash
+        
+        processor = AudioProcessor.__new__(AudioProcessor)
+        processor.output_folder = self.test_dir
+        processor._source_hashes = {}
+        processor.vector_store = Mock()
+        processor.vector_store.get_processed_source_hashes.return_value = {
+            get_source_hash(self.audio_paths[0])
+        }
+        
+        remaining = processor._skip_processed_files(self.audio_paths)
+        self.assertEqual(remaining, [self.audio_paths[1]])
+    
+    def test_files_without_speech_are_skipped(self):
+        """Test that a file that gave no speakers is remembered and not processed again"""
+        import threading
+        from core.audio_processor import AudioProcessor
+        
+        processor = AudioProcessor.__new__(AudioProcessor)
+        processor.input_folder = self.test_dir
+        processor.output_folder = self.test_dir
+        processor.feature_writer = None
+        processor._source_hashes = {}
+        processor._no_speech_lock = threading.Lock()
+        processor.vector_store = Mock(write_mode="append")
+        processor.vector_store.get_processed_source_hashes.return_value = set()
+        
+        success, _ = processor._store_audio_features(self.audio_paths[1], self.test_dir, [])
+        self.assertTrue(success)
+        processor.vector_store.insert_data.assert_not_called()
+        with open(os.path.join(self.test_dir, Config.NO_SPEECH_SOURCES_FILENAME), "a") as f:
+            f.write('{"audio_name": "cut sh')  # an interrupted write is ignored
+        
+        self.assertEqual(processor._skip_processed_files(self.audio_paths), [self.audio_paths[0]])
+        with patch.object(Config, "PRE_VAD_MIN_ACTIVE_DURATION", 0.1):
+            processor._source_hashes = {}
+            self.assertEqual(processor._skip_processed_files(self.audio_paths), self.audio_paths)
+    
+    def test_changed_file_replaces_its_rows(self):
+        """Test that re-ingesting a modified file deletes the rows of its earlier version"""
+        from core.audio_processor import AudioProcessor
+        from database.local_store import LocalVectorStore
+        from processing.feature_extraction import build_embedding_record
+        
+        store_dir = os.path.join(self.test_dir, "store")
+        audio_path = self.audio_paths[0]
+        processor = AudioProcessor.__new__(AudioProcessor)
+        processor.input_folder = self.test_dir
+        processor.keep_run_state = False
+        processor.feature_writer = None
+        
+        def ingest():
+            processor.vector_store = LocalVectorStore(store_dir, "append")
+            features = [(build_embedding_record([1.0] * Config.EMBEDDING_DIM, "", "a", speaker_id), None)
+                        for speaker_id in ("SPEAKER_00", "SPEAKER_01")]
+            success, _ = processor._store_audio_features(audio_path, self.test_dir, features)
+            self.assertTrue(success)
+            processor.vector_store.flush_collections()
+        
+        ingest()
+        with open(audio_path, "wb") as f:
+            f.write(b"edited")
+        ingest()
+        
+        reopened = LocalVectorStore(store_dir, "append")
+        self.assertEqual(reopened.get_collection_stats(), (2, 0))
+        self.assertEqual(reopened.embedding_collection.source_hashes(), {processor._get_source_hash(audio_path)})
+    
+    def test_same_named_files_keep_their_rows(self):
+        """Test that files sharing a name in different folders do not replace each other's rows"""
+        from core.audio_processor import AudioProcessor
+        from database.local_store import LocalVectorStore
+        from processing.feature_extraction import build_embedding_record
+        
+        audio_paths = []
+        for folder, content in (("a", b"first call"), ("b", b"second call")):
+            os.makedirs(os.path.join(self.test_dir, folder))
+            audio_paths.append(os.path.join(self.test_dir, folder, "call1.wav"))
+            with open(audio_paths[-1], "wb") as f:
+                f.write(content)
+        
+        processor = AudioProcessor.__new__(AudioProcessor)
+        processor.input_folder = self.test_dir
+        processor.keep_run_state = False
+        processor.feature_writer = None
+        store_dir = os.path.join(self.test_dir, "store")
+        for audio_path in audio_paths + audio_paths:
+            processor.vector_store = LocalVectorStore(store_dir, "append")
+            features = [(build_embedding_record([1.0] * Config.EMBEDDING_DIM, "", "call1", "SPEAKER_00"), None)]
+            success, _ = processor._store_audio_features(audio_path, self.test_dir, features)
+            self.assertTrue(success)
+            processor.vector_store.flush_collections()
+        
+        reopened = LocalVectorStore(store_dir, "append")
+        self.assertEqual(reopened.get_collection_stats(), (2, 0))
+        self.assertEqual(
+            reopened.embedding_collection.source_hashes(),
+            {processor._get_source_hash(audio_path) for audio_path in audio_paths}
+        )
+
+class TestStageCache(unittest.TestCase):
+    """Test the content-addressed stage cache"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_put_get_and_lru_eviction(self):
+        """Test round trips and eviction of the least recently used entry"""
+        import time
+        import numpy as np
+        from utils.stage_cache import StageCache
+        
+        cache = StageCache(self.test_dir, max_bytes=10 ** 9)
+        cache.put("aa", {"samples": np.arange(1000, dtype=np.float32), "rttm": "text"})
+        cache.put("bb", {"samples": np.zeros(1000, dtype=np.float32)})
+        
+        cached = cache.get("aa")
+        np.testing.assert_array_equal(cached["samples"], np.arange(1000))
+        self.assertEqual(str(cached["rttm"]), "text")
+        self.assertIsNone(cache.get("missing"))
+        
+        # "aa" was used last, so shrinking the budget evicts "bb"
+        os.utime(cache._entry_path("bb"), (time.time() - 60, time.time() - 60))
+        cache.max_bytes = cache.size() - 1
+        self.assertEqual(cache.evict(), 1)
+        self.assertTrue(cache.contains("aa"))
+        self.assertFalse(cache.contains("bb"))
+    
+    def test_stage_key_depends_on_stage_params(self):
+        """Test that only the stage's own parameters change its key"""
+        from utils.stage_cache import StageCache
+        
+        vad_key = StageCache.stage_key("file", "vad")
+        logmel_key = StageCache.stage_key("file", "logmel")
+        
+        with patch.object(Config, "VAD_THRESHOLD", 0.5):
+            self.assertNotEqual(StageCache.stage_key("file", "vad"), vad_key)
+            self.assertEqual(StageCache.stage_key("file", "logmel"), logmel_key)
+        for name, value in (("VAD_BATCH_SIZE", 8), ("VAD_CHUNK_DURATION", 30.0)):
+            with patch.object(Config, name, value):
+                self.assertNotEqual(StageCache.stage_key("file", "vad"), vad_key)
+        self.assertNotEqual(StageCache.stage_key("other", "vad"), vad_key)
+    
+    @patch('processing.vad.save_waveform_plot')
+    def test_segmentation_is_served_from_cache(self, mock_plot):
+        """Test that a second run skips VAD and diarization models"""
+        import numpy as np
+        from utils.audio import AudioBuffer
+        from utils.stage_cache import StageCache
+        from core.pipeline import segment_denoised_audio
+        
+        sr = Config.SAMPLE_RATE
+        cache = StageCache(os.path.join(self.test_dir, "cache"))
+        speech_probs = np.ones(int(3 / Config.FRAME_DURATION))
+        tracks = [(0.0, 1.0, "SPEAKER_00"), (1.0, 3.0, "SPEAKER_01")]
+        
+        results = []
+        for _ in range(2):
+            model_manager = Mock()
+            model_manager.get_diarization_pipeline.return_value = Mock(
+                return_value=FakeDiarization(tracks)
+            )
+            denoised = AudioBuffer(np.arange(3 * sr, dtype=np.float32), sr, cache_key="file")
+            speaker_audio = segment_denoised_audio(
+                denoised, self.test_dir, model_manager, speech_probs=speech_probs, stage_cache=cache
+            )
+            results.append((model_manager, speaker_audio))
+        
+        (first_manager, first), (second_manager, second) = results
+        first_manager.get_diarization_pipeline.assert_called_once()
+        second_manager.get_diarization_pipeline.assert_not_called()
+        second_manager.get_vad_model.assert_not_called()
+        self.assertEqual(sorted(second), sorted(first))
+        for speaker in first:
+            np.testing.assert_array_equal(second[speaker].samples, first[speaker].samples)
+            self.assertIsNotNone(second[speaker].cache_key)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, Config.DIARIZATION_RTTM_FILENAME)))
+
+class TestAsyncPipeline(unittest.TestCase):
+    """Test the asyncio stage pipeline"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    @patch.object(Config, "ASYNC_DENOISE_WORKERS", 0)
+    @patch.object(Config, "PRE_VAD_ENABLED", False)
+    @patch('core.async_pipeline.save_preprocessing_outputs')
+    @patch('core.async_pipeline.extract_speaker_features')
+    @patch('core.async_pipeline.segment_denoised_audio')
+    @patch('core.async_pipeline.reduce_noise', side_effect=lambda y, sr: y * 0.5)
+    def test_files_flow_through_all_stages(self, mock_denoise, mock_segment, mock_features, mock_outputs):
+        """Test that every file is stored once and failures are counted per file"""
+        import numpy as np
+        import soundfile as sf
+        from core.async_pipeline import AsyncAudioPipeline
+        
+        sr = Config.SAMPLE_RATE
+        input_dir = os.path.join(self.test_dir, "input")
+        os.makedirs(input_dir)
+        audio_files = []
+        for index in range(4):
+            audio_path = os.path.join(input_dir, f"file_{index}.wav")
+            sf.write(audio_path, np.full(sr // 10, 0.1 * (index + 1), dtype=np.float32), sr)
+            audio_files.append(audio_path)
+        audio_files.append(os.path.join(input_dir, "missing.wav"))
+        
+        def segment(denoised_audio, folder, model_manager, stage_cache=None):
+            if os.path.basename(folder) == "file_2":
+                raise RuntimeError("diarization failed")
+            return {"SPEAKER_00": denoised_audio}
+        
+        mock_segment.side_effect = segment
+        mock_features.side_effect = lambda speaker_audio, audio_name, model_manager, stage_cache: [
+            (audio_name, float(speaker_audio["SPEAKER_00"].samples[0]))
+        ]
+        stored = {}
+        file_records = {}
+        
+        def store(audio_path, audio_output_folder, speaker_features, file_record):
+            stored[get_audio_name(audio_path)] = speaker_features
+            file_records[get_audio_name(audio_path)] = file_record
+            return True, "ok"
+        
+        pipeline = AsyncAudioPipeline(Mock(), input_dir, os.path.join(self.test_dir, "output"), store)
+        successful, failed = pipeline.run(audio_files)
+        
+        self.assertEqual((successful, failed), (3, 2))
+        self.assertEqual(sorted(stored), ["file_0", "file_1", "file_3"])
+        self.assertAlmostEqual(stored["file_3"][0][1], 0.2, places=4)
+        self.assertEqual(mock_outputs.call_count, 4)
+        for stage_name in ("decode", "pre_vad", "denoise", "plotting"):
+            self.assertEqual(file_records["file_0"]["stages"][stage_name]["calls"], 1)
+        self.assertIsNotNone(file_records["file_0"]["audio_seconds"])
+
+class TestFeatureStore(unittest.TestCase):
+    """Test the columnar feature store"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.test_dir, Config.FEATURE_STORE_DIRNAME)
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def make_rows(self, index):
+        metadata = {"id": f"id-{index}", "audio_name": f"audio_{index}", "speaker_id": "SPEAKER_00"}
+        return (
+            dict(metadata, embedding_vector=[float(index)] * Config.EMBEDDING_DIM),
+            dict(metadata, logmel_vector=[float(-index)] * Config.LOGMEL_DIM),
+        )
+    
+    def test_chunked_writes_and_reads(self):
+        """Test chunking, slicing across chunks, iteration, compression and appending"""
+        import numpy as np
+        from utils.feature_store import FeatureReader, FeatureWriter
+        
+        writer = FeatureWriter(self.store_dir, chunk_rows=3)
+        for index in range(7):
+            writer.add(*self.make_rows(index))
+        
+        # Full chunks are on disk before close()
+        self.assertEqual(FeatureReader(self.store_dir).num_rows("embeddings"), 6)
+        self.assertEqual(writer.close(), {"embeddings": 7, "logmel": 7})
+        
+        reader = FeatureReader(self.store_dir)
+        self.assertEqual(reader.dimension("logmel"), Config.LOGMEL_DIM)
+        vectors, metadata = reader.slice("embeddings", 2, 5)
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_array_equal(vectors[:, 0], [2, 3, 4])
+        self.assertEqual(metadata["audio_name"], ["audio_2", "audio_3", "audio_4"])
+        self.assertIsInstance(next(reader.iter_chunks("embeddings"))[0], np.memmap)
+        
+        records = list(reader.iter_records("logmel"))
+        self.assertEqual([record["id"] for record in records], [f"id-{index}" for index in range(7)])
+        self.assertEqual(records[6]["logmel_vector"][0], -6.0)
+        
+        # Appending continues the store, here with compressed chunks
+        writer = FeatureWriter(self.store_dir, write_mode="append", compress=True, chunk_rows=3)
+        writer.add(*self.make_rows(7))
+        writer.close()
+        vectors, metadata = FeatureReader(self.store_dir).load("embeddings")
+        np.testing.assert_array_equal(vectors[:, 0], np.arange(8))
+        self.assertEqual(metadata["id"][-1], "id-7")
+        
+        FeatureWriter(self.store_dir).close()
+        self.assertEqual(FeatureReader(self.store_dir).load("embeddings")[0].shape, (0, 0))
+
+class TestInstrumentation(unittest.TestCase):
+    """Test per-stage metrics, the JSONL records and the Prometheus snapshot"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_stages_are_recorded_per_file(self):
+        """Test stage timings, RTF, I/O bytes and the metrics files"""
+        import io
+        import json
+        import time
+        from contextlib import redirect_stdout
+        from utils.metrics import RunMetrics, record_audio_duration, stage, track_file
+        
+        # Outside a tracked file stages cost nothing and record nothing
+        with stage("vad"):
+            pass
+        with track_file(None, "untracked.wav") as file_metrics:
+            file_metrics.success = True
+        
+        metrics = RunMetrics.for_output_folder(self.test_dir)
+        with metrics.track("/data/clip.wav") as file_metrics:
+            record_audio_duration(2.0)
+            with stage("decode"):
+                with open(os.path.join(self.test_dir, "scratch.bin"), 'wb') as f:
+                    f.write(b"\0" * 100000)
+            for _ in range(2):
+                with stage("embedding"):
+                    sum(range(10000))
+            with stage("vad"):
+                with stage("plotting"):
+                    time.sleep(0.05)
+            file_metrics.success = True
+        with metrics.track("/data/broken.wav"):
+            pass
+        
+        with open(os.path.join(self.test_dir, Config.METRICS_JSONL_FILENAME)) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record["audio_name"] for record in records], ["clip", "broken"])
+        self.assertEqual([record["success"] for record in records], [True, None])
+        
+        stages = records[0]["stages"]
+        self.assertEqual(list(stages), ["decode", "embedding", "plotting", "vad"])
+        self.assertEqual(stages["embedding"]["calls"], 2)
+        self.assertGreaterEqual(stages["plotting"]["wall_seconds"], 0.05)
+        self.assertLess(stages["vad"]["wall_seconds"], 0.05)  # the nested plot is not counted twice
+        self.assertAlmostEqual(stages["decode"]["rtf"], stages["decode"]["wall_seconds"] / 2.0)
+        self.assertLessEqual(sum(entry["wall_seconds"] for entry in stages.values()), records[0]["wall_seconds"])
+        if os.path.exists("/proc/self/io"):
+            self.assertGreaterEqual(stages["decode"]["written_bytes"], 100000)
+        
+        with open(os.path.join(self.test_dir, Config.METRICS_PROMETHEUS_FILENAME)) as f:
+            prometheus = f.read()
+        self.assertIn('audio_pipeline_files_total{status="success"} 1', prometheus)
+        self.assertIn('audio_pipeline_files_total{status="failed"} 1', prometheus)
+        self.assertIn('# TYPE audio_pipeline_stage_wall_seconds_total counter', prometheus)
+        self.assertIn('audio_pipeline_stage_cpu_seconds_total{stage="embedding"}', prometheus)
+        
+        output = io.StringIO()
+        with redirect_stdout(output):
+            metrics.print_summary(1, 1, self.test_dir, "local index")
+        lines = output.getvalue().splitlines()
+        self.assertIn("✅ Successfully processed: 1 files", lines)
+        stage_rows = [line.split()[0] for line in lines if line.startswith("   ") and line.split()[0] in metrics.stages]
+        self.assertEqual(stage_rows, ["decode", "plotting", "vad", "embedding"])
+    
+    def test_worker_stages_are_merged_into_the_run(self):
+        """Test that stages timed in a pool worker end up in the parent's record of the file"""
+        import json
+        from core.workers import process_audio_in_worker
+        from utils.metrics import RunMetrics, record_audio_duration, stage
+        
+        def fake_pipeline(audio_path, input_folder, output_folder, model_manager, stage_cache):
+            record_audio_duration(3.0)
+            for _ in range(2):
+                with stage("embedding"):
+                    pass
+            return output_folder, []
+        
+        with patch('core.workers.validate_audio_file', return_value=(True, "")), \
+             patch('core.workers.run_audio_pipeline', side_effect=fake_pipeline):
+            *_, worker_stats = process_audio_in_worker("/data/clip.wav", "/data", self.test_dir)
+        
+        metrics = RunMetrics.for_output_folder(self.test_dir)
+        with metrics.track("/data/clip.wav") as file_metrics:
+            file_metrics.merge(worker_stats["metrics"])
+            with stage("store"):
+                pass
+            file_metrics.success = True
+        
+        with open(os.path.join(self.test_dir, Config.METRICS_JSONL_FILENAME)) as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record["audio_seconds"], 3.0)
+        self.assertEqual(sorted(record["stages"]), ["embedding", "plotting", "store"])
+        self.assertEqual(record["stages"]["embedding"]["calls"], 2)
+        self.assertGreaterEqual(record["wall_seconds"], worker_stats["metrics"]["wall_seconds"])
+
+class TestBenchmarks(unittest.TestCase):
+    """Test the offline benchmark suite's stand-ins and baseline comparison"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_tier_runs_end_to_end_with_stand_ins(self):
+        """Test the full pipeline on synthetic speech with stand-in models and the local store"""
+        import io
+        from contextlib import redirect_stderr, redirect_stdout
+        from benchmarks.run import run_tier
+        
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            result = run_tier("tiny", 6, 1, self.test_dir)
+        
+        self.assertEqual(result["failed"], 0)
+        self.assertEqual(result["audio_seconds"], 6.0)
+        self.assertEqual(result["rows"], {"embeddings": 2, "logmel": 2})
+        for stage in ("decode", "denoise", "vad", "diarization", "embedding", "logmel", "store", "other"):
+            self.assertIn(stage, result["stages"])
+        self.assertAlmostEqual(sum(result["stages"].values()), result["wall_seconds"], places=6)
+    
+    def test_baseline_comparison(self):
+        """Test machine scaling, the noise floor and exact output checks"""
+        from benchmarks.run import compare_to_baseline
+        
+        def results(calibration, total, denoise, vad, rows=2):
+            return {"calibration_seconds": calibration, "tiers": {"short": {
+                "failed": 0, "rows": {"embeddings": rows, "logmel": rows}, "wall_seconds": total,
+                "stages": {"denoise": denoise, "vad": vad},
+            }}}
+        
+        baseline = results(0.01, 2.0, 1.0, 0.01)
+        
+        # Twice as slow on a machine that is twice as slow: no regression
+        rows, regressions = compare_to_baseline(results(0.02, 4.0, 2.0, 0.02), baseline)
+        self.assertEqual(regressions, [])
+        self.assertEqual(rows[1], ("short", "denoise", 2.0, 2.0))
+        
+        # Slower denoising is reported; stages under the noise floor are not
+        rows, regressions = compare_to_baseline(results(0.01, 2.0, 1.5, 0.05), baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("short/denoise"))
+        
+        _, regressions = compare_to_baseline(results(0.01, 2.0, 1.0, 0.01, rows=3), baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("rows", regressions[0])
+
+class TestSearchService(unittest.TestCase):
+    """Test batched, cached similarity search"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    @patch.object(Config, "SEARCH_BATCH_SIZE", 2)
+    @patch('processing.batched_embedding.extract_embeddings_batched')
+    def test_queries_are_batched_and_embeddings_cached(self, mock_embed):
+        """Test one embedding pass per new audio, chunked multi-vector searches and filters"""
+        import numpy as np
+        import soundfile as sf
+        from database.milvus_handler import build_filter_expr
+        from database.search_service import SpeakerSearchService
+        
+        paths = []
+        for index, name in enumerate(["a", "b", "a_copy"]):
+            paths.append(os.path.join(self.test_dir, f"{name}.wav"))
+            sf.write(paths[-1], np.full(1600, 0.1 if index != 1 else 0.2, dtype=np.float32), Config.SAMPLE_RATE)
+        
+        mock_embed.side_effect = lambda items, inference, batch_size: {
+            key: np.full(4, float(len(audio_path))) for key, audio_path in items
+        }
+        
+        def search_embeddings(vectors, top_k, filters=None, offset=0):
+            return [[{"speaker_id": filters["speaker_id"], "distance": 0.25}] for _ in vectors]
+        
+        vector_store = Mock()
+        vector_store.search_embeddings.side_effect = search_embeddings
+        service = SpeakerSearchService(vector_store, Mock())
+        
+        results = service.search(paths + [[0.0] * 4], top_k=1, speaker_id="SPEAKER_00")
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[3][0]["speaker_id"], "SPEAKER_00")
+        self.assertEqual(vector_store.search_embeddings.call_count, 2)
+        
+        # Identical content is embedded once, in a single batch
+        mock_embed.assert_called_once()
+        self.assertEqual(len(mock_embed.call_args[0][0]), 2)
+        
+        service.search(paths[:2], top_k=1)
+        mock_embed.assert_called_once()
+        self.assertGreaterEqual(service.cache.hits, 2)
+        
+        self.assertIsNone(build_filter_expr())
+        self.assertEqual(
+            build_filter_expr({"audio_name": "call 1", "speaker_id": ["S1", "S2"]}),
+            'audio_name in ["call 1"] and speaker_id in ["S1", "S2"]'
+        )
+
+class TestLocalVectorStore(unittest.TestCase):
+    """Test the embedded vector store backend"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.test_dir, Config.LOCAL_STORE_DIRNAME)
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        shutil.rmtree(self.test_dir)
+    
+    def make_row(self, index, vector):
+        return {
+            "id": f"row-{index}", "audio_name": f"audio_{index % 4}", "speaker_id": f"SPEAKER_{index % 2:02d}",
+            "audio_path": f"/audio_{index % 4}.wav", "timestamp": "now", "source_hash": f"hash-{index // 2}",
+            "embedding_vector": vector.tolist()
+        }
+    
+    def test_interrupted_flush_is_cut_back(self):
+        """Test that shard rows written without their metadata are dropped on reopen"""
+        import json
+        import numpy as np
+        from database.local_store import LocalVectorStore, normalize_rows
+        
+        vectors = np.random.default_rng(1).normal(size=(30, Config.EMBEDDING_DIM)).astype(np.float32)
+        store = LocalVectorStore(self.store_dir, "overwrite")
+        for index in range(10):
+            store.insert_data(self.make_row(index, vectors[index]), None)
+        store.flush_collections()
+        
+        # Crash between the shard and the metadata of the next flush: 10 rows, 3 metadata lines (one partial)
+        collection_dir = store.embedding_collection.path
+        for index in range(10, 20):
+            store.insert_data(self.make_row(index, vectors[index]), None)
+        np.save(os.path.join(collection_dir, "shard_00001.npy"), normalize_rows(vectors[10:20]))
+        with open(os.path.join(collection_dir, "metadata.jsonl"), "a") as f:
+            for index in (10, 11):
+                f.write(json.dumps(self.make_row(index, vectors[index])) + "\n")
+            f.write('{"id": "row-1')
+        
+        reopened = LocalVectorStore(self.store_dir, "append")
+        self.assertEqual(reopened.get_collection_stats(), (12, 0))
+        for index in range(20, 30):
+            reopened.insert_data(self.make_row(index, vectors[index]), None)
+        reopened.flush_collections()
+        
+        reopened = LocalVectorStore(self.store_dir, "append")
+        self.assertEqual(reopened.get_collection_stats(), (22, 0))
+        collection = reopened.embedding_collection
+        for index in list(range(12)) + list(range(20, 30)):
+            scores, rows = collection.search(normalize_rows(vectors[index]), 1)
+            self.assertEqual(collection.row_metadata(rows[0][0])["id"], f"row-{index}")
+            self.assertAlmostEqual(float(scores[0][0]), 1.0, places=5)
+    
+    def test_interrupted_flush_keeps_deletions(self):
+        """Test that a flush cut off before the new rows are written does not revive stale rows"""
+        import numpy as np
+        from database.local_store import LocalCollection, LocalVectorStore
+        
+        vectors = np.random.default_rng(2).normal(size=(6, Config.EMBEDDING_DIM)).astype(np.float32)
+        rows = [dict(self.make_row(index, vectors[index]), source_path="calls/a.wav") for index in range(6)]
+        store = LocalVectorStore(self.store_dir, "overwrite")
+        for row in rows[:2]:
+            store.insert_data(row, None)
+        store.flush_collections()
+        
+        # A new version of the file replaces hash-0; one of its rows is replaced again before the flush
+        store.delete_stale_rows("calls/a.wav", "hash-1")
+        for row in rows[2:4]:
+            store.insert_data(row, None)
+        store.delete_stale_rows("calls/a.wav", "hash-2")
+        with patch.object(LocalCollection, "_flush_rows", side_effect=OSError("disk full")):
+            self.assertFalse(store.flush_collections())
+        
+        reopened = LocalVectorStore(self.store_dir, "append")
+        self.assertEqual(reopened.get_collection_stats(), (0, 0))
+        with open(reopened.embedding_collection.deleted_path) as f:
+            self.assertEqual(sorted(int(line) for line in f), [0, 1])
+        
+        # Row numbers of the lost rows are reused by the rows stored next
+        for row in rows[4:]:
+            reopened.insert_data(row, None)
+        reopened.flush_collections()
+        self.assertEqual(LocalVectorStore(self.store_dir, "append").get_collection_stats(), (2, 0))
+    
+    @patch.object(Config, "LOCAL_SEARCH_BLOCK_ROWS", 64)
+    def test_exact_and_ivf_search(self):
+        """Test exact blocked search, filters, offset, upserts, reopening and the IVF index"""
+        import numpy as np
+        from database.local_store import LocalVectorStore
+        from database.vector_store import create_vector_store
+        
+        vectors = np.random.default_rng(0).normal(size=(300, Config.EMBEDDING_DIM)).astype(np.float32)
+        store = create_vector_store("local", self.test_dir, write_mode="overwrite")
+        self.assertIsInstance(store, LocalVectorStore)
+        for index, vector in enumerate(vectors):
+            store.insert_data(self.make_row(index, vector), None)
+        
+        # Rows are searchable before they are flushed to shards
+        hits = store.search_embeddings(vectors[:3], top_k=2)
+        self.assertEqual([query_hits[0]["audio_name"] for query_hits in hits], ["audio_0", "audio_1", "audio_2"])
+        self.assertAlmostEqual(hits[0][0]["distance"], 1.0, places=5)
+        
+        filtered = store.search_embeddings(vectors[:1], top_k=3, filters={"speaker_id": "SPEAKER_01"})[0]
+        self.assertTrue(all(hit["speaker_id"] == "SPEAKER_01" for hit in filtered))
+        self.assertEqual(store.search_embeddings(vectors[:1], top_k=1, offset=1)[0], store.search_embeddings(vectors[:1], top_k=2)[0][1:])
+        
+        # Same id replaces the earlier row
+        store.insert_data(self.make_row(0, -vectors[0]), None)
+        self.assertEqual(store.get_collection_stats(), (300, 0))
+        self.assertLess(store.search_embeddings(vectors[:1], top_k=1)[0][0]["distance"], 0.5)
+        store.flush_collections()
+        
+        reopened = LocalVectorStore(self.store_dir, "append")
+        self.assertEqual(reopened.get_collection_stats(), (300, 0))
+        self.assertEqual(reopened.get_processed_source_hashes({"hash-0", "hash-999"}), {"hash-0"})
+        summarize = lambda results: [[(hit["audio_name"], round(hit["distance"], 4)) for hit in hits] for hits in results]
+        exact = summarize(reopened.search_embeddings(vectors[10:20], top_k=5))
+        
+        with patch.object(Config, "LOCAL_INDEX_TYPE", "ivf"), patch.object(Config, "SEARCH_PARAMS", {"params": {"nprobe": 8}}):
+            self.assertTrue(reopened.build_index(nlist=8))
+            self.assertEqual(summarize(reopened.search_embeddings(vectors[10:20], top_k=5)), exact)
+            
+            # Rows added after the index was built are still found
+            reopened.insert_data(self.make_row(1000, -vectors[3]), None)
+            self.assertEqual(reopened.search_embeddings([-vectors[3]], top_k=1)[0][0]["audio_name"], "audio_0")
+
+class TestModelServer(unittest.TestCase):
+    """Test the model server and its client"""
+    
+    def setUp(self):
+        """Start a server on a free port around a mocked processor"""
+        from core.server import ModelServer
+        
+        self.test_dir = tempfile.mkdtemp()
+        self.processor = Mock()
+        self.processor.model_manager.vad_model = None
+        self.processor.vector_store.describe.return_value = "Milvus localhost:19530"
+        self.processor.vector_store.get_collection_stats.return_value = (4, 4)
+        self.server = ModelServer(self.processor, port=0, max_queue=0).start(background=True, prewarm=False)
+        
+    def tearDown(self):
+        """Clean up test environment"""
+        self.server.stop()
+        shutil.rmtree(self.test_dir)
+    
+    def test_audio_processor_forwards_to_server(self):
+        """Test that a client-mode AudioProcessor runs files and searches on the server"""
+        from core.audio_processor import AudioProcessor
+        
+        self.processor.process_single_audio.return_value = (True, "✅ Successfully processed: a")
+        self.processor.search_similar_batch.return_value = [[
+            {"audio_name": "b", "speaker_id": "SPEAKER_00", "audio_path": "/b.wav", "distance": 0.5}
+        ]]
+        
+        processor = AudioProcessor(self.test_dir, self.test_dir, "fake_token", server_url=self.server.url)
+        self.assertIsNone(processor.model_manager)
+        
+        self.assertEqual(processor.process_single_audio("/data/a.wav"), (True, "✅ Successfully processed: a"))
+        self.processor.process_single_audio.assert_called_once_with("/data/a.wav", self.test_dir, self.test_dir)
+        self.assertEqual(processor.search_similar([0.1] * 4, top_k=1)[0]["audio_name"], "b")
+        self.processor.search_similar_batch.assert_called_once_with([[0.1] * 4], 1, None, None, 0)
+        self.assertEqual(processor.get_collection_stats(), (4, 4))
+        
+        metrics = processor.client.metrics()
+        self.assertEqual(metrics["requests"]["/process"], 1)
+        self.assertFalse(processor.client.health()["models_loaded"]["vad"])
+    
+    def test_requests_beyond_the_queue_are_rejected(self):
+        """Test the concurrency limit and the 503 for a full queue"""
+        import threading
+        from core.client import ModelServerClient
+        
+        release = threading.Event()
+        self.processor.process_single_audio.side_effect = lambda *args: release.wait(10) and (True, "ok")
+        client = ModelServerClient(self.server.url)
+        
+        running = threading.Thread(target=client.process_single_audio, args=("/data/a.wav",))
+        running.start()
+        for _ in range(100):
+            if client.metrics()["active"]:
+                break
+            threading.Event().wait(0.05)
+        
+        with self.assertRaises(RuntimeError) as error:
+            client.process_single_audio("/data/b.wav")
+        self.assertIn("503", str(error.exception))
+        
+        release.set()
+        running.join()
+        self.assertEqual(client.metrics()["rejected"], 1)
+
 class TestMocking(unittest.TestCase):
     """Test with mocked dependencies"""
     
-    @patch('models.models.nemo_asr')
-    @patch('models.models.Pipeline')
-    @patch('models.models.Model')
-    def test_model_manager_init(self, mock_model, mock_pipeline, mock_nemo):
-        """Test ModelManager initialization with mocked dependencies"""
+    def test_model_manager_init(self):
+        """Test that ModelManager loads each model on first access only"""
+        from models.models import ModelManager
+        
+        mock_nemo = Mock()
+        mock_pyannote = Mock()
+        modules = {
+            "nemo": mock_nemo,
+            "nemo.collections": mock_nemo.collections,
+            "nemo.collections.asr": mock_nemo.collections.asr,
+            "pyannote.audio": mock_pyannote,
+        }
+        
+        with patch.dict(sys.modules, modules):
+            manager = ModelManager("fake_token")
+            
+            # Nothing is loaded until a getter asks for it
+            self.assertIsNone(manager.vad_model)
+            self.assertIsNone(manager.diarization_pipeline)
+            self.assertIsNone(manager.embedding_inference)
+            
+            vad_model = manager.get_vad_model()
+            self.assertIs(manager.get_vad_model(), vad_model)
+            mock_nemo.collections.asr.models.EncDecFrameClassificationModel.from_pretrained.assert_called_once()
+            mock_pyannote.Pipeline.from_pretrained.assert_not_called()
+            
+            self.assertIsNotNone(manager.get_diarization_pipeline())
+            self.assertIsNotNone(manager.get_embedding_inference())
+            mock_pyannote.Inference.assert_called_once()
+    
+    def test_prewarm_loads_in_background(self):
+        """Test that prewarm loads only the requested models"""
         from models.models import ModelManager
         
-        # Mock the model loading
-        mock_vad_model = Mock()
-        mock_nemo.models.EncDecFrameClassificationModel.from_pretrained.return_value = mock_vad_model
+        mock_pyannote = Mock()
+        with patch.dict(sys.modules, {"pyannote.audio": mock_pyannote}):
+            manager = ModelManager("fake_token")
+            manager.prewarm(["diarization"]).join(timeout=30)
+            
+            self.assertIsNotNone(manager.diarization_pipeline)
+            self.assertIsNone(manager.vad_model)
+            self.assertIsNone(manager.embedding_inference)
+    
+    def test_audio_processor_import_is_light(self):
+        """Test that importing the processor does not import model or DSP libraries"""
+        import json
+        import subprocess
+        
+        code = (
+            "import json, sys, time; start = time.perf_counter(); import core.audio_processor; "
+            "print(json.dumps([time.perf_counter() - start, "
+            "[m for m in ('torch', 'nemo', 'pyannote.audio', 'librosa', 'noisereduce') if m in sys.modules]]))"
+        )
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=repo_root, capture_output=True, text=True, check=True
+        ).stdout
+        import_time, heavy_modules = json.loads(output.strip().splitlines()[-1])
+        
+        self.assertEqual(heavy_modules, [])
+        print(f"core.audio_processor import time: {import_time:.2f}s")
+
+class TestParallelProcessing(unittest.TestCase):
+    """Test process-pool worker helpers"""
+    
+    def test_torch_threads_split_between_workers(self):
+        """Test that each worker gets at least one torch thread"""
+        from core.workers import get_torch_threads
+        
+        with patch('core.workers.os.cpu_count', return_value=64):
+            self.assertEqual(get_torch_threads(8), 8)
+            self.assertEqual(get_torch_threads(128), 1)
+    
+    def test_worker_reports_invalid_file(self):
+        """Test that a worker returns a failure result instead of raising"""
+        from core.workers import process_audio_in_worker
+        
+        audio_path, success, message, folder, features, worker_stats = process_audio_in_worker(
+            "nonexistent.wav", "input", "output"
+        )
+        self.assertEqual(audio_path, "nonexistent.wav")
+        self.assertFalse(success)
+        self.assertIn("not found", message)
+        self.assertIsNone(features)
+        self.assertEqual(worker_stats["decode"]["totals"], {})
+    
+    def test_worker_decode_stats_reach_the_parent_reader(self):
+        """Test that a worker's decode and gate counters are returned once and merged into another reader"""
+        import numpy as np
+        import soundfile as sf
+        from core.workers import process_audio_in_worker
+        from processing.vad import PreVadGate, get_pre_vad_gate, trim_non_speech
+        from utils.audio_reader import AudioReader, get_audio_reader
+        
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        audio_path = os.path.join(test_dir, "speech.wav")
+        sf.write(audio_path, np.zeros(Config.SAMPLE_RATE, dtype=np.float32), Config.SAMPLE_RATE)
         
-        mock_diarization = Mock()
-        mock_pipeline.from_pretrained.return_value = mock_diarization
+        def decode_only(audio_path, input_folder, output_folder, model_manager, stage_cache):
+            trim_non_speech(get_audio_reader().read(audio_path), Config.SAMPLE_RATE)
+            return output_folder, []
         
-        mock_embedding = Mock()
-        mock_model.from_pretrained.return_value = mock_embedding
+        get_audio_reader().pop_stats()
+        get_pre_vad_gate().pop_stats()
+        with patch('core.workers.run_audio_pipeline', side_effect=decode_only):
+            *_, worker_stats = process_audio_in_worker(audio_path, test_dir, test_dir)
+        self.assertEqual(get_audio_reader().decode_stats(), {})
+        self.assertEqual(get_pre_vad_gate().stats()["files"], 0)
         
-        # Initialize ModelManager
-        manager = ModelManager("fake_token")
+        parent_gate = PreVadGate()
+        parent_gate.merge_stats(worker_stats["pre_vad"])
+        parent_gate.merge_stats(worker_stats["pre_vad"])
+        self.assertEqual(parent_gate.stats(), {
+            "files": 2, "rejected": 2, "input_seconds": 2.0, "removed_seconds": 2.0
+        })
         
-        # Verify models were loaded
-        self.assertIsNotNone(manager.vad_model)
-        self.assertIsNotNone(manager.diarization_pipeline)
-        self.assertIsNotNone(manager.embedding_model)
+        parent_reader = AudioReader()
+        parent_reader.merge_stats(worker_stats["decode"])
+        parent_reader.merge_stats(worker_stats["decode"])
+        totals = parent_reader.decode_stats()["soundfile"]
+        self.assertEqual(totals["files"], 2)
+        self.assertAlmostEqual(totals["duration"], 2.0)
+        self.assertEqual(len(parent_reader.decode_times), 2)
 
 class TestIntegration(unittest.TestCase):
     """Integration tests"""
@@ -143,8 +1834,29 @@ if __name__ == '__main__':
     test_classes = [
         TestConfig,
         TestUtils,
+        TestWaveformPlotting,
         TestFeatureExtraction,
+        TestAudioReader,
+        TestDenoiseBackends,
+        TestInMemoryStages,
+        TestVADSegmentation,
+        TestBatchedVAD,
+        TestPreVadGate,
+        TestLongForm,
+        TestStreaming,
+        TestBatchedEmbedding,
+        TestBulkWriter,
+        TestIncrementalIngest,
+        TestStageCache,
+        TestAsyncPipeline,
+        TestFeatureStore,
+        TestInstrumentation,
+        TestBenchmarks,
+        TestSearchService,
+        TestLocalVectorStore,
+        TestModelServer,
         TestMocking,
+        TestParallelProcessing,
         TestIntegration
     ]
     
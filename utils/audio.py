@@ -0,0 +1,89 @@
+"""
+In-memory audio container shared between pipeline stages
+"""
+
+import numpy as np
+import soundfile as sf
+import torch
+from config.config import Config
+from utils.audio_reader import get_audio_reader
+
+class AudioBuffer:
+    """Mono float32 waveform handed from one pipeline stage to the next
+    
+    Samples are kept as a contiguous numpy array; as_tensor() wraps the same
+    memory for torch consumers without copying. `path` points at the file the
+    samples were loaded from or last saved to, if any. `cache_key` is the stage
+    cache key of the stage that produced the samples, if caching is enabled.
+    """
+    
+    def __init__(self, samples, sample_rate=None, path=None, cache_key=None):
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.sample_rate = sample_rate or Config.SAMPLE_RATE
+        self.path = path
+        self.cache_key = cache_key
+    
+    @classmethod
+    def from_file(cls, audio_path):
+        """Decode an audio file to mono float32 at the pipeline sample rate (see AudioReader)"""
+        return cls(get_audio_reader().read(audio_path), Config.SAMPLE_RATE, audio_path)
+    
+    def __len__(self):
+        return len(self.samples)
+    
+    @property
+    def duration(self):
+        """Duration in seconds"""
+        return len(self.samples) / self.sample_rate
+    
+    def as_tensor(self):
+        """Return a (1, num_samples) torch view of the samples"""
+        return torch.from_numpy(self.samples).unsqueeze(0)
+    
+    def to_pyannote(self):
+        """Return the in-memory audio dictionary accepted by pyannote"""
+        return {"waveform": self.as_tensor(), "sample_rate": self.sample_rate}
+    
+    def save(self, output_path):
+        """Write the samples as WAV and remember the path"""
+        sf.write(output_path, self.samples, self.sample_rate)
+        self.path = output_path
+        return output_path
+
+def gather_ranges(samples, starts, ends):
+    """Concatenate samples[start:end] for each range in a single operation
+    
+    The slices are views, so the only allocation is the output array.
+    """
+    if len(starts) == 0:
+        return samples[:0].copy()
+    return np.concatenate([samples[start:end] for start, end in zip(starts, ends)])
+
+def make_length_buckets(lengths, batch_size, max_batch_samples=None):
+    """Sort items by length and cut them into batches of similar length
+    
+    A batch closes when it holds `batch_size` items or when padding the next
+    (longest so far) item would exceed `max_batch_samples` padded samples.
+    Returns a list of index arrays into `lengths`.
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(lengths, kind="stable")
+    
+    buckets = []
+    current = []
+    for index in order:
+        padded_samples = (len(current) + 1) * lengths[index]
+        if current and (len(current) >= batch_size or
+                        (max_batch_samples and padded_samples > max_batch_samples)):
+            buckets.append(np.array(current))
+            current = []
+        current.append(index)
+    if current:
+        buckets.append(np.array(current))
+    return buckets
+
+def load_audio_buffer(audio):
+    """Return `audio` as an AudioBuffer, decoding it first if it is a path"""
+    if isinstance(audio, AudioBuffer):
+        return audio
+    return AudioBuffer.from_file(audio)
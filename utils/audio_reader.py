@@ -0,0 +1,202 @@
+"""
+Audio decoding shared by all stages: soundfile block reads, one ffmpeg pipe for compressed formats, soxr resampling
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+import numpy as np
+import soundfile as sf
+import soxr
+from config.config import Config
+
+# Resampler presets: (soxr quality for soundfile-decoded audio, ffmpeg aresample options)
+RESAMPLER_PRESETS = {
+    "fast": ("LQ", "filter_size=8:phase_shift=6"),
+    "balanced": ("HQ", ""),          # librosa's default quality, ffmpeg's default filter
+    "high_quality": ("VHQ", "filter_size=64:phase_shift=12"),
+}
+
+# Formats libsndfile decodes itself; everything else goes through ffmpeg when it is installed
+SOUNDFILE_EXTENSIONS = {".wav", ".flac", ".ogg", ".aiff", ".aif"}
+
+class AudioReader:
+    """Decodes audio files to mono float32 at Config.SAMPLE_RATE
+    
+    WAV/FLAC/OGG/AIFF are read with soundfile in blocks of
+    Config.AUDIO_READ_BLOCK_SIZE frames (mixed to mono per block) and
+    resampled with soxr. Compressed formats (mp3, m4a, aac, ...) are decoded,
+    downmixed and resampled in a single ffmpeg process that writes float32 to a
+    pipe; without ffmpeg they fall back to soundfile, then to librosa/audioread.
+    `resampler` is a RESAMPLER_PRESETS name (default Config.AUDIO_RESAMPLER).
+    Decode time is recorded per file: running totals per backend and the last
+    Config.AUDIO_DECODE_HISTORY files (see decode_stats); pool workers hand
+    theirs to the parent's reader with pop_stats/merge_stats. Safe to share
+    between threads.
+    """
+    
+    def __init__(self, sample_rate=None, resampler=None):
+        self.sample_rate = sample_rate or Config.SAMPLE_RATE
+        self.resampler = resampler or Config.AUDIO_RESAMPLER
+        if self.resampler not in RESAMPLER_PRESETS:
+            raise ValueError(f"Unknown resampler preset: {self.resampler} (expected one of {list(RESAMPLER_PRESETS)})")
+        self.ffmpeg = shutil.which(Config.FFMPEG_BINARY)
+        
+        self._lock = threading.Lock()
+        self._totals = {}
+        self.decode_times = deque(maxlen=Config.AUDIO_DECODE_HISTORY)
+    
+    @property
+    def soxr_quality(self):
+        return RESAMPLER_PRESETS[self.resampler][0]
+    
+    def read(self, audio_path):
+        """Decoded samples of a file (mono float32 at the reader's sample rate)"""
+        started = time.perf_counter()
+        backend = self._choose_backend(audio_path)
+        if backend == "soundfile":
+            samples = self._read_soundfile(audio_path)
+        elif backend == "ffmpeg":
+            samples = self._read_ffmpeg(audio_path)
+        else:
+            samples = self._read_librosa(audio_path)
+        
+        seconds = time.perf_counter() - started
+        duration = len(samples) / self.sample_rate
+        with self._lock:
+            self.decode_times.append({"path": audio_path, "backend": backend, "seconds": seconds, "duration": duration})
+            totals = self._totals.setdefault(backend, {"files": 0, "seconds": 0.0, "duration": 0.0})
+            totals["files"] += 1
+            totals["seconds"] += seconds
+            totals["duration"] += duration
+        return samples
+    
+    def _choose_backend(self, audio_path):
+        if os.path.splitext(audio_path)[1].lower() in SOUNDFILE_EXTENSIONS:
+            return "soundfile"
+        if self.ffmpeg:
+            return "ffmpeg"
+        try:
+            sf.info(audio_path)
+            return "soundfile"  # recent libsndfile versions also read mp3
+        except RuntimeError:
+            return "librosa"
+    
+    def _resample(self, samples, sample_rate):
+        if sample_rate == self.sample_rate:
+            return samples
+        return soxr.resample(samples, sample_rate, self.sample_rate, quality=self.soxr_quality).astype(np.float32, copy=False)
+    
+    def _read_soundfile(self, audio_path):
+        """Block reads into one preallocated mono buffer, then one resampling pass"""
+        with sf.SoundFile(audio_path) as f:
+            samples = np.empty(f.frames, dtype=np.float32)
+            position = 0
+            for block in f.blocks(blocksize=Config.AUDIO_READ_BLOCK_SIZE, dtype='float32', always_2d=True):
+                samples[position:position + len(block)] = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1)
+                position += len(block)
+            return self._resample(samples[:position], f.samplerate)
+    
+    def _read_ffmpeg(self, audio_path):
+        """Decode, downmix and resample in one ffmpeg process writing float32 to stdout"""
+        options = RESAMPLER_PRESETS[self.resampler][1]
+        resample = f"aresample={self.sample_rate}" + (f":{options}" if options else "")
+        command = [
+            self.ffmpeg, "-nostdin", "-v", "error", "-i", audio_path,
+            "-vn", "-ac", "1", "-af", resample, "-f", "f32le", "-acodec", "pcm_f32le", "-"
+        ]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not decode {audio_path}: {result.stderr.decode(errors='replace').strip()}")
+        return np.frombuffer(result.stdout, dtype=np.float32).copy()
+    
+    def _read_librosa(self, audio_path):
+        import librosa
+        
+        samples, sample_rate = librosa.load(audio_path, sr=None, mono=True)
+        return self._resample(samples.astype(np.float32, copy=False), sample_rate)
+    
+    def iter_blocks(self, audio_path, block_samples):
+        """Yield consecutive mono float32 blocks of `block_samples` at the reader's sample rate
+        
+        The file is read and resampled incrementally (soxr's streaming resampler
+        keeps block boundaries seamless), so memory does not grow with the file.
+        The last block may be shorter. Only formats soundfile reads are supported.
+        """
+        with sf.SoundFile(audio_path) as f:
+            resampler = None
+            if f.samplerate != self.sample_rate:
+                resampler = soxr.ResampleStream(f.samplerate, self.sample_rate, 1, dtype='float32', quality=self.soxr_quality)
+            
+            pending = np.zeros(0, dtype=np.float32)
+            read_size = max(1, int(block_samples * f.samplerate / self.sample_rate))
+            
+            for block in f.blocks(blocksize=read_size, dtype='float32', always_2d=True):
+                samples = block.mean(axis=1)
+                if resampler is not None:
+                    samples = resampler.resample_chunk(samples)
+                pending = np.concatenate([pending, samples])
+                while len(pending) >= block_samples:
+                    yield pending[:block_samples]
+                    pending = pending[block_samples:]
+            
+            if resampler is not None:
+                pending = np.concatenate([pending, resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)])
+            if len(pending) > 0:
+                yield pending
+    
+    def decode_stats(self):
+        """Per-backend totals: files, decode seconds and audio seconds"""
+        with self._lock:
+            return {backend: dict(totals) for backend, totals in self._totals.items()}
+    
+    def pop_stats(self):
+        """Decode totals and recent decode times recorded so far, resetting both"""
+        with self._lock:
+            stats = {"totals": self._totals, "decode_times": list(self.decode_times)}
+            self._totals = {}
+            self.decode_times.clear()
+        return stats
+    
+    def merge_stats(self, stats):
+        """Add pop_stats output from another process (a pool worker) to this reader's"""
+        with self._lock:
+            for backend, totals in stats["totals"].items():
+                merged = self._totals.setdefault(backend, {"files": 0, "seconds": 0.0, "duration": 0.0})
+                for field, value in totals.items():
+                    merged[field] += value
+            self.decode_times.extend(stats["decode_times"])
+    
+    def print_decode_report(self):
+        """Print decode time per backend and the slowest files"""
+        stats = self.decode_stats()
+        if not stats:
+            return
+        print(f"\n⏱️ Audio decoding ({self.resampler} resampler):")
+        for backend, totals in stats.items():
+            speed = totals["duration"] / totals["seconds"] if totals["seconds"] > 0 else float("inf")
+            print(f"   {backend}: {totals['files']} files, {totals['seconds']:.2f}s for "
+                  f"{totals['duration']:.1f}s of audio ({speed:.0f}x realtime)")
+        with self._lock:
+            slowest = sorted(self.decode_times, key=lambda entry: entry["seconds"], reverse=True)[:3]
+        for entry in slowest:
+            print(f"   🐢 {os.path.basename(entry['path'])}: {entry['seconds']:.3f}s ({entry['backend']})")
+
+# One reader per process, so decode times of a run are collected in one place
+_default_reader = None
+_default_reader_lock = threading.Lock()
+
+def get_audio_reader():
+    """The process-wide AudioReader, created on first use"""
+    global _default_reader
+    with _default_reader_lock:
+        if _default_reader is None:
+            _default_reader = AudioReader()
+        return _default_reader
+
+def read_audio(audio_path):
+    """Decode a file with the process-wide reader (picklable for executors)"""
+    return get_audio_reader().read(audio_path)
@@ -0,0 +1,163 @@
+"""
+Header-only audio corpus discovery with a persisted manifest
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import soundfile as sf
+from config.config import Config
+
+def probe_audio_header(audio_path):
+    """Read format, duration, channels and sample rate without decoding samples
+    
+    soundfile reads WAV/FLAC/MP3 headers directly; other containers fall back
+    to audioread, which asks its backend (e.g. ffmpeg) for the stream info.
+    """
+    try:
+        info = sf.info(audio_path)
+        return {
+            "format": info.format,
+            "duration": info.frames / info.samplerate if info.samplerate else 0.0,
+            "channels": info.channels,
+            "sample_rate": info.samplerate,
+        }
+    except RuntimeError:
+        import audioread
+        
+        with audioread.audio_open(audio_path) as f:
+            return {
+                "format": os.path.splitext(audio_path)[1].lstrip('.').upper(),
+                "duration": f.duration,
+                "channels": f.channels,
+                "sample_rate": f.samplerate,
+            }
+
+def _probe_entry(audio_path, size, mtime):
+    """Manifest entry for one file; probe failures are recorded, not raised"""
+    entry = {"path": audio_path, "size": size, "mtime": mtime}
+    try:
+        entry.update(probe_audio_header(audio_path))
+    except Exception as e:
+        entry["error"] = str(e)
+    return entry
+
+def iter_audio_paths(input_folder):
+    """Walk the tree once, yielding (path, size, mtime) for files with an audio extension"""
+    suffixes = tuple(pattern.lstrip('*') for pattern in Config.AUDIO_EXTENSIONS)
+    directories = [input_folder]
+    
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            print(f"⚠️ Warning: Cannot list {directory}: {str(e)}")
+            continue
+        
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+            elif entry.name.endswith(suffixes):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime_ns
+
+class AudioManifest:
+    """Path, size, mtime and header info of every scanned audio file
+    
+    Stored as JSON Lines so entries can be appended while a scan is running;
+    when a path appears more than once the last line wins. A scan only probes
+    files whose size or mtime differs from the manifest.
+    """
+    
+    def __init__(self, manifest_path=None):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self._log = None
+        
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partial line from an interrupted scan
+                    self.entries[entry["path"]] = entry
+    
+    def lookup(self, audio_path, size, mtime):
+        """Stored entry for the file if it is unchanged since it was probed"""
+        entry = self.entries.get(audio_path)
+        if entry and entry["size"] == size and entry["mtime"] == mtime:
+            return entry
+        return None
+    
+    def record(self, entry):
+        """Add a freshly probed entry, appending it to the manifest file"""
+        self.entries[entry["path"]] = entry
+        if self.manifest_path:
+            if self._log is None:
+                self._log = open(self.manifest_path, 'a')
+            self._log.write(json.dumps(entry) + "\n")
+    
+    def save(self, entries):
+        """Rewrite the manifest with exactly `entries`, dropping files that disappeared"""
+        self.close()
+        self.entries = {entry["path"]: entry for entry in entries}
+        if not self.manifest_path:
+            return
+        
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.manifest_path)
+    
+    def close(self):
+        """Close the append log"""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+def scan_audio_files(input_folder, manifest_path=None, workers=None):
+    """Yield a manifest entry for every audio file under input_folder as it is found
+    
+    Unchanged files come straight from the manifest; new or modified files are
+    probed in a pool of `workers` threads (default Config.DISCOVERY_WORKERS)
+    and yielded as their probes finish, so processing can start before the
+    walk completes. Entries carry path, size, mtime and either format,
+    duration, channels and sample_rate or an "error" message.
+    """
+    if workers is None:
+        workers = Config.DISCOVERY_WORKERS
+    
+    manifest = AudioManifest(manifest_path)
+    entries = []
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-probe") as executor:
+            futures = []
+            for audio_path, size, mtime in iter_audio_paths(input_folder):
+                entry = manifest.lookup(audio_path, size, mtime)
+                if entry is not None:
+                    entries.append(entry)
+                    yield entry
+                else:
+                    futures.append(executor.submit(_probe_entry, audio_path, size, mtime))
+                
+                # Stream finished probes while the walk continues
+                while futures and futures[0].done():
+                    entry = futures.pop(0).result()
+                    manifest.record(entry)
+                    entries.append(entry)
+                    yield entry
+            
+            for future in as_completed(futures):
+                entry = future.result()
+                manifest.record(entry)
+                entries.append(entry)
+                yield entry
+    finally:
+        manifest.close()
+    
+    # Compact the manifest once the whole tree has been seen
+    manifest.save(entries)
@@ -0,0 +1,185 @@
+"""
+Append-only columnar store of extracted features: float32 matrices plus compact metadata tables
+"""
+
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+import numpy as np
+from config.config import Config
+
+# Table name -> vector field of the rows stored in it
+FEATURE_TABLES = {"embeddings": "embedding_vector", "logmel": "logmel_vector"}
+MANIFEST_FILENAME = "manifest.json"
+
+def _write_json(path, data, compress=False):
+    """Write JSON (gzip-compressed if `compress`) through a temporary file"""
+    tmp_path = f"{path}.tmp"
+    opener = gzip.open if compress else open
+    with opener(tmp_path, 'wt') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt') as f:
+        return json.load(f)
+
+class FeatureWriter:
+    """Appends feature rows to a store directory in fixed-size chunks
+    
+    Each table (embeddings, logmel) is a directory of chunks: a float32 matrix
+    (chunk_00000.npy, memory-mappable, or chunk_00000.npz with compression)
+    and its metadata columns (chunk_00000.meta.json, or .meta.json.gz). Only
+    Config.FEATURE_STORE_CHUNK_ROWS rows per table are held in memory; the
+    manifest listing the chunks is rewritten after each one, so the store is
+    readable while a run is still going. "append" mode continues an existing
+    store, "overwrite" starts a new one. Safe to call from several threads.
+    """
+    
+    def __init__(self, store_dir, write_mode="overwrite", compress=None, chunk_rows=None):
+        self.store_dir = store_dir
+        self.compress = Config.FEATURE_STORE_COMPRESS if compress is None else compress
+        self.chunk_rows = chunk_rows or Config.FEATURE_STORE_CHUNK_ROWS
+        
+        manifest_path = os.path.join(store_dir, MANIFEST_FILENAME)
+        if write_mode == "overwrite" and os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+        if os.path.exists(manifest_path):
+            self.manifest = _read_json(manifest_path)
+        else:
+            self.manifest = {"tables": {table: {"rows": 0, "dimension": 0, "chunks": []} for table in FEATURE_TABLES}}
+        
+        for table in FEATURE_TABLES:
+            os.makedirs(os.path.join(store_dir, table), exist_ok=True)
+        self._write_manifest()
+        
+        self._buffers = {table: [] for table in FEATURE_TABLES}
+        self._lock = threading.Lock()
+    
+    def add(self, embedding_data=None, logmel_data=None):
+        """Buffer one embedding row and/or one log-mel row, writing full chunks"""
+        with self._lock:
+            for table, record in (("embeddings", embedding_data), ("logmel", logmel_data)):
+                if not record:
+                    continue
+                self._buffers[table].append(record)
+                if len(self._buffers[table]) >= self.chunk_rows:
+                    self._write_chunk(table)
+    
+    def flush(self):
+        """Write buffered rows as (possibly short) chunks"""
+        with self._lock:
+            for table in FEATURE_TABLES:
+                if self._buffers[table]:
+                    self._write_chunk(table)
+    
+    def close(self):
+        """Flush and return the number of stored rows per table"""
+        self.flush()
+        return {table: info["rows"] for table, info in self.manifest["tables"].items()}
+    
+    def _write_chunk(self, table):
+        records = self._buffers[table]
+        self._buffers[table] = []
+        vector_field = FEATURE_TABLES[table]
+        info = self.manifest["tables"][table]
+        
+        vectors = np.asarray([record[vector_field] for record in records], dtype=np.float32)
+        columns = {}
+        for record in records:
+            for field in record:
+                if field != vector_field and field not in columns:
+                    columns[field] = []
+        for field, values in columns.items():
+            values.extend(record.get(field) for record in records)
+        
+        name = f"chunk_{len(info['chunks']):05d}"
+        table_dir = os.path.join(self.store_dir, table)
+        if self.compress:
+            np.savez_compressed(os.path.join(table_dir, f"{name}.npz"), vectors=vectors)
+        else:
+            np.save(os.path.join(table_dir, f"{name}.npy"), vectors)
+        _write_json(os.path.join(table_dir, f"{name}.meta.json" + (".gz" if self.compress else "")), columns, self.compress)
+        
+        # The manifest is updated last, so readers never see a partial chunk
+        info["chunks"].append({"name": name, "rows": len(records), "compressed": self.compress})
+        info["rows"] += len(records)
+        info["dimension"] = vectors.shape[1]
+        self._write_manifest()
+    
+    def _write_manifest(self):
+        self.manifest["updated"] = datetime.now().isoformat()
+        _write_json(os.path.join(self.store_dir, MANIFEST_FILENAME), self.manifest)
+
+class FeatureReader:
+    """Reads a store written by FeatureWriter
+    
+    Uncompressed chunks are memory-mapped, so slicing and iterating only read
+    the rows they return. Metadata comes back as columns (field -> list).
+    """
+    
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.manifest = _read_json(os.path.join(store_dir, MANIFEST_FILENAME))
+    
+    def num_rows(self, table):
+        return self.manifest["tables"][table]["rows"]
+    
+    def dimension(self, table):
+        return self.manifest["tables"][table]["dimension"]
+    
+    def _chunk_vectors(self, table, chunk):
+        path = os.path.join(self.store_dir, table, chunk["name"])
+        if chunk["compressed"]:
+            with np.load(f"{path}.npz") as data:
+                return data["vectors"]
+        return np.load(f"{path}.npy", mmap_mode='r')
+    
+    def _chunk_metadata(self, table, chunk):
+        path = os.path.join(self.store_dir, table, f"{chunk['name']}.meta.json")
+        return _read_json(f"{path}.gz" if chunk["compressed"] else path)
+    
+    def iter_chunks(self, table):
+        """Yield (vectors, metadata columns) per stored chunk"""
+        for chunk in self.manifest["tables"][table]["chunks"]:
+            yield self._chunk_vectors(table, chunk), self._chunk_metadata(table, chunk)
+    
+    def iter_records(self, table):
+        """Yield one dict per row, shaped like the pipeline's feature rows (vector as a float32 array)"""
+        vector_field = FEATURE_TABLES[table]
+        for vectors, columns in self.iter_chunks(table):
+            for row, vector in enumerate(vectors):
+                record = {field: values[row] for field, values in columns.items()}
+                record[vector_field] = vector
+                yield record
+    
+    def slice(self, table, start=0, stop=None):
+        """(vectors, metadata columns) of rows [start, stop) as in-memory copies"""
+        total = self.num_rows(table)
+        start, stop, _ = slice(start, stop).indices(total)
+        
+        parts = []
+        columns = {}
+        chunk_start = 0
+        for chunk in self.manifest["tables"][table]["chunks"]:
+            chunk_stop = chunk_start + chunk["rows"]
+            if chunk_stop > start and chunk_start < stop:
+                low, high = max(start, chunk_start) - chunk_start, min(stop, chunk_stop) - chunk_start
+                parts.append(np.array(self._chunk_vectors(table, chunk)[low:high]))
+                for field, values in self._chunk_metadata(table, chunk).items():
+                    columns.setdefault(field, []).extend(values[low:high])
+            chunk_start = chunk_stop
+            if chunk_start >= stop:
+                break
+        
+        if not parts:
+            return np.zeros((0, self.dimension(table)), dtype=np.float32), columns
+        return np.concatenate(parts), columns
+    
+    def load(self, table):
+        """All rows of a table as (vectors, metadata columns)"""
+        return self.slice(table)
@@ -0,0 +1,351 @@
+"""
+Per-stage instrumentation: wall and CPU time, real-time factor, peak RSS and I/O bytes per file
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from config.config import Config
+from utils.utils import get_audio_name
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Stages in pipeline order; the breakdown table lists any other stage after these
+STAGES = ("decode", "pre_vad", "denoise", "plotting", "vad", "diarization", "embedding", "logmel", "store")
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, or None where it is unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+
+def io_bytes():
+    """(bytes read, bytes written) by this process so far, from /proc/self/io; (None, None) elsewhere"""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def _delta(after, before):
+    return None if after is None or before is None else after - before
+
+class FileMetrics:
+    """Stage measurements of one audio file
+    
+    Each stage holds wall seconds, CPU seconds (all threads of the process),
+    bytes read and written (all file and pipe I/O of the process, including
+    the model libraries') and the process's peak RSS when the stage ended.
+    A stage that runs several times for a file (once per speaker) is summed.
+    """
+    
+    def __init__(self, audio_path):
+        self.audio_path = audio_path
+        self.audio_name = get_audio_name(audio_path)
+        self.audio_seconds = None
+        self.success = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.stages = {}
+    
+    def add(self, stage, wall_seconds, cpu_seconds, read_bytes=None, written_bytes=None, peak_rss=None):
+        entry = self.stages.setdefault(stage, {
+            "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+            "read_bytes": None, "written_bytes": None, "peak_rss_bytes": None
+        })
+        entry["calls"] += 1
+        entry["wall_seconds"] += wall_seconds
+        entry["cpu_seconds"] += cpu_seconds
+        for field, value in (("read_bytes", read_bytes), ("written_bytes", written_bytes)):
+            if value is not None:
+                entry[field] = (entry[field] or 0) + value
+        if peak_rss is not None:
+            entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"] or 0, peak_rss)
+    
+    def merge(self, record):
+        """Add a to_record() of the same file measured in another thread or process"""
+        if self.audio_seconds is None:
+            self.audio_seconds = record["audio_seconds"]
+        self.wall_seconds += record["wall_seconds"]
+        self.cpu_seconds += record["cpu_seconds"]
+        for stage_name, entry in record["stages"].items():
+            self.add(stage_name, entry["wall_seconds"], entry["cpu_seconds"],
+                     entry["read_bytes"], entry["written_bytes"], entry["peak_rss_bytes"])
+            self.stages[stage_name]["calls"] += entry["calls"] - 1
+    
+    def to_record(self):
+        """JSON-serializable record with the real-time factor of every stage"""
+        stages = {}
+        for stage, entry in self.stages.items():
+            stages[stage] = dict(entry, rtf=self._rtf(entry["wall_seconds"]))
+        return {
+            "audio_path": self.audio_path,
+            "audio_name": self.audio_name,
+            "success": self.success,
+            "audio_seconds": self.audio_seconds,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "rtf": self._rtf(self.wall_seconds),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": stages,
+        }
+    
+    def _rtf(self, seconds):
+        """Seconds of compute per second of audio"""
+        return seconds / self.audio_seconds if self.audio_seconds else None
+
+# FileMetrics of the file the current thread is processing, set by RunMetrics.track
+_current = threading.local()
+
+def current_file_metrics():
+    return getattr(_current, "file", None)
+
+@contextmanager
+def measure_file(file_metrics):
+    """Make `file_metrics` this thread's tracked file for the block and add the block's wall and CPU time"""
+    previous = current_file_metrics()
+    _current.file = file_metrics
+    wall_before, cpu_before = time.perf_counter(), time.process_time()
+    try:
+        yield file_metrics
+    finally:
+        file_metrics.wall_seconds += time.perf_counter() - wall_before
+        file_metrics.cpu_seconds += time.process_time() - cpu_before
+        _current.file = previous
+
+def call_tracked(audio_path, stage_name, func, *args):
+    """Run func(*args) as tracked work on `audio_path`; returns (result, FileMetrics record)
+    
+    For work handed to executors and pool workers, whose stages are otherwise
+    not recorded: the record is merged into the file's FileMetrics by the
+    caller. With `stage_name` the whole call is also that stage. Picklable,
+    so it can run in a process pool.
+    """
+    file_metrics = FileMetrics(audio_path)
+    with measure_file(file_metrics):
+        with stage(stage_name) if stage_name else nullcontext():
+            result = func(*args)
+    return result, file_metrics.to_record()
+
+def record_audio_duration(seconds):
+    """Set the audio duration of the file being tracked in this thread (the RTF denominator)"""
+    file_metrics = current_file_metrics()
+    if file_metrics is not None:
+        file_metrics.audio_seconds = seconds
+
+@contextmanager
+def stage(name):
+    """Measure the enclosed block as stage `name` of the file tracked in this thread
+    
+    A stage nested in another (the VAD plot inside the VAD stage) is left out
+    of the outer stage's figures, so the stages of a file do not overlap.
+    Does nothing when no file is tracked, e.g. outside process_all_audios
+    (executors and pool workers track their file with call_tracked or
+    measure_file).
+    """
+    file_metrics = current_file_metrics()
+    if file_metrics is None:
+        yield
+        return
+    
+    # Wall, CPU, read and written totals of the stages nested in each open stage of this thread
+    nested_stack = _current.__dict__.setdefault("nested", [])
+    nested_stack.append([0.0, 0.0, 0, 0])
+    
+    read_before, written_before = io_bytes()
+    wall_before, cpu_before = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        read_after, written_after = io_bytes()
+        measured = (
+            time.perf_counter() - wall_before, time.process_time() - cpu_before,
+            _delta(read_after, read_before), _delta(written_after, written_before)
+        )
+        nested = nested_stack.pop()
+        if nested_stack:
+            for index, value in enumerate(measured):
+                nested_stack[-1][index] += value or 0
+        
+        wall, cpu, read, written = (
+            None if value is None else value - inner for value, inner in zip(measured, nested)
+        )
+        file_metrics.add(name, wall, cpu, read, written, peak_rss_bytes())
+
+@contextmanager
+def shared_stage(name, shares):
+    """Measure the enclosed block as stage `name` of several files at once
+    
+    For work batched across files (VAD and embedding batches in two-phase
+    mode), run outside any file's measure_file. `shares` is a list of
+    (FileMetrics, weight) pairs, e.g. each file's samples in the batch; every
+    file gets its weighted part of the wall, CPU and I/O figures, added to
+    the stage and to the file's totals.
+    """
+    read_before, written_before = io_bytes()
+    wall_before, cpu_before = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        read_after, written_after = io_bytes()
+        measured = (
+            time.perf_counter() - wall_before, time.process_time() - cpu_before,
+            _delta(read_after, read_before), _delta(written_after, written_before)
+        )
+        total_weight = sum(weight for _, weight in shares)
+        for file_metrics, weight in shares:
+            fraction = weight / total_weight if total_weight else 1 / len(shares)
+            wall, cpu = measured[0] * fraction, measured[1] * fraction
+            read, written = (None if value is None else int(value * fraction) for value in measured[2:])
+            file_metrics.add(name, wall, cpu, read, written, peak_rss_bytes())
+            file_metrics.wall_seconds += wall
+            file_metrics.cpu_seconds += cpu
+
+class RunMetrics:
+    """Collects the FileMetrics of one process_all_audios run
+    
+    Every finished file is appended as one JSON line to `jsonl_path` and the
+    run totals are rewritten to `prometheus_path` in the Prometheus text
+    format (for node_exporter's textfile collector). print_summary prints the
+    per-stage breakdown at the end of the run. Safe to use from several threads.
+    """
+    
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.run_id = datetime.now().isoformat(timespec="seconds")
+        self.started = time.perf_counter()
+        
+        self.files = {"success": 0, "failed": 0}
+        self.audio_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.stages = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def for_output_folder(cls, output_folder):
+        """Metrics files in the output folder, or None when Config.METRICS_ENABLED is off"""
+        if not Config.METRICS_ENABLED:
+            return None
+        return cls(
+            os.path.join(output_folder, Config.METRICS_JSONL_FILENAME),
+            os.path.join(output_folder, Config.METRICS_PROMETHEUS_FILENAME)
+        )
+    
+    @contextmanager
+    def track(self, audio_path):
+        """Track the stages this thread runs for one file; set `.success` on the yielded FileMetrics"""
+        file_metrics = FileMetrics(audio_path)
+        try:
+            with measure_file(file_metrics):
+                yield file_metrics
+        finally:
+            self.add(file_metrics)
+    
+    def add(self, file_metrics):
+        """Add one finished file to the totals and the metrics files"""
+        record = file_metrics.to_record()
+        with self._lock:
+            self.files["success" if file_metrics.success else "failed"] += 1
+            self.audio_seconds += file_metrics.audio_seconds or 0.0
+            self.wall_seconds += file_metrics.wall_seconds
+            for stage_name, entry in file_metrics.stages.items():
+                totals = self.stages.setdefault(stage_name, {
+                    "files": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "audio_seconds": 0.0,
+                    "read_bytes": 0, "written_bytes": 0, "peak_rss_bytes": 0
+                })
+                totals["files"] += 1
+                totals["wall_seconds"] += entry["wall_seconds"]
+                totals["cpu_seconds"] += entry["cpu_seconds"]
+                totals["audio_seconds"] += file_metrics.audio_seconds or 0.0
+                totals["read_bytes"] += entry["read_bytes"] or 0
+                totals["written_bytes"] += entry["written_bytes"] or 0
+                totals["peak_rss_bytes"] = max(totals["peak_rss_bytes"], entry["peak_rss_bytes"] or 0)
+            
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(dict(record, run_id=self.run_id)) + "\n")
+            if self.prometheus_path:
+                self._write_prometheus()
+    
+    def stage_totals(self):
+        """Stage name -> totals over the run's files, in pipeline order"""
+        with self._lock:
+            order = [name for name in STAGES if name in self.stages]
+            order += sorted(name for name in self.stages if name not in STAGES)
+            return {name: dict(self.stages[name]) for name in order}
+    
+    def prometheus_text(self):
+        """Run totals in the Prometheus text exposition format"""
+        lines = []
+        
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP audio_pipeline_{name} {help_text}")
+            lines.append(f"# TYPE audio_pipeline_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"audio_pipeline_{name}{{{label_text}}} {value}" if label_text
+                             else f"audio_pipeline_{name} {value}")
+        
+        stages = self.stages.items()
+        metric("files_total", "counter", "Files processed, by outcome",
+               [({"status": status}, count) for status, count in self.files.items()])
+        metric("audio_seconds_total", "counter", "Seconds of audio processed", [({}, self.audio_seconds)])
+        metric("stage_wall_seconds_total", "counter", "Wall-clock seconds spent in each stage",
+               [({"stage": name}, totals["wall_seconds"]) for name, totals in stages])
+        metric("stage_cpu_seconds_total", "counter", "Process CPU seconds spent in each stage",
+               [({"stage": name}, totals["cpu_seconds"]) for name, totals in stages])
+        metric("stage_read_bytes_total", "counter", "Bytes read during each stage",
+               [({"stage": name}, totals["read_bytes"]) for name, totals in stages])
+        metric("stage_written_bytes_total", "counter", "Bytes written during each stage",
+               [({"stage": name}, totals["written_bytes"]) for name, totals in stages])
+        metric("stage_peak_rss_bytes", "gauge", "Process peak RSS at the end of each stage",
+               [({"stage": name}, totals["peak_rss_bytes"]) for name, totals in stages])
+        return "\n".join(lines) + "\n"
+    
+    def _write_prometheus(self):
+        tmp_path = f"{self.prometheus_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, self.prometheus_path)
+    
+    def print_summary(self, successful, failed, output_folder, store_description):
+        """Print the processing summary and the per-stage breakdown of the run"""
+        print(f"\n📊 Processing Summary:")
+        print(f"✅ Successfully processed: {successful} files")
+        print(f"❌ Failed to process: {failed} files")
+        print(f"📁 Output folder: {output_folder}")
+        print(f"🗄️ Vector store: {store_description}")
+        
+        stages = self.stage_totals()
+        if not stages:
+            return
+        
+        elapsed = time.perf_counter() - self.started
+        print(f"\n⏱️ Stage breakdown ({elapsed:.1f}s elapsed, {self.audio_seconds:.1f}s of audio):")
+        print(f"   {'stage':<14}{'files':>7}{'wall s':>10}{'share':>8}{'cpu s':>10}{'RTF':>8}"
+              f"{'read MB':>10}{'write MB':>10}{'peak RSS MB':>13}")
+        for name, totals in stages.items():
+            share = totals["wall_seconds"] / self.wall_seconds if self.wall_seconds else 0.0
+            rtf = totals["wall_seconds"] / totals["audio_seconds"] if totals["audio_seconds"] else None
+            print(f"   {name:<14}{totals['files']:>7}{totals['wall_seconds']:>10.2f}{share:>8.0%}"
+                  f"{totals['cpu_seconds']:>10.2f}{'-' if rtf is None else f'{rtf:.3f}':>8}"
+                  f"{totals['read_bytes'] / 1e6:>10.1f}{totals['written_bytes'] / 1e6:>10.1f}"
+                  f"{totals['peak_rss_bytes'] / 1e6:>13.0f}")
+        if self.jsonl_path:
+            print(f"   📄 Per-file metrics: {self.jsonl_path}")
+
+def track_file(run_metrics, audio_path):
+    """run_metrics.track(audio_path), or a context yielding an untracked FileMetrics without run metrics"""
+    if run_metrics is None:
+        return nullcontext(FileMetrics(audio_path))
+    return run_metrics.track(audio_path)
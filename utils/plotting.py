@@ -0,0 +1,179 @@
+"""
+Waveform plotting from min/max envelopes, rendered off the processing path
+"""
+
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config.config import Config
+
+PLOT_MODES = ("sync", "background", "lazy", "off")
+ENVELOPE_SUFFIX = ".envelope.npz"
+
+def compute_envelope(y, sr, num_points=None):
+    """Reduce a waveform to per-column minimum and maximum values
+    
+    The signal is cut into `num_points` (default Config.PLOT_ENVELOPE_POINTS)
+    equal columns, which is all a plot of screen width can show. Returns
+    (times, mins, maxs) with the column start times in seconds.
+    """
+    if num_points is None:
+        num_points = Config.PLOT_ENVELOPE_POINTS
+    
+    y = np.asarray(y, dtype=np.float32).reshape(-1)
+    if len(y) == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return empty, empty, empty
+    
+    samples_per_point = max(1, int(np.ceil(len(y) / num_points)))
+    num_columns = int(np.ceil(len(y) / samples_per_point))
+    padded = np.pad(y, (0, num_columns * samples_per_point - len(y)), mode="edge")
+    columns = padded.reshape(num_columns, samples_per_point)
+    
+    times = np.arange(num_columns, dtype=np.float32) * (samples_per_point / sr)
+    return times, columns.min(axis=1), columns.max(axis=1)
+
+def render_envelope(times, mins, maxs, title, output_path):
+    """Render an envelope to PNG
+    
+    Uses a standalone Figure rather than pyplot, so it holds no global state
+    and can run in a background thread.
+    """
+    from matplotlib.figure import Figure
+    
+    fig = Figure(figsize=Config.PLOT_FIGSIZE)
+    ax = fig.add_subplot()
+    ax.fill_between(times, mins, maxs, step="post", alpha=0.8, linewidth=0.5)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Amplitude')
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    
+    # Save plot
+    fig.savefig(output_path, dpi=Config.PLOT_DPI, bbox_inches='tight')
+    return output_path
+
+def save_envelope(times, mins, maxs, title, output_path):
+    """Store an envelope next to its plot path for on-demand rendering"""
+    envelope_path = os.path.splitext(output_path)[0] + ENVELOPE_SUFFIX
+    np.savez(envelope_path, times=times, mins=mins, maxs=maxs, title=title)
+    return envelope_path
+
+def render_envelope_file(envelope_path, output_path=None):
+    """Render a stored envelope to PNG (next to the envelope by default)"""
+    if output_path is None:
+        output_path = envelope_path[:-len(ENVELOPE_SUFFIX)] + ".png"
+    
+    with np.load(envelope_path, allow_pickle=False) as data:
+        return render_envelope(data["times"], data["mins"], data["maxs"], str(data["title"]), output_path)
+
+def render_pending_plots(folder):
+    """Render every stored envelope under `folder` that has no PNG yet"""
+    rendered = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if not name.endswith(ENVELOPE_SUFFIX):
+                continue
+            envelope_path = os.path.join(root, name)
+            output_path = envelope_path[:-len(ENVELOPE_SUFFIX)] + ".png"
+            if not os.path.exists(output_path):
+                rendered.append(render_envelope_file(envelope_path, output_path))
+    
+    print(f"✅ Rendered {len(rendered)} waveform plots")
+    return rendered
+
+class WaveformPlotter:
+    """Turns waveforms into plots according to a plot mode
+    
+    The envelope is always computed on the calling thread (it is a cheap
+    reduction and lets the caller release the samples). What happens next
+    depends on the mode: "sync" renders immediately, "background" renders in
+    a thread pool so model stages are not blocked, "lazy" only stores the
+    envelope for render_pending_plots, and "off" skips plotting entirely.
+    """
+    
+    def __init__(self, mode=None, workers=None):
+        self.mode = mode or Config.PLOT_MODE
+        if self.mode not in PLOT_MODES:
+            raise ValueError(f"Unknown plot mode: {self.mode}")
+        
+        self._executor = None
+        self._futures = []
+        self._lock = threading.Lock()
+        
+        if self.mode == "background":
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers or Config.PLOT_WORKERS, thread_name_prefix="waveform-plot"
+            )
+            atexit.register(self.close)
+    
+    def plot(self, y, sr, title, output_path, duration_limit=None):
+        """Plot the first `duration_limit` seconds of a waveform to `output_path`"""
+        if self.mode == "off":
+            return None
+        if duration_limit is None:
+            duration_limit = Config.PLOT_DURATION_LIMIT
+        
+        # Limit duration for better visualization
+        if len(y) > duration_limit * sr:
+            y = y[:int(duration_limit * sr)]
+            title += f" (First {duration_limit}s)"
+        
+        times, mins, maxs = compute_envelope(y, sr)
+        
+        if self.mode == "lazy":
+            return save_envelope(times, mins, maxs, title, output_path)
+        if self.mode == "sync":
+            return render_envelope(times, mins, maxs, title, output_path)
+        
+        future = self._executor.submit(render_envelope, times, mins, maxs, title, output_path)
+        with self._lock:
+            # Keep failed plots around so wait() can report them
+            self._futures = [
+                pending for pending in self._futures
+                if not pending.done() or pending.exception() is not None
+            ]
+            self._futures.append(future)
+        return output_path
+    
+    def wait(self):
+        """Block until all submitted plots are written; returns the number that failed"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠️ Warning: Could not render waveform plot: {str(e)}")
+                failed += 1
+        return failed
+    
+    def close(self):
+        """Finish pending plots and stop the background threads"""
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            atexit.unregister(self.close)
+
+# Per-process plotter, created on first use
+_plotter = None
+_plotter_lock = threading.Lock()
+
+def get_plotter():
+    """Return this process's shared WaveformPlotter, created on first use"""
+    global _plotter
+    with _plotter_lock:
+        if _plotter is None:
+            _plotter = WaveformPlotter()
+        return _plotter
+
+def wait_for_plots():
+    """Block until this process's pending background plots are written"""
+    if _plotter is not None:
+        _plotter.wait()
@@ -0,0 +1,129 @@
+"""
+Content-addressed cache of pipeline stage outputs for resumable processing
+"""
+
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from config.config import Config
+from utils.utils import compute_file_hash
+
+class StageCache:
+    """Size-capped, LRU-evicted store of per-stage outputs keyed by content
+    
+    Keys chain: a stage key hashes its parent key (the file content hash for
+    the first stage), the stage name and the Config parameters listed for it
+    in Config.STAGE_CACHE_PARAMS. Changing one parameter therefore invalidates
+    only the stage that uses it and the stages after it. Each entry is one
+    .npz file of arrays and strings; entries are written atomically so worker
+    processes can share a cache directory.
+    """
+    
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes or Config.STAGE_CACHE_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._file_keys = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        # Running size estimate; the directory is only rescanned when it exceeds the cap
+        self._total_bytes = self.size()
+    
+    def file_key(self, audio_path):
+        """Content hash of an audio file, memoized on (size, mtime)"""
+        stat = os.stat(audio_path)
+        signature = (audio_path, stat.st_size, stat.st_mtime_ns)
+        if signature not in self._file_keys:
+            self._file_keys[signature] = compute_file_hash(audio_path)
+        return self._file_keys[signature]
+    
+    @staticmethod
+    def stage_key(parent_key, stage):
+        """Key for `stage` given its parent key and its Config parameters"""
+        params = {name: getattr(Config, name) for name in Config.STAGE_CACHE_PARAMS.get(stage, [])}
+        payload = json.dumps([parent_key, stage, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+    
+    def contains(self, key):
+        """Whether an entry exists for `key`, without counting a hit or miss"""
+        return os.path.exists(self._entry_path(key))
+    
+    def get(self, key):
+        """Return the stored outputs for `key` as a dictionary, or None"""
+        path = self._entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                outputs = {name: data[name] for name in data.files}
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return outputs
+    
+    def put(self, key, outputs):
+        """Store a dictionary of numpy arrays / strings under `key`"""
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **{name: np.asarray(value) for name, value in outputs.items()})
+        os.replace(tmp_path, path)
+        
+        with self._lock:
+            self._total_bytes += os.path.getsize(path)
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+    
+    def size(self):
+        """Total size of the cache entries in bytes"""
+        return sum(size for _, size, _ in self._entries())
+    
+    def _entries(self):
+        """(path, size, last_used) for every cache entry"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.npz'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+    
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes"""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            self._total_bytes = total
+            if total <= self.max_bytes:
+                return 0
+            
+            removed = 0
+            for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            
+            self._total_bytes = total
+            return removed
@@ -3,39 +3,51 @@ Utility functions for the Arabic-Audio-Preprocessing-and-Feature-Extraction
 """
 
 import os
-import glob
-import librosa
-import matplotlib.pyplot as plt
-import librosa.display
+import hashlib
+import json
 import warnings
 from config.config import Config
+from utils.discovery import probe_audio_header, scan_audio_files
+from utils.plotting import get_plotter
 
 warnings.filterwarnings('ignore')
-plt.switch_backend('Agg')  # Use non-interactive backend for plots
 
-def find_audio_files(input_folder):
-    """Find all audio files in the folder structure"""
-    audio_files = []
+def find_audio_files(input_folder, manifest_path=None, min_duration=None, max_duration=None,
+                     longest_first=None):
+    """Find all audio files in the folder structure
     
-    for ext in Config.AUDIO_EXTENSIONS:
-        pattern = os.path.join(input_folder, '**', ext)
-        found_files = glob.glob(pattern, recursive=True)
-        audio_files.extend(found_files)
+    Files are checked by reading their headers only (in parallel); with a
+    manifest_path, files unchanged since the last scan are not opened at all.
+    Durations from the headers allow filtering and longest-first ordering
+    (defaults from Config.MIN/MAX_AUDIO_DURATION and Config.PROCESS_LONGEST_FIRST).
+    """
+    if min_duration is None:
+        min_duration = Config.MIN_AUDIO_DURATION
+    if max_duration is None:
+        max_duration = Config.MAX_AUDIO_DURATION
+    if longest_first is None:
+        longest_first = Config.PROCESS_LONGEST_FIRST
     
     # Filter out empty or corrupted files
-    valid_audio_files = []
-    for audio_file in audio_files:
-        try:
-            # Quick check if file can be loaded
-            y, sr = librosa.load(audio_file, sr=None, duration=0.1)
-            if len(y) > 0:
-                valid_audio_files.append(audio_file)
-            else:
-                print(f"⚠️ Skipping empty audio file: {os.path.basename(audio_file)}")
-        except Exception as e:
-            print(f"⚠️ Skipping corrupted audio file: {os.path.basename(audio_file)} - {str(e)}")
+    valid_entries = []
+    for entry in scan_audio_files(input_folder, manifest_path):
+        audio_name = os.path.basename(entry["path"])
+        if "error" in entry:
+            print(f"⚠️ Skipping corrupted audio file: {audio_name} - {entry['error']}")
+        elif entry["duration"] <= 0:
+            print(f"⚠️ Skipping empty audio file: {audio_name}")
+        elif entry["duration"] < min_duration or (max_duration and entry["duration"] > max_duration):
+            continue
+        else:
+            valid_entries.append(entry)
     
-    return valid_audio_files
+    if longest_first:
+        # Long files first keeps worker processes busy until the end of the run
+        valid_entries.sort(key=lambda entry: entry["duration"], reverse=True)
+    else:
+        valid_entries.sort(key=lambda entry: entry["path"])
+    
+    return [entry["path"] for entry in valid_entries]
 
 def create_output_structure(audio_path, input_folder, output_folder):
     """Create output folder structure matching input structure"""
@@ -54,38 +66,22 @@ def create_output_structure(audio_path, input_folder, output_folder):
     return output_folder_path
 
 def save_waveform_plot(y, sr, title, output_path, duration_limit=None):
-    """Save waveform plot as PNG"""
-    if duration_limit is None:
-        duration_limit = Config.PLOT_DURATION_LIMIT
-        
-    plt.figure(figsize=Config.PLOT_FIGSIZE)
-    
-    # Limit duration for better visualization
-    if len(y) > duration_limit * sr:
-        y_plot = y[:int(duration_limit * sr)]
-        title += f" (First {duration_limit}s)"
-    else:
-        y_plot = y
-    
-    librosa.display.waveshow(y_plot, sr=sr, alpha=0.8)
-    plt.title(title, fontsize=14, fontweight='bold')
-    plt.xlabel('Time (s)')
-    plt.ylabel('Amplitude')
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
+    """Save waveform plot as PNG
     
-    # Save plot
-    plt.savefig(output_path, dpi=Config.PLOT_DPI, bbox_inches='tight')
-    plt.close()  # Important to free memory
+    Plots are drawn from a min/max envelope by the process's WaveformPlotter;
+    depending on Config.PLOT_MODE the PNG is written in the background, only
+    its envelope is stored for later rendering, or nothing is written.
+    """
+    return get_plotter().plot(y, sr, title, output_path, duration_limit)
 
 def validate_audio_file(audio_path):
-    """Validate if audio file exists and can be loaded"""
+    """Validate if audio file exists and has a readable, non-empty header"""
     if not os.path.exists(audio_path):
         return False, f"Audio file not found: {audio_path}"
     
     try:
-        y_test, sr_test = librosa.load(audio_path, sr=None, duration=0.1)
-        if len(y_test) == 0:
+        header = probe_audio_header(audio_path)
+        if header["duration"] <= 0:
             return False, f"Empty audio file: {audio_path}"
         return True, "Valid audio file"
     except Exception as e:
@@ -95,13 +91,34 @@ def get_audio_name(audio_path):
     """Get audio name without extension"""
     return os.path.splitext(os.path.basename(audio_path))[0]
 
-def print_processing_summary(successful, failed, output_folder, milvus_host, milvus_port):
-    """Print processing summary"""
-    print(f"\n📊 Processing Summary:")
-    print(f"✅ Successfully processed: {successful} files")
-    print(f"❌ Failed to process: {failed} files")
-    print(f"📁 Output folder: {output_folder}")
-    print(f"🗄️ Milvus host: {milvus_host}:{milvus_port}")
+def compute_file_hash(audio_path, block_size=1 << 20):
+    """SHA-256 of the raw file bytes, read in blocks"""
+    digest = hashlib.sha256()
+    with open(audio_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_config_fingerprint(param_names=None):
+    """Short hash of the Config parameters that influence stored features"""
+    if param_names is None:
+        param_names = Config.PIPELINE_FINGERPRINT_PARAMS
+    values = {name: getattr(Config, name) for name in param_names}
+    encoded = json.dumps(values, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def get_source_hash(audio_path):
+    """Hash identifying an audio file's content under the current pipeline config"""
+    key = f"{compute_file_hash(audio_path)}:{get_config_fingerprint()}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def get_source_path(audio_path, input_folder):
+    """Path of an audio file relative to the input folder, with "/" separators"""
+    return os.path.relpath(audio_path, input_folder).replace(os.sep, "/")
+
+def make_record_id(source_hash, speaker_id):
+    """Deterministic Milvus primary key for one speaker of one source"""
+    return hashlib.sha256(f"{source_hash}:{speaker_id}".encode('utf-8')).hexdigest()
 
 def print_collection_stats(embedding_count, logmel_count):
     """Print Milvus collection statistics"""